@@ -12,6 +12,7 @@ import string
 import html
 import secrets
 import logging
+import multiprocessing
 from io import StringIO
 from datetime import datetime, timedelta
 from logging.handlers import RotatingFileHandler
@@ -23,7 +24,7 @@ from flask import Flask, render_template, request, jsonify, redirect, url_for, s
 from flask_mail import Mail, Message
 from flask_migrate import Migrate
 from flask_login import login_user, logout_user, current_user, login_required
-from flask_wtf.csrf import CSRFProtect
+from flask_wtf.csrf import CSRFProtect, generate_csrf
 from sqlalchemy.exc import IntegrityError
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
@@ -43,7 +44,35 @@ from models import (
     LaborOperation, CleaningCost, StyleFabric, StyleNotion,
     StyleLabor, Color, StyleColor, Variable, StyleVariable,
     SizeRange, GlobalSetting, StyleImage, VerificationCode, AuditLog,
-    Client, StyleClient
+    Client, StyleClient, ExportJob, load_catalog_costs,
+    refresh_style_costs, ensure_style_costs, with_style_costs
+)
+from costing import COST_SETTING_KEYS
+from repricing import reprice, reprice_flat_setting, styles_using, FLAT_SETTING_COLUMNS
+from master_data import get_master_data
+from invalidation import init_invalidation_bus
+from data_versions import conditional_get
+from size_ranges import get_size_ladder, discard_size_ladder
+from sap_export import SAP_HEADER_CHUNK, csv_chunk
+from sku_prices import rebuild_sku_prices, ensure_sku_prices, iter_sku_export_batches, lookup_sku_prices
+from export_jobs import (
+    EXPORT_JOB_HEARTBEAT_SECONDS, submit_export_job, cleanup_export_jobs, heartbeat_export_jobs
+)
+from export_cache import export_cache_key, cached_export_path, cache_export_stream, store_export, cache_export_file
+from export_parquet import PARQUET_MIMETYPE, ParquetUnavailable, parquet_available, write_sku_parquet
+from catalog_export import XLSX_MIMETYPE, catalog_style_ids, write_catalog_xlsx
+from style_listing import LISTING_DEFAULT_PER_PAGE, listing_filters, list_styles
+from pagination import InvalidCursor, keyset_page, estimate_count
+from dashboard_rollups import (
+    DASHBOARD_REFRESH_MINUTES, DASHBOARD_NUDGE_SECONDS,
+    get_dashboard_rollup, refresh_dashboard_rollup_if_stale
+)
+from parallel_export import PARALLEL_MIN_STYLES, iter_parallel_sap_csv, parallel_export_supported
+from export_compression import (
+    COMPRESSIONS, CompressionUnavailable, choose_compression, compress_stream, iter_file
+)
+from sap_delta import (
+    DEFAULT_WATERMARK, valid_watermark_name, get_watermark, pending_delta, advance_watermark, prune_change_log
 )
 
 # ===== HELPER FUNCTIONS =====
@@ -540,8 +569,60 @@ def cleanup_expired_verification_codes():
             db.session.rollback()
 
 
+def cleanup_expired_export_jobs():
+    """Delete expired export files and fail export jobs orphaned by a restart"""
+    with app.app_context():
+        try:
+            expired, orphaned = cleanup_export_jobs()
+            if expired or orphaned:
+                app.logger.info(f"✅ Export job cleanup: Deleted {expired} expired, failed {orphaned} orphaned")
+                print(f"✅ Export job cleanup: Deleted {expired} expired, failed {orphaned} orphaned")
+        except Exception as e:
+            app.logger.error(f"❌ Error during export job cleanup: {str(e)}")
+            db.session.rollback()
+
+
+def heartbeat_running_export_jobs():
+    """Keep this process's queued/running export jobs from being swept as orphans"""
+    with app.app_context():
+        try:
+            heartbeat_export_jobs()
+        except Exception as e:
+            app.logger.error(f"❌ Error during export job heartbeat: {str(e)}")
+            db.session.rollback()
+
+
+def refresh_dashboard_snapshot(periodic=False):
+    """Rebuild the dashboard snapshot - on schedule, or when a write nudged it"""
+    with app.app_context():
+        try:
+            if periodic:
+                # A little under the interval, so timer jitter never skips a round
+                max_age = timedelta(minutes=DASHBOARD_REFRESH_MINUTES) - timedelta(seconds=DASHBOARD_NUDGE_SECONDS)
+                refresh_dashboard_rollup_if_stale(max_age=max_age)
+            else:
+                refresh_dashboard_rollup_if_stale()
+        except Exception as e:
+            app.logger.error(f"❌ Error refreshing dashboard snapshot: {str(e)}")
+            db.session.rollback()
+
+
+def cleanup_style_change_log():
+    """Delete change log rows every delta export watermark has moved past"""
+    with app.app_context():
+        try:
+            deleted = prune_change_log()
+            db.session.commit()
+            if deleted:
+                app.logger.info(f"✅ Change log cleanup: Deleted {deleted} exported entries")
+                print(f"✅ Change log cleanup: Deleted {deleted} exported entries")
+        except Exception as e:
+            app.logger.error(f"❌ Error during change log cleanup: {str(e)}")
+            db.session.rollback()
+
+
 def init_cleanup_scheduler():
-    """Initialize background scheduler for database cleanup tasks"""
+    """Initialize background scheduler for database cleanup tasks - returns it for other periodic jobs"""
     scheduler = BackgroundScheduler()
     
     # Clean audit logs daily at 2 AM
@@ -566,18 +647,70 @@ def init_cleanup_scheduler():
         replace_existing=True
     )
     
+    # Clean expired export job files every hour
+    scheduler.add_job(
+        func=cleanup_expired_export_jobs,
+        trigger="interval",
+        hours=1,
+        id='cleanup_export_jobs',
+        name='Delete expired export job files',
+        replace_existing=True
+    )
+    scheduler.add_job(
+        func=heartbeat_running_export_jobs,
+        trigger="interval",
+        seconds=EXPORT_JOB_HEARTBEAT_SECONDS,
+        id='heartbeat_export_jobs',
+        name='Heartbeat this process\'s export jobs',
+        replace_existing=True
+    )
+    
+    # Prune exported change log entries daily
+    scheduler.add_job(
+        func=cleanup_style_change_log,
+        trigger="cron",
+        hour=3,
+        minute=0,
+        id='cleanup_style_change_log',
+        name='Delete exported style change log entries',
+        replace_existing=True
+    )
+    
+    # Dashboard snapshot: full rebuild on a timer, plus coalesced rebuilds after writes
+    scheduler.add_job(
+        func=refresh_dashboard_snapshot,
+        kwargs={'periodic': True},
+        trigger="interval",
+        minutes=DASHBOARD_REFRESH_MINUTES,
+        id='refresh_dashboard_snapshot',
+        name='Rebuild dashboard snapshot',
+        replace_existing=True
+    )
+    scheduler.add_job(
+        func=refresh_dashboard_snapshot,
+        trigger="interval",
+        seconds=DASHBOARD_NUDGE_SECONDS,
+        id='refresh_dashboard_snapshot_nudged',
+        name='Rebuild dashboard snapshot after writes',
+        replace_existing=True
+    )
+    
     scheduler.start()
     atexit.register(lambda: scheduler.shutdown(wait=False))
     
     print(f"\n🕐 Database cleanup scheduler started:")
     print(f"  ✅ Audit logs: Daily at 2 PM (keeps {AUDIT_LOG_RETENTION_DAYS} days)")
     print(f"  ✅ Verification codes: Every 6 hours (removes expired)")
+    print(f"  ✅ Export jobs: Every hour (removes expired files), heartbeat every {EXPORT_JOB_HEARTBEAT_SECONDS}s")
+    print(f"  ✅ Style change log: Daily at 3 AM (removes exported entries)")
+    print(f"  ✅ Dashboard snapshot: Every {DASHBOARD_REFRESH_MINUTES} min, within {DASHBOARD_NUDGE_SECONDS}s of a change")
+    return scheduler
 
 @app.route('/audit-logs')
 @login_required
 @admin_required
 def audit_logs():
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor', '')
     per_page = 50
     
     # Get filter parameters
@@ -611,9 +744,20 @@ def audit_logs():
         except ValueError:
             pass
     
-    logs = query.order_by(AuditLog.timestamp.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    # Newest first, keyset-paged on (timestamp, id) - no OFFSET scan, no COUNT(*)
+    try:
+        logs = keyset_page(
+            query,
+            [(AuditLog.timestamp, True, False), (AuditLog.id, True, False)],
+            key=lambda log: (log.timestamp, log.id),
+            scope='audit_logs',
+            cursor=cursor,
+            limit=per_page
+        )
+    except InvalidCursor:
+        return redirect(url_for('audit_logs', item_type=item_type, action=action, search=search,
+                                date_from=date_from, date_to=date_to))
+    logs['total'], logs['total_exact'] = estimate_count(query)
     
     return render_template('audit_logs.html', 
                           logs=logs, 
@@ -1141,84 +1285,26 @@ def check_password_change_required():
 @app.route('/')
 @login_required
 def index():
-    """Dashboard with real-time stats - OPTIMIZED VERSION"""
-    
-    # Get real counts (these are fast single queries)
-    total_styles = Style.query.count()
-    total_fabrics = Fabric.query.count()
-    total_notions = Notion.query.count()
-    total_fabric_vendors = FabricVendor.query.count()
-    total_notion_vendors = NotionVendor.query.count()
-    
-    # New styles this week
-    one_week_ago = datetime.now() - timedelta(days=7)
-    new_this_week = Style.query.filter(Style.created_at >= one_week_ago).count()
-    
-    # Recent styles (only 4) - still use eager loading, it's fine for small numbers
-    recent_styles = Style.query.order_by(Style.updated_at.desc()).limit(4).all()
-
-    # ========================================
-    # OPTIMIZED: Sample-based analytics
-    # ========================================
-    from sqlalchemy.sql.expression import func as sql_func
-    
-    # Get 100 random styles for analytics (or all if less than 100)
-    sample_size = min(100, total_styles) if total_styles > 0 else 0
-    
-    if sample_size > 0:
-        sampled_styles = Style.query.options(
-            joinedload(Style.style_fabrics).joinedload(StyleFabric.fabric),
-            joinedload(Style.style_notions).joinedload(StyleNotion.notion),
-            joinedload(Style.style_labor).joinedload(StyleLabor.labor_operation)
-        ).order_by(sql_func.random()).limit(sample_size).all()
-        
-        # Cache label cost
-        label_setting = GlobalSetting.query.filter_by(setting_key='avg_label_cost').first()
-        label_cost = label_setting.setting_value if label_setting else 0.20
-        
-        # Calculate stats from sample
-        costs = [
-            s.get_total_fabric_cost() + 
-            s.get_total_notion_cost() + 
-            s.get_total_labor_cost() + 
-            label_cost 
-            for s in sampled_styles
-        ]
-        
-        avg_cost = sum(costs) / len(costs) if costs else 0
-        min_cost = min(costs) if costs else 0
-        max_cost = max(costs) if costs else 0
-        price_range = f"${min_cost:.0f}-${max_cost:.0f}"
-    else:
-        avg_cost = 0
-        price_range = "$0-$0"
-
-    # Top fabric (this query is already optimized)
-    from sqlalchemy import func
-    top_fabric_query = db.session.query(
-        Fabric.name, 
-        func.count(StyleFabric.fabric_id).label('count')
-    ).join(
-        StyleFabric, Fabric.id == StyleFabric.fabric_id
-    ).group_by(
-        Fabric.name
-    ).order_by(
-        func.count(StyleFabric.fabric_id).desc()
-    ).first()
+    """Dashboard - every number comes from the dashboard_rollups snapshot"""
+    
+    rollup = get_dashboard_rollup()
     
-    top_fabric = top_fabric_query[0] if top_fabric_query else "N/A"
+    recent_styles = [
+        dict(style, updated_at=datetime.fromisoformat(style['updated_at']) if style['updated_at'] else None)
+        for style in rollup['recent_styles']
+    ]
     
     return render_template('dashboard.html',
-                         total_styles=total_styles,
-                         total_fabrics=total_fabrics,
-                         total_notions=total_notions,
-                         total_fabric_vendors=total_fabric_vendors,
-                         total_notion_vendors=total_notion_vendors,
+                         total_styles=rollup['total_styles'],
+                         total_fabrics=rollup['total_fabrics'],
+                         total_notions=rollup['total_notions'],
+                         total_fabric_vendors=rollup['total_fabric_vendors'],
+                         total_notion_vendors=rollup['total_notion_vendors'],
                          recent_styles=recent_styles,
-                         avg_cost=avg_cost,
-                         price_range=price_range,
-                         top_fabric=top_fabric,
-                         new_this_week=new_this_week) 
+                         avg_cost=rollup['avg_cost'],
+                         price_range=rollup['price_range'],
+                         top_fabric=rollup['top_fabric'],
+                         new_this_week=rollup['new_this_week']) 
 
 # ============================================
 # DASHBOARD CHARTS API ENDPOINT
@@ -1228,177 +1314,9 @@ def index():
 @app.route('/api/dashboard-charts')
 @login_required
 def api_dashboard_charts():
-    """API endpoint for dashboard chart data"""
+    """API endpoint for dashboard chart data (from the dashboard_rollups snapshot)"""
     try:
-        from sqlalchemy import func
-        from datetime import datetime, timedelta
-        
-        # Get label cost setting
-        label_setting = GlobalSetting.query.filter_by(setting_key='avg_label_cost').first()
-        label_cost = label_setting.setting_value if label_setting else 0.20
-        
-        # ========================================
-        # 1. COST DISTRIBUTION (styles per price range)
-        # ========================================
-        styles = Style.query.options(
-            joinedload(Style.style_fabrics).joinedload(StyleFabric.fabric),
-            joinedload(Style.style_notions).joinedload(StyleNotion.notion),
-            joinedload(Style.style_labor).joinedload(StyleLabor.labor_operation)
-        ).all()
-        
-        # Calculate costs and bucket them
-        cost_buckets = {
-            '$0-20': 0,
-            '$20-40': 0,
-            '$40-60': 0,
-            '$60-80': 0,
-            '$80-100': 0,
-            '$100+': 0
-        }
-        
-        total_fabric_cost = 0
-        total_labor_cost = 0
-        total_notion_cost = 0
-        total_label_cost = 0
-        style_count = 0
-        
-        for s in styles:
-            fabric_cost = s.get_total_fabric_cost()
-            labor_cost = s.get_total_labor_cost()
-            notion_cost = s.get_total_notion_cost()
-            total_cost = fabric_cost + labor_cost + notion_cost + label_cost
-            
-            total_fabric_cost += fabric_cost
-            total_labor_cost += labor_cost
-            total_notion_cost += notion_cost
-            total_label_cost += label_cost
-            style_count += 1
-            
-            if total_cost < 20:
-                cost_buckets['$0-20'] += 1
-            elif total_cost < 40:
-                cost_buckets['$20-40'] += 1
-            elif total_cost < 60:
-                cost_buckets['$40-60'] += 1
-            elif total_cost < 80:
-                cost_buckets['$60-80'] += 1
-            elif total_cost < 100:
-                cost_buckets['$80-100'] += 1
-            else:
-                cost_buckets['$100+'] += 1
-        
-        cost_distribution = {
-            'labels': list(cost_buckets.keys()),
-            'values': list(cost_buckets.values())
-        }
-        
-        # ========================================
-        # 2. TOP FABRICS (most used)
-        # ========================================
-        top_fabrics_query = db.session.query(
-            Fabric.name,
-            func.count(StyleFabric.fabric_id).label('count')
-        ).join(
-            StyleFabric, Fabric.id == StyleFabric.fabric_id
-        ).group_by(
-            Fabric.name
-        ).order_by(
-            func.count(StyleFabric.fabric_id).desc()
-        ).limit(6).all()
-        
-        top_fabrics = {
-            'labels': [f[0][:15] + '...' if len(f[0]) > 15 else f[0] for f in top_fabrics_query],
-            'values': [f[1] for f in top_fabrics_query]
-        }
-        
-        # ========================================
-        # 3. COST BREAKDOWN (avg per category)
-        # ========================================
-        if style_count > 0:
-            avg_fabric = total_fabric_cost / style_count
-            avg_labor = total_labor_cost / style_count
-            avg_notion = total_notion_cost / style_count
-            avg_label = label_cost
-        else:
-            avg_fabric = avg_labor = avg_notion = avg_label = 0
-        
-        cost_breakdown = {
-            'labels': ['Fabric', 'Labor', 'Notions', 'Labels'],
-            'values': [round(avg_fabric, 2), round(avg_labor, 2), round(avg_notion, 2), round(avg_label, 2)]
-        }
-        
-        # ========================================
-        # 4. ACTIVITY TREND (styles created over time)
-        # ========================================
-        # Get styles created in the last 6 months
-        six_months_ago = datetime.now() - timedelta(days=180)
-        
-        monthly_counts = db.session.query(
-            func.date_trunc('month', Style.created_at).label('month'),
-            func.count(Style.id).label('count')
-        ).filter(
-            Style.created_at >= six_months_ago
-        ).group_by(
-            func.date_trunc('month', Style.created_at)
-        ).order_by(
-            func.date_trunc('month', Style.created_at)
-        ).all()
-        
-        activity_trend = {
-            'labels': [m[0].strftime('%b %Y') if m[0] else 'Unknown' for m in monthly_counts],
-            'values': [m[1] for m in monthly_counts]
-        }
-        
-        # If no data, show placeholder
-        if not activity_trend['labels']:
-            activity_trend = {
-                'labels': ['No Data'],
-                'values': [0]
-            }
-        
-        # ========================================
-        # 5. QUICK INSIGHTS
-        # ========================================
-        one_week_ago = datetime.now() - timedelta(days=7)
-        new_this_week = Style.query.filter(Style.created_at >= one_week_ago).count()
-        
-        # Calculate average margin
-        avg_margin = 60  # Default
-        if styles:
-            margins = [s.base_margin_percent for s in styles if s.base_margin_percent]
-            if margins:
-                avg_margin = sum(margins) / len(margins)
-        
-        # Most active day
-        most_active_query = db.session.query(
-            func.date(Style.created_at).label('date'),
-            func.count(Style.id).label('count')
-        ).group_by(
-            func.date(Style.created_at)
-        ).order_by(
-            func.count(Style.id).desc()
-        ).first()
-        
-        most_active = most_active_query[0].strftime('%b %d') if most_active_query and most_active_query[0] else 'N/A'
-        
-        # Price sweet spot (most common price range)
-        max_bucket = max(cost_buckets, key=cost_buckets.get)
-        
-        insights = [
-            f"📈 Trending: +{new_this_week} styles this week",
-            f"💹 Avg profit margin: {avg_margin:.0f}%",
-            f"🔥 Most active: {most_active}",
-            f"💰 Price sweet spot: {max_bucket}",
-            f"📦 Total styles: {style_count}"
-        ]
-        
-        return jsonify({
-            'cost_distribution': cost_distribution,
-            'top_fabrics': top_fabrics,
-            'cost_breakdown': cost_breakdown,
-            'activity_trend': activity_trend,
-            'insights': insights
-        })
+        return jsonify(get_dashboard_rollup()['charts'])
         
     except Exception as e:
         app.logger.error(f"Dashboard charts API error: {e}")
@@ -1443,13 +1361,9 @@ def api_style_cost_breakdown():
             })
         else:
             # Return average of all styles
-            styles = Style.query.options(
-                joinedload(Style.style_fabrics).joinedload(StyleFabric.fabric),
-                joinedload(Style.style_notions).joinedload(StyleNotion.notion),
-                joinedload(Style.style_labor).joinedload(StyleLabor.labor_operation)
-            ).all()
+            catalog = load_catalog_costs()
             
-            if not styles:
+            if not len(catalog):
                 return jsonify({
                     'labels': ['Fabric', 'Labor', 'Notions', 'Labels'],
                     'values': [0, 0, 0, 0],
@@ -1457,10 +1371,10 @@ def api_style_cost_breakdown():
                     'total_cost': 0
                 })
             
-            total_fabric = sum(s.get_total_fabric_cost() for s in styles)
-            total_labor = sum(s.get_total_labor_cost() for s in styles)
-            total_notion = sum(s.get_total_notion_cost() for s in styles)
-            count = len(styles)
+            total_fabric = float(catalog.fabric.sum())
+            total_labor = float(catalog.labor.sum())
+            total_notion = float(catalog.notion.sum())
+            count = len(catalog)
             
             return jsonify({
                 'labels': ['Fabric', 'Labor', 'Notions', 'Labels'],
@@ -1481,6 +1395,7 @@ def api_style_cost_breakdown():
 
 @app.route('/api/styles-list-simple')
 @login_required  
+@conditional_get('styles')
 def api_styles_list_simple():
     """Get simple list of styles for dropdown"""
     try:
@@ -1585,32 +1500,23 @@ def api_compare_styles():
         if len(ids) < 1 or len(ids) > 3:
             return jsonify({'error': 'Select 1-3 styles to compare'}), 400
         
-        # Get label cost
-        label_setting = GlobalSetting.query.filter_by(setting_key='avg_label_cost').first()
-        label_cost = label_setting.setting_value if label_setting else 0.20
+        # Costs come from the style_costs rollup (one indexed join)
+        rows = {style.id: (style, cost) for style, cost in with_style_costs(Style.query.filter(Style.id.in_(ids)))}
         
         styles_data = []
         for style_id in ids:
-            style = Style.query.options(
-                joinedload(Style.style_fabrics).joinedload(StyleFabric.fabric),
-                joinedload(Style.style_notions).joinedload(StyleNotion.notion),
-                joinedload(Style.style_labor).joinedload(StyleLabor.labor_operation)
-            ).get(style_id)
-            
-            if style:
-                fabric_cost = style.get_total_fabric_cost()
-                labor_cost = style.get_total_labor_cost()
-                notion_cost = style.get_total_notion_cost()
-                total_cost = fabric_cost + labor_cost + notion_cost + label_cost
+            if style_id in rows:
+                style, cost = rows[style_id]
+                total_cost = cost.fabric_cost + cost.labor_cost + cost.notion_cost + cost.label_cost
                 
                 styles_data.append({
                     'id': style.id,
                     'name': style.vendor_style,
                     'full_name': f"{style.vendor_style} - {style.style_name}",
-                    'fabric': round(fabric_cost, 2),
-                    'labor': round(labor_cost, 2),
-                    'notions': round(notion_cost, 2),
-                    'labels': round(label_cost, 2),
+                    'fabric': round(cost.fabric_cost, 2),
+                    'labor': round(cost.labor_cost, 2),
+                    'notions': round(cost.notion_cost, 2),
+                    'labels': round(cost.label_cost, 2),
                     'total': round(total_cost, 2)
                 })
         
@@ -1645,22 +1551,21 @@ def api_recent_styles():
 @login_required
 def api_all_styles_for_export():
     """
-    Get styles for export modal - PAGINATED & OPTIMIZED
+    Get styles for export modal - CURSOR PAGINATED & OPTIMIZED
     
     Returns lightweight data for search/filter in export modal.
-    Uses pagination to avoid loading all styles at once.
+    Pages follow `next_cursor` (keyset on vendor_style), so the last page
+    is as cheap as the first. Pass total=estimate for an approximate count.
     """
-    # Get pagination parameters
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor', '', type=str)
     per_page = request.args.get('per_page', 100, type=int)
     search = request.args.get('search', '', type=str).lower()
     
     # Limit per_page
-    if per_page > 200:
-        per_page = 200
+    per_page = max(1, min(per_page, 200))
     
     # Build query
-    query = Style.query.filter(Style.is_active == True)
+    query = db.session.query(Style.id, Style.vendor_style, Style.style_name, Style.gender).filter(Style.is_active == True)
     
     # Apply search filter if provided
     if search:
@@ -1672,80 +1577,48 @@ def api_all_styles_for_export():
             )
         )
     
-    # Get paginated results
-    pagination = query.order_by(Style.vendor_style).paginate(
-        page=page,
-        per_page=per_page,
-        error_out=False
-    )
-    
-    # Get cached global settings for cost calculation
-    from models import get_cached_global_settings
-    settings = get_cached_global_settings()
+    try:
+        page = keyset_page(
+            query,
+            [(Style.vendor_style, False, False), (Style.id, False, False)],
+            key=lambda s: (s.vendor_style, s.id),
+            scope='styles_for_export',
+            cursor=cursor,
+            limit=per_page
+        )
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     
     # Build lightweight response (no expensive calculations)
-    styles_data = []
-    for s in pagination.items:
-        styles_data.append({
-            'id': s.id,
-            'vendor_style': s.vendor_style,
-            'style_name': s.style_name,
-            'gender': s.gender or 'N/A',
-            # Don't calculate cost here - too expensive!
-            # Frontend doesn't need it for the modal list
-        })
+    styles_data = [{
+        'id': s.id,
+        'vendor_style': s.vendor_style,
+        'style_name': s.style_name,
+        'gender': s.gender or 'N/A',
+    } for s in page['rows']]
     
-    return jsonify({
+    result = {
         'styles': styles_data,
-        'total': pagination.total,
-        'pages': pagination.pages,
-        'current_page': pagination.page,
-        'has_next': pagination.has_next,
-        'has_prev': pagination.has_prev
-    })
+        'next_cursor': page['next_cursor'],
+        'prev_cursor': page['prev_cursor'],
+        'has_next': page['next_cursor'] is not None,
+        'has_prev': page['prev_cursor'] is not None
+    }
+    if request.args.get('total') == 'estimate':
+        result['total'], result['total_exact'] = estimate_count(query)
+    
+    return jsonify(result)
 
 @app.route('/api/dashboard-stats')
 @login_required
 def api_dashboard_stats():
-    """API endpoint for dashboard stats - OPTIMIZED VERSION"""
-    
-    total_styles = Style.query.count()
-    
-    if total_styles == 0:
-        return jsonify({
-            'total_styles': 0,
-            'avg_cost': 0
-        })
-    
-    # ========================================
-    # OPTIMIZED: Sample-based calculation
-    # ========================================
-    from sqlalchemy.sql.expression import func as sql_func
-    
-    sample_size = min(100, total_styles)
+    """API endpoint for dashboard stats (from the dashboard_rollups snapshot)"""
     
-    sampled_styles = Style.query.options(
-        joinedload(Style.style_fabrics).joinedload(StyleFabric.fabric),
-        joinedload(Style.style_notions).joinedload(StyleNotion.notion),
-        joinedload(Style.style_labor).joinedload(StyleLabor.labor_operation)
-    ).order_by(sql_func.random()).limit(sample_size).all()
+    rollup = get_dashboard_rollup()
     
-    # Cache label cost
-    label_setting = GlobalSetting.query.filter_by(setting_key='avg_label_cost').first()
-    label_cost = label_setting.setting_value if label_setting else 0.20
-    
-    total_cost = sum(
-        s.get_total_fabric_cost() + 
-        s.get_total_notion_cost() + 
-        s.get_total_labor_cost() + 
-        label_cost 
-        for s in sampled_styles
-    )
-    avg_cost = total_cost / len(sampled_styles) if sampled_styles else 0
-
     return jsonify({
-        'total_styles': total_styles,
-        'avg_cost': round(avg_cost, 2)
+        'total_styles': rollup['total_styles'],
+        'avg_cost': rollup['avg_cost']
     })
 
 @app.route('/api/style/<int:style_id>/upload-image', methods=['POST'])
@@ -1896,6 +1769,7 @@ def delete_style_image(image_id):
 # SIZE RANGE ENDPOINTS
 @app.route('/api/size-ranges', methods=['GET', 'POST'])
 @login_required
+@conditional_get('master_data')
 def api_size_ranges():
     if request.method == 'GET':
         ranges = SizeRange.query.all()
@@ -1998,7 +1872,12 @@ def api_size_range_modify(size_range_id):
             if 'description' in data:
                 size_range.description = data.get('description', '').strip() if data.get('description') else None
             
+            # New sizes/markup change the SKU rows of every style on this range
+            db.session.flush()
+            rebuild_sku_prices(styles_using('size_range', {old_values['name'], size_range.name}))
+            
             db.session.commit()
+            discard_size_ladder(size_range.id)
             
             # Count affected styles
             affected_count = Style.query.filter_by(size_range=size_range.name).count()
@@ -2030,17 +1909,17 @@ def api_size_range_modify(size_range_id):
             # Check if size range is used in any styles
             styles_using_range = Style.query.filter_by(size_range=size_range.name).all()
             if styles_using_range:
-                styles_using = [{
+                styles_in_use = [{
                     'id': s.id,
                     'vendor_style': s.vendor_style,
                     'style_name': s.style_name
                 } for s in styles_using_range]
                 
-                style_list = ', '.join([s['vendor_style'] or s['style_name'] for s in styles_using])
+                style_list = ', '.join([s['vendor_style'] or s['style_name'] for s in styles_in_use])
                 return jsonify({
                     'success': False,
-                    'error': f'Cannot delete: This size range is used in {len(styles_using)} style(s): {style_list}',
-                    'styles_using': styles_using
+                    'error': f'Cannot delete: This size range is used in {len(styles_in_use)} style(s): {style_list}',
+                    'styles_using': styles_in_use
                 }), 400
             
             # Capture info BEFORE delete
@@ -2054,6 +1933,7 @@ def api_size_range_modify(size_range_id):
             
             db.session.delete(size_range)
             db.session.commit()
+            discard_size_ladder(size_range_id_val)
             
             # Log the delete
             log_audit(
@@ -2074,6 +1954,7 @@ def api_size_range_modify(size_range_id):
 @app.route('/api/global-settings', methods=['GET'])
 @login_required
 @role_required('admin')
+@conditional_get('master_data')
 def get_global_settings():
     settings = GlobalSetting.query.all()
     return jsonify([{
@@ -2124,46 +2005,17 @@ def api_global_setting_detail(setting_id):
                     affected_count = len(cleaning_costs)  # ✅ ADD THIS
                     app.logger.info(f"Updated {len(cleaning_costs)} cleaning costs with new rate ${value}/min")
                 
-                # Auto-update all styles when sublimation cost changes
-                if setting.setting_key == 'sublimation_cost':
-                    affected_style_ids = db.session.query(StyleFabric.style_id).filter(
-                        StyleFabric.is_sublimation == True
-                    ).distinct().all()
-                    
-                    for (style_id,) in affected_style_ids:
-                        style = Style.query.get(style_id)
-                        if style and style.base_margin_percent:
-                            new_cost = style.get_total_cost()
-                            margin = style.base_margin_percent / 100.0
-                            if margin < 1:
-                                style.suggested_price = round(new_cost / (1 - margin), 2)
-                    
-                    affected_count = len(affected_style_ids)  # ✅ ADD THIS
-                    app.logger.info(f"Updated {len(affected_style_ids)} styles after sublimation cost change to ${value}")
-                
-                # Auto-update all styles when label cost changes
-                if setting.setting_key == 'avg_label_cost':
-                    all_styles = Style.query.all()
-                    for style in all_styles:
-                        if style.base_margin_percent:
-                            new_cost = style.get_total_cost()
-                            margin = style.base_margin_percent / 100.0
-                            if margin < 1:
-                                style.suggested_price = round(new_cost / (1 - margin), 2)
-                    affected_count = len(all_styles)  # ✅ ADD THIS
-                    app.logger.info(f"Updated {len(all_styles)} styles after label cost change to ${value}")
-                
-                # Auto-update all styles when shipping cost changes
-                if setting.setting_key == 'shipping_cost':
-                    all_styles = Style.query.all()
-                    for style in all_styles:
-                        if style.base_margin_percent:
-                            new_cost = style.get_total_cost()
-                            margin = style.base_margin_percent / 100.0
-                            if margin < 1:
-                                style.suggested_price = round(new_cost / (1 - margin), 2)
-                    affected_count = len(all_styles)  # ✅ ADD THIS
-                    app.logger.info(f"Updated {len(all_styles)} styles after shipping cost change to ${value}")
+                # Auto-reprice the styles this setting feeds (sublimation -> sublimated
+                # fabrics, cleaning rate -> cleaned garment types, label/shipping -> all).
+                # Label and shipping add the same constant to every style: set-based SQL
+                if setting.setting_key in COST_SETTING_KEYS:
+                    if setting.setting_key in FLAT_SETTING_COLUMNS:
+                        repriced = reprice_flat_setting(setting.setting_key, value)
+                    else:
+                        repriced = reprice('setting', setting.setting_key)
+                    if setting.setting_key != 'cleaning_cost_per_minute':
+                        affected_count = repriced
+                    app.logger.info(f"Repriced {repriced} styles after {setting.setting_key} change to ${value}")
 
             if 'description' in data:
                 setting.description = data.get('description', '').strip() if data.get('description') else None
@@ -2296,6 +2148,7 @@ def import_clients():
 # COLOR ENDPOINTS
 @app.route('/api/colors', methods=['GET'])
 @login_required
+@conditional_get('colors')
 def api_colors_get():
     """Get all colors - any authenticated user"""
     colors = Color.query.order_by(Color.name).all()
@@ -2378,6 +2231,10 @@ def api_color_modify(color_id):
             if 'color_code' in data:
                 color.color_code = data.get('color_code', '').strip() if data.get('color_code') else None
             
+            # A rename changes U_COLOR on every SKU of the styles using it
+            if color.name != old_values['name']:
+                rebuild_sku_prices(styles_using('color', color.id))
+            
             db.session.commit()
             
             # Log the update
@@ -2401,21 +2258,21 @@ def api_color_modify(color_id):
             # Check if color is used in any styles
             style_colors = StyleColor.query.filter_by(color_id=color_id).all()
             if style_colors:
-                styles_using = []
+                styles_in_use = []
                 for sc in style_colors:
                     style = Style.query.get(sc.style_id)
                     if style:
-                        styles_using.append({
+                        styles_in_use.append({
                             'id': style.id,
                             'vendor_style': style.vendor_style,
                             'style_name': style.style_name
                         })
                 
-                style_list = ', '.join([s['vendor_style'] or s['style_name'] for s in styles_using])
+                style_list = ', '.join([s['vendor_style'] or s['style_name'] for s in styles_in_use])
                 return jsonify({
                     'success': False,
-                    'error': f'Cannot delete: This color is used in {len(styles_using)} style(s): {style_list}',
-                    'styles_using': styles_using
+                    'error': f'Cannot delete: This color is used in {len(styles_in_use)} style(s): {style_list}',
+                    'styles_using': styles_in_use
                 }), 400
             
             # Capture info BEFORE delete
@@ -2442,128 +2299,99 @@ def api_color_modify(color_id):
             return jsonify({'success': False, 'error': 'Failed to delete color'}), 500
 
 
-# ===== Extended-size + Range helpers (robust) =====
-
-def _normalize_size_token(tok: str) -> str:
-    """Normalize a size label to compare safely, e.g. '3x' -> '3XL'."""
-    if tok is None:
-        return ''
-    s = tok.strip().upper().replace(' ', '')
-    # Treat '3X' as '3XL'
-    if s.endswith('X') and not s.endswith('XL'):
-        s = s + 'L'
-    return s
-
-_ALPHA_LADDER = ["XXS","XS","S","M","L","XL","2XL","3XL","4XL","5XL","6XL"]
-
-def _expand_alpha_range(a: str, b: str):
-    A = _normalize_size_token(a); B = _normalize_size_token(b)
-    try:
-        ia, ib = _ALPHA_LADDER.index(A), _ALPHA_LADDER.index(B)
-    except ValueError:
-        return [A, B] if A != B else [A]
-    return _ALPHA_LADDER[ia:ib+1] if ia <= ib else list(reversed(_ALPHA_LADDER[ib:ia+1]))
-
-def _expand_numeric_range(a: str, b: str):
-    """Expand numeric ranges with step=2."""
-    sa, sb = a.strip(), b.strip()
-    try:
-        ia, ib = int(sa), int(sb)
-    except ValueError:
-        return [_normalize_size_token(a), _normalize_size_token(b)]
-
-    if sa == "00":
-        start, end = (ia, ib) if ia <= ib else (ib, ia)
-        tail = [str(n) for n in range(0, end + 1, 2)]
-        return ["00"] + tail
-
-    width = max(len(sa), len(sb))
-    step = 2
-    if ia <= ib:
-        seq = range(ia, ib + 1, step)
-    else:
-        seq = range(ia, ib - 1, -step)
-
-    return [str(n).zfill(width) for n in seq]
-
-
-def _expand_mixed_token(token: str):
-    t = token.strip()
-    if not t:
-        return []
-    if '-' in t:
-        left, right = [x.strip() for x in t.split('-', 1)]
-        if any(c.isalpha() for c in left+right):
-            return _expand_alpha_range(left, right)
-        return _expand_numeric_range(left, right)
-    s = _normalize_size_token(t)
-    return [s] if s else []
-
-def expand_sizes_string(s: str):
-    """'XS-XL, 2XL-6XL' or '00-18, 20-30' -> flat list of sizes."""
-    if not s:
-        return []
-    out = []
-    for part in s.split(','):
-        out.extend(_expand_mixed_token(part))
-    # de-dup preserving order
-    seen, flat = set(), []
-    for x in out:
-        if x not in seen:
-            seen.add(x); flat.append(x)
-    return flat
-
-def is_extended_size_for_range(size_label: str, size_range_obj) -> bool:
-    """True if size_label is inside size_range_obj.extended_sizes (supports ranges)."""
-    if size_range_obj is None:
-        return False
-    ext_list = expand_sizes_string(getattr(size_range_obj, 'extended_sizes', '') or '')
-    if not ext_list:
-        return False
-    return _normalize_size_token(size_label) in ext_list
-
-
 # ===== VALIDATION HELPER =====
-def validate_style_for_export(style):
-    """
-    Validate a single style for export.
-    Returns (is_valid: bool, missing: list)
-    """
+def export_missing_fields(vendor_style, style_name, has_colors, size_range):
+    """Export rules for one style's fields - returns the list of missing items"""
     missing = []
     
     # Check vendor style
-    if not style.vendor_style or not style.vendor_style.strip():
+    if not vendor_style or not vendor_style.strip():
         missing.append('Vendor Style')
     
     # Check style name
-    if not style.style_name or not style.style_name.strip():
+    if not style_name or not style_name.strip():
         missing.append('Style Name')
     
     # Check colors - STRICT (must have at least 1)
-    has_colors = hasattr(style, 'colors') and style.colors and len(style.colors) > 0
     if not has_colors:
         missing.append('At least ONE Color')
     
     # Check size range - STRICT (must exist AND have sizes)
-    if not style.size_range or not style.size_range.strip():
+    if not size_range or not size_range.strip():
         missing.append('Size Range')
     else:
         # Verify size range actually has sizes defined
-        from models import SizeRange
-        size_range_obj = SizeRange.query.filter_by(name=style.size_range).first()
-        if size_range_obj:
-            regular_sizes = expand_sizes_string(getattr(size_range_obj, 'regular_sizes', '') or '')
-            extended_sizes = expand_sizes_string(getattr(size_range_obj, 'extended_sizes', '') or '')
-            all_sizes = regular_sizes + [s for s in extended_sizes if s not in regular_sizes]
-            
-            if not all_sizes:
+        ladder = get_size_ladder(size_range)
+        if ladder:
+            if not ladder.sizes:
                 missing.append('Size Range has NO sizes defined')
         else:
             missing.append('Size Range does not exist in system')
     
+    return missing
+
+
+def validate_style_for_export(style):
+    """
+    Validate a single style for export.
+    Returns (is_valid: bool, missing: list)
+    """
+    has_colors = hasattr(style, 'colors') and style.colors and len(style.colors) > 0
+    missing = export_missing_fields(style.vendor_style, style.style_name, has_colors, style.size_range)
     return (len(missing) == 0, missing)
 
 
+def find_export_validation_errors(style_ids):
+    """
+    Validate many styles for export in ONE query.
+
+    SQL returns only the styles that break a rule (blank fields, no colors,
+    unknown size range, or a size range whose ladder has no sizes); the same
+    rules as validate_style_for_export() then name what is missing.
+    Returns [{'style_id', 'vendor_style', 'style_name', 'missing'}] in selection order.
+    """
+    if not style_ids:
+        return []
+
+    def blank(column):
+        return db.or_(column.is_(None), func.trim(column) == '')
+
+    has_colors = db.exists().where(StyleColor.style_id == Style.id)
+    empty_ranges = [sr.name for sr in get_master_data().size_ranges
+                    if not get_size_ladder(sr.name).sizes]
+
+    rows = db.session.query(
+        Style.id, Style.vendor_style, Style.style_name, Style.size_range,
+        has_colors.label('has_colors')
+    ).outerjoin(
+        SizeRange, SizeRange.name == Style.size_range
+    ).filter(
+        Style.id.in_(style_ids),
+        db.or_(
+            blank(Style.vendor_style),
+            blank(Style.style_name),
+            ~has_colors,
+            blank(Style.size_range),
+            SizeRange.id.is_(None),
+            Style.size_range.in_(empty_ranges)
+        )
+    ).all()
+
+    order = {style_id: pos for pos, style_id in enumerate(style_ids)}
+    errors = []
+    for style_id, vendor_style, style_name, size_range, style_has_colors in sorted(
+            rows, key=lambda row: order.get(row[0], 0)):
+        missing = export_missing_fields(vendor_style, style_name, style_has_colors, size_range)
+        if missing:
+            errors.append({
+                'style_id': style_id,
+                'vendor_style': vendor_style or 'UNKNOWN',
+                'style_name': style_name or 'UNKNOWN',
+                'missing': missing
+            })
+    return errors
+
+
 # ===== SINGLE STYLE EXPORT =====     
 @app.route('/export-sap-single-style', methods=['POST'])
 @login_required
@@ -2576,9 +2404,10 @@ def export_sap_single_style():
         if not vendor_style:
             return "No style specified", 400
 
-        style = Style.query.filter_by(vendor_style=vendor_style).first()
-        if not style:
+        rows = with_style_costs(Style.query.filter_by(vendor_style=vendor_style))
+        if not rows:
             return "Style not found", 404
+        style, style_cost = rows[0]
         
         # Parse selected colors if provided
         selected_colors = None
@@ -2681,6 +2510,15 @@ def export_sap_single_style():
             """
             return error_html, 400
 
+        filename = f"SAP_{style.vendor_style}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        cache_key = export_cache_key('sap-single', [style.id], {'selected_colors': selected_colors})
+        cached_path = cached_export_path(cache_key)
+        if cached_path:
+            response = send_file(os.path.abspath(cached_path), mimetype='text/csv',
+                                 as_attachment=True, download_name=filename)
+            response.headers['X-Export-Cache'] = 'HIT'
+            return response
+
         # ========================================
         # EXPORT - NO FALLBACKS
         # ========================================
@@ -2692,18 +2530,10 @@ def export_sap_single_style():
         writer.writerow(headers)
         writer.writerow(headers)
 
-        base_cost = style.get_total_cost()
-        from models import SizeRange
-        size_range_obj = SizeRange.query.filter_by(name=style.size_range).first()
-
-        extended_pct = (size_range_obj.extended_markup_percent
-                        if (size_range_obj and size_range_obj.extended_markup_percent is not None)
-                        else 15.0)
-        extended_mult = 1.0 + (float(extended_pct) / 100.0)
-
-        regular_list = expand_sizes_string(getattr(size_range_obj, 'regular_sizes', '') or '')
-        extended_list = expand_sizes_string(getattr(size_range_obj, 'extended_sizes', '') or '')
-        all_sizes = regular_list + [s for s in extended_list if s not in regular_list]
+        base_cost = style_cost.total_cost
+        # Sizes + prices from the compiled size range ladder
+        ladder = get_size_ladder(style.size_range)
+        size_prices = ladder.price_ladder(base_cost) if ladder else []
         
         # NO FALLBACK - validation ensures sizes exist
         # Filter colors if specific colors were selected
@@ -2731,21 +2561,89 @@ def export_sap_single_style():
         shipping_cost = style.shipping_cost if hasattr(style, 'shipping_cost') else 0.00
 
         for color in colors:
-                for size in all_sizes:
-                    price = round(base_cost * extended_mult, 2) if is_extended_size_for_range(size, size_range_obj) else round(base_cost, 2)
+                for size, price in size_prices:
                     for variable in variables:
                         writer.writerow(['', '', color, size, variable, price, shipping_cost, u_style, vendor_code, style.style_name])
 
-        output.seek(0)
-        filename = f"SAP_{style.vendor_style}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        return Response(output.getvalue(), mimetype='text/csv',
-                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+        csv_text = output.getvalue()
+        store_export(cache_key, csv_text)
+        return Response(csv_text, mimetype='text/csv',
+                        headers={'Content-Disposition': f'attachment; filename={filename}',
+                                 'X-Export-Cache': 'MISS'})
 
     except Exception as e:
         import traceback
         app.logger.error(traceback.format_exc())
         return f"Error exporting: {html.escape(str(e))}", 500
 
+# ===== EXPORT RESPONSES (optional gzip/zstd) =====
+def requested_export_compression():
+    """
+    (method, as_content_encoding) from the form's `compression` field
+    ('gzip'/'zstd' download) or the Accept-Encoding header. Raises ValueError
+    / CompressionUnavailable for a format we cannot produce.
+    """
+    return choose_compression(request.form.get('compression'),
+                              accepts_gzip=request.accept_encodings['gzip'] > 0)
+
+
+def csv_export_response(chunks, filename, compression=(None, False), headers=None, cached_path=None):
+    """
+    Download response for a CSV export: streams `chunks` (or the cached file
+    at `cached_path`), compressing chunk by chunk when requested.
+    """
+    method, as_encoding = compression
+    headers = dict(headers or {})
+
+    if method is None:
+        if cached_path:
+            response = send_file(os.path.abspath(cached_path), mimetype='text/csv',
+                                 as_attachment=True, download_name=filename)
+            response.headers.update(headers)
+            return response
+        headers['Content-Disposition'] = f'attachment; filename={filename}'
+        return Response(chunks, mimetype='text/csv', headers=headers)
+
+    if cached_path:
+        chunks = iter_file(cached_path)
+    if as_encoding:
+        mimetype = 'text/csv'
+        headers['Content-Encoding'] = method
+        headers['Vary'] = 'Accept-Encoding'
+    else:
+        suffix, mimetype = COMPRESSIONS[method]
+        filename += suffix
+    headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return Response(compress_stream(chunks, method), mimetype=mimetype, headers=headers)
+
+
+def call_when_sent(response, callback):
+    """
+    Run callback() once the server has taken the last chunk of a streamed
+    response - not when the download was aborted, and not merely when the
+    body generator ran out (compression still has a trailer to send then).
+    """
+    body = response.response
+    state = {'sent': False}
+
+    def tracked():
+        yield from body
+        # The server only asks for more after writing the previous chunk
+        state['sent'] = True
+
+    def on_close():
+        if not state['sent']:
+            return
+        try:
+            callback()
+        except Exception as e:
+            app.logger.error(f"❌ Error after export was sent: {str(e)}")
+
+    response.response = tracked()
+    response.call_on_close(on_close)
+    return response
+
+
 # ===== FINAL BULK EXPORT WITH STREAMING + DEFAULT HANDLING =====
 @app.route('/export-sap-format', methods=['POST'])
 @login_required
@@ -2758,32 +2656,19 @@ def export_sap_format():
         
         if not style_ids:
             return "No styles selected", 400
+        
+        try:
+            compression = requested_export_compression()
+        except (ValueError, CompressionUnavailable) as e:
+            return html.escape(str(e)), 400
 
         # ========================================
-        # OPTIMIZED VALIDATION - EARLY EXIT
+        # SET-BASED VALIDATION - ONE QUERY
         # ========================================
-        BATCH_SIZE = 100
         MAX_ERRORS_TO_SHOW = 50  # Limit errors shown to prevent memory issues
-        invalid_styles = []
-        total_invalid = 0
-        
-        # Validate in batches with early exit
-        for i in range(0, len(style_ids), BATCH_SIZE):
-            batch_ids = style_ids[i:i + BATCH_SIZE]
-            batch_styles = Style.query.filter(Style.id.in_(batch_ids)).all()
-            
-            for style in batch_styles:
-                is_valid, missing = validate_style_for_export(style)
-                if not is_valid:
-                    total_invalid += 1
-                    
-                    # Only store first 50 errors to prevent memory issues
-                    if len(invalid_styles) < MAX_ERRORS_TO_SHOW:
-                        invalid_styles.append({
-                            'vendor_style': style.vendor_style or 'UNKNOWN',
-                            'style_name': style.style_name or 'UNKNOWN',
-                            'missing': missing
-                        })
+        validation_errors = find_export_validation_errors(style_ids)
+        total_invalid = len(validation_errors)
+        invalid_styles = validation_errors[:MAX_ERRORS_TO_SHOW]
         
         # If ANY style is invalid, block export
         if invalid_styles:
@@ -2934,142 +2819,368 @@ def export_sap_format():
             
             return error_html, 400
         
+        # Build SKU rows for any selected style that has none yet
+        if ensure_sku_prices(style_ids):
+            db.session.commit()
+        
         # ========================================
         # STREAMING CSV GENERATION (Already optimized)
         # ========================================
+        # parallel=1: large selections are formatted by the export process pool
+        # (PostgreSQL only - all workers read one exported snapshot)
+        engine = db.engine
+        parallel = (request.form.get('parallel', '0') == '1' and len(style_ids) >= PARALLEL_MIN_STYLES
+                    and parallel_export_supported(engine))
+        
         def generate_csv():
-            import csv
-            from io import StringIO
+            yield SAP_HEADER_CHUNK
             
-            buffer = StringIO()
-            writer = csv.writer(buffer)
+            if parallel:
+                yield from iter_parallel_sap_csv(style_ids, include_empty_vars, engine)
+                return
             
-            headers = ['Code', 'Name', 'U_COLOR', 'U_SIZE', 'U_VARIABLE',
-                       'U_PRICE', 'U_SHIP_COST', 'U_STYLE', 'U_CardCode', 'U_PROD_NAME']
-            writer.writerow(headers)
-            writer.writerow(headers)
-            
-            yield buffer.getvalue()
+            with app.app_context():
+                for rows in iter_sku_export_batches(style_ids, include_empty_vars):
+                    yield csv_chunk(rows)
+        
+        filename = f"SAP_Export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        
+        # Same selection with unchanged styles/costs/settings -> cached file
+        cache_key = export_cache_key('sap', style_ids, {'include_empty_vars': include_empty_vars})
+        cached_path = cached_export_path(cache_key)
+        if cached_path:
+            return csv_export_response(None, filename, compression, cached_path=cached_path, headers={
+                'X-Export-Count': str(len(style_ids)),
+                'X-Export-Cache': 'HIT'
+            })
+        
+        return csv_export_response(cache_export_stream(cache_key, generate_csv()), filename, compression, headers={
+            'X-Export-Count': str(len(style_ids)),
+            'X-Export-Cache': 'MISS',
+            'X-Export-Parallel': '1' if parallel else '0'
+        })
+
+    except Exception as e:
+        import traceback
+        app.logger.error(traceback.format_exc())
+        return f"Error exporting: {html.escape(str(e))}", 500
+
+# ===== DELTA EXPORT (only styles changed since the last delta) =====
+@app.route('/export-sap-delta', methods=['POST'])
+@login_required
+def export_sap_delta():
+    """
+    SAP B1 rows for the styles whose prices or SKUs changed since the last
+    delta export of this watermark stream (every style on the stream's first
+    export). The watermark only moves once the server has sent the whole
+    file, so a failed or aborted download is sent again next time.
+    Styles failing export validation are skipped (fixing one logs it again).
+    """
+    try:
+        watermark_name = request.form.get('watermark', DEFAULT_WATERMARK)
+        include_empty_vars = request.form.get('include_empty_vars', '0') == '1'
+        if not valid_watermark_name(watermark_name):
+            return "Invalid watermark name", 400
+        try:
+            compression = requested_export_compression()
+        except (ValueError, CompressionUnavailable) as e:
+            return html.escape(str(e)), 400
+
+        upto, style_ids, full = pending_delta(watermark_name)
+        invalid_ids = {item['style_id'] for item in find_export_validation_errors(style_ids)}
+        style_ids = [style_id for style_id in style_ids if style_id not in invalid_ids]
+        
+        if ensure_sku_prices(style_ids):
+            db.session.commit()
+        
+        user_id = current_user.id
+        stats = {'rows': 0}
+        
+        def generate_csv():
+            yield SAP_HEADER_CHUNK
             
             with app.app_context():
-                for i in range(0, len(style_ids), BATCH_SIZE):
-                    batch_ids = style_ids[i:i + BATCH_SIZE]
-                    batch_styles = Style.query.filter(Style.id.in_(batch_ids)).all()
-                    
-                    buffer = StringIO()
-                    writer = csv.writer(buffer)
-                    
-                    for style in batch_styles:
-                        base_cost = style.get_total_cost()
-                        from models import SizeRange
-                        size_range_obj = SizeRange.query.filter_by(name=style.size_range).first()
+                for rows in iter_sku_export_batches(style_ids, include_empty_vars):
+                    stats['rows'] += len(rows)
+                    yield csv_chunk(rows)
+        
+        def finish():
+            with app.app_context():
+                advance_watermark(watermark_name, upto, len(style_ids), stats['rows'], user_id)
+                db.session.commit()
+                app.logger.info(f"Delta export '{watermark_name}': {len(style_ids)} styles, "
+                                f"{stats['rows']} rows, watermark {upto.change_id}")
+        
+        filename = f"SAP_Delta_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        
+        response = csv_export_response(generate_csv(), filename, compression, headers={
+            'X-Export-Count': str(len(style_ids)),
+            'X-Export-Skipped': str(len(invalid_ids)),
+            'X-Export-Full': '1' if full else '0',
+            'X-Export-Watermark': str(upto.change_id)
+        })
+        return call_when_sent(response, finish)
 
-                        extended_pct = (size_range_obj.extended_markup_percent
-                                        if (size_range_obj and size_range_obj.extended_markup_percent is not None)
-                                        else 15.0)
-                        extended_mult = 1.0 + (float(extended_pct) / 100.0)
+    except Exception as e:
+        db.session.rollback()
+        import traceback
+        app.logger.error(traceback.format_exc())
+        return f"Error exporting: {html.escape(str(e))}", 500
 
-                        regular_list = expand_sizes_string(getattr(size_range_obj, 'regular_sizes', '') or '')
-                        extended_list = expand_sizes_string(getattr(size_range_obj, 'extended_sizes', '') or '')
-                        all_sizes = regular_list + [s for s in extended_list if s not in regular_list]
 
-                        colors = [sc.color.name.upper() for sc in style.colors]
-                        
-                        all_variables = [sv.variable.name.upper() for sv in style.style_variables] if hasattr(style, 'style_variables') else []
-                        variables = [v for v in all_variables if v != 'DEFAULT']
-                        has_default = 'DEFAULT' in all_variables
-                        
-                        vendor_code = 'V999'
-                        u_style = style.vendor_style.replace('-', '')
-                        shipping_cost = style.shipping_cost if hasattr(style, 'shipping_cost') else 0.00
+@app.route('/api/export-sap-delta', methods=['GET'])
+@login_required
+def api_export_sap_delta_status():
+    """Watermark of a delta stream and how many styles the next delta would send"""
+    watermark_name = request.args.get('watermark', DEFAULT_WATERMARK)
+    if not valid_watermark_name(watermark_name):
+        return jsonify({'success': False, 'error': 'Invalid watermark name'}), 400
+
+    watermark = get_watermark(watermark_name)
+    upto, style_ids, full = pending_delta(watermark_name)
+    return jsonify({
+        'success': True,
+        'watermark': watermark_name,
+        'last_change_id': watermark.last_change_id if watermark else 0,
+        'last_exported_at': watermark.exported_at.isoformat() if watermark and watermark.exported_at else None,
+        'last_style_count': watermark.style_count if watermark else 0,
+        'last_row_count': watermark.row_count if watermark else 0,
+        'pending_styles': len(style_ids),
+        'next_is_full': full,
+        'pending_upto_id': upto.change_id
+    })
 
-                        for color in colors:
-                            for size in all_sizes:
-                                price = round(base_cost * extended_mult, 2) if is_extended_size_for_range(size, size_range_obj) else round(base_cost, 2)
-                                
-                                if variables:
-                                    for variable in variables:
-                                        writer.writerow(['', '', color, size, variable, price, shipping_cost, u_style, vendor_code, style.style_name])
-                                
-                                if has_default or include_empty_vars or not variables:
-                                    writer.writerow(['', '', color, size, '', price, shipping_cost, u_style, vendor_code, style.style_name])
-                    
-                    yield buffer.getvalue()
-                    
-                    del batch_styles
-                    db.session.expunge_all()
+
+# ===== PARQUET EXPORT (SKU matrix with cost components, for BI) =====
+@app.route('/export-sku-parquet', methods=['POST'])
+@login_required
+def export_sku_parquet():
+    """
+    The expanded SKU price rows of the selection plus each style's cost
+    components as a Parquet file. Written batch by batch into the export
+    cache, so repeated requests for unchanged styles are served from disk.
+    """
+    try:
+        style_ids = json.loads(request.form.get('style_ids', '[]'))
+        include_empty_vars = request.form.get('include_empty_vars', '0') == '1'
         
-        filename = f"SAP_Export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        if not style_ids:
+            return "No styles selected", 400
+        if not parquet_available():
+            return "Parquet export is not available on this server (pyarrow is not installed)", 501
         
-        return Response(
-            generate_csv(),
-            mimetype='text/csv',
-            headers={
-                'Content-Disposition': f'attachment; filename={filename}',
-                'X-Export-Count': str(len(style_ids))
-            }
-        )
+        validation_errors = find_export_validation_errors(style_ids)
+        if validation_errors:
+            listed = ', '.join(html.escape(item['vendor_style']) for item in validation_errors[:20])
+            return f"{len(validation_errors)} style(s) are missing required export fields: {listed}", 400
+        
+        if ensure_sku_prices(style_ids):
+            db.session.commit()
+        
+        filename = f"SKU_Matrix_{datetime.now().strftime('%Y%m%d_%H%M%S')}.parquet"
+        cache_key = export_cache_key('parquet', style_ids, {'include_empty_vars': include_empty_vars})
+        cached_path = cached_export_path(cache_key, '.parquet')
+        cache_status = 'HIT'
+        if not cached_path:
+            cached_path, row_count = cache_export_file(
+                cache_key, '.parquet', lambda path: write_sku_parquet(path, style_ids, include_empty_vars)
+            )
+            cache_status = 'MISS'
+            app.logger.info(f"Parquet export: {row_count} rows for {len(style_ids)} styles")
+        
+        response = send_file(os.path.abspath(cached_path), mimetype=PARQUET_MIMETYPE,
+                             as_attachment=True, download_name=filename)
+        response.headers['X-Export-Count'] = str(len(style_ids))
+        response.headers['X-Export-Cache'] = cache_status
+        return response
 
+    except ParquetUnavailable as e:
+        return html.escape(str(e)), 501
     except Exception as e:
         import traceback
         app.logger.error(traceback.format_exc())
         return f"Error exporting: {html.escape(str(e))}", 500
 
+
+# ===== CATALOG SPREADSHEET (all styles with costs) =====
+@app.route('/export-catalog-xlsx')
+@role_required('admin', 'user')
+def export_catalog_xlsx():
+    """
+    Every style with its cost rollup as an XLSX, streamed row by row with
+    openpyxl's write-only mode. Cached until any style or cost changes.
+    """
+    try:
+        ensure_style_costs()
+        filename = f"Style_Catalog_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx"
+        cache_key = export_cache_key('catalog-xlsx', catalog_style_ids())
+        cached_path = cached_export_path(cache_key, '.xlsx')
+        cache_status = 'HIT'
+        if not cached_path:
+            cached_path, style_count = cache_export_file(cache_key, '.xlsx', write_catalog_xlsx)
+            cache_status = 'MISS'
+            app.logger.info(f"Catalog XLSX export: {style_count} styles")
+        
+        response = send_file(os.path.abspath(cached_path), mimetype=XLSX_MIMETYPE,
+                             as_attachment=True, download_name=filename)
+        response.headers['X-Export-Cache'] = cache_status
+        return response
+
+    except Exception as e:
+        import traceback
+        app.logger.error(traceback.format_exc())
+        return f"Error exporting: {html.escape(str(e))}", 500
+
+
+# ===== BACKGROUND EXPORT JOBS (large selections) =====
+def _get_export_job_for_user(job_id):
+    """The job if the current user may see it (creator or admin), else None"""
+    job = db.session.get(ExportJob, job_id)
+    if job is None:
+        return None
+    if job.created_by != current_user.id and not current_user.is_admin():
+        return None
+    return job
+
+
+@app.route('/api/export-jobs', methods=['POST'])
+@login_required
+@limiter.limit("30 per minute")
+def api_create_export_job():
+    """
+    Queue an SAP export and return its job id right away.
+
+    Accepts the same fields as /export-sap-format (form or JSON): style_ids
+    and include_empty_vars. Poll /api/export-jobs/<job_id> for progress.
+    """
+    try:
+        data = request.get_json(silent=True)
+        if data is None:
+            style_ids = json.loads(request.form.get('style_ids', '[]'))
+            include_empty_vars = request.form.get('include_empty_vars', '0') == '1'
+        else:
+            style_ids = data.get('style_ids') or []
+            include_empty_vars = data.get('include_empty_vars') in (True, 1, '1')
+
+        if not isinstance(style_ids, list) or not style_ids:
+            return jsonify({'success': False, 'error': 'No styles selected'}), 400
+        try:
+            style_ids = [int(style_id) for style_id in style_ids]
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'style_ids must be a list of ids'}), 400
+
+        validation_errors = find_export_validation_errors(style_ids)
+        if validation_errors:
+            return jsonify({
+                'success': False,
+                'error': f'{len(validation_errors)} style(s) are missing required export fields',
+                'invalid_styles': validation_errors[:50]
+            }), 400
+
+        job = submit_export_job(style_ids, include_empty_vars, user_id=current_user.id)
+        return jsonify({
+            'success': True,
+            **job.to_dict(),
+            'status_url': url_for('api_export_job_status', job_id=job.id),
+            'download_url': url_for('api_export_job_download', job_id=job.id)
+        }), 202
+
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Error creating export job: {str(e)}")
+        return jsonify({'success': False, 'error': 'Could not start export'}), 500
+
+
+@app.route('/api/export-jobs/<job_id>', methods=['GET'])
+@login_required
+def api_export_job_status(job_id):
+    """Status and progress of one export job"""
+    job = _get_export_job_for_user(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Export job not found'}), 404
+    return jsonify({'success': True, **job.to_dict()})
+
+
+@app.route('/api/export-jobs/<job_id>/download', methods=['GET'])
+@login_required
+def api_export_job_download(job_id):
+    """
+    The finished CSV. Served with Range/If-Range support, so an interrupted
+    download resumes instead of re-running the export.
+    """
+    job = _get_export_job_for_user(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Export job not found'}), 404
+    if job.status != 'done':
+        return jsonify({'success': False, 'error': f'Export is {job.status}', **job.to_dict()}), 409
+    if job.is_expired() or not job.file_path or not os.path.exists(job.file_path):
+        return jsonify({'success': False, 'error': 'Export file has expired - please export again'}), 410
+
+    return send_file(
+        os.path.abspath(job.file_path),
+        mimetype='text/csv',
+        as_attachment=True,
+        download_name=job.filename,
+        conditional=True,
+        etag=job.id,
+        last_modified=job.finished_at,
+        max_age=0
+    )
+
+
 @app.route('/view-all-styles')
 @role_required('admin', 'user')
 def view_all_styles():
-    """View all styles with pagination - OPTIMIZED VERSION"""
+    """View all styles - first page rendered here, later pages from /api/styles/list"""
     
-    # Get pagination parameters
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 50, type=int)
+    per_page = request.args.get('per_page', LISTING_DEFAULT_PER_PAGE, type=int)
     
-    # Limit per_page to reasonable values
-    if per_page not in [25, 50, 100, 200]:
-        per_page = 50
-    
-    # ========================================
-    # LIGHTWEIGHT STATS (No eager loading)
-    # ========================================
-    total_styles = Style.query.count()
-    
-    # Cache label cost
-    label_setting = GlobalSetting.query.filter_by(setting_key='avg_label_cost').first()
-    label_cost = label_setting.setting_value if label_setting else 0.20
-    
-    # ========================================
-    # LOAD ALL STYLES (JavaScript handles pagination)
-    # ========================================
-    styles = Style.query.options(
-        joinedload(Style.style_fabrics).joinedload(StyleFabric.fabric),
-        joinedload(Style.style_notions).joinedload(StyleNotion.notion),
-        joinedload(Style.style_labor).joinedload(StyleLabor.labor_operation),
-        joinedload(Style.colors),
-        joinedload(Style.style_variables)
-    ).order_by(Style.updated_at.desc()).all()
-    
-    # Calculate stats from CURRENT PAGE only (fast)
-    page_total_value = sum(
-        s.get_total_fabric_cost() + 
-        s.get_total_notion_cost() + 
-        s.get_total_labor_cost() + 
-        label_cost 
-        for s in styles
-    ) if styles else 0
-    
-    avg_cost = page_total_value / len(styles) if styles else 0
+    listing = list_styles(per_page=per_page)
     
     # Get user permissions for frontend
     permissions = get_user_permissions()
     
     return render_template('view_all_styles.html', 
-                         styles=styles,
-                         total_styles=total_styles,
-                         total_value=page_total_value,
-                         avg_cost=avg_cost,
+                         styles=listing['styles'],
+                         total_styles=listing['total'],
+                         listing=listing,
                          permissions=permissions,
                          current_user=current_user,
-                         per_page=per_page)
+                         per_page=listing['per_page'])
+
+
+@app.route('/api/styles/list')
+@role_required('admin', 'user')
+def api_styles_list():
+    """
+    One page of the style listing, filtered and sorted in the database.
+
+    Query args: cursor (next_cursor / prev_cursor of the previous response),
+    per_page (25/50/100/200), sort, dir (asc/desc), total=estimate,
+    search, gender, garment_type, size_range, favorite, client_id,
+    min_cost, max_cost, min_margin, max_margin, updated_within_days
+    """
+    filters = listing_filters(request.args)
+    _, search_pattern = sanitize_search_query(request.args.get('search', ''))
+    if search_pattern:
+        filters['search'] = search_pattern
+    
+    try:
+        listing = list_styles(
+            cursor=request.args.get('cursor') or None,
+            per_page=request.args.get('per_page', LISTING_DEFAULT_PER_PAGE, type=int),
+            sort=request.args.get('sort'),
+            direction=request.args.get('dir'),
+            filters=filters,
+            with_total=request.args.get('total') == 'estimate'
+        )
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    for style in listing['styles']:
+        style['created_at'] = style['created_at'].isoformat() if style['created_at'] else None
+        style['updated_at'] = style['updated_at'].isoformat() if style['updated_at'] else None
+    
+    return jsonify(listing)
     
 @app.route('/api/style/delete/<int:style_id>', methods=['DELETE'])
 @limiter.limit("10 per minute")
@@ -3220,6 +3331,8 @@ def duplicate_style(style_id):
             )
             db.session.add(new_sv)
         
+        refresh_style_costs([new_style.id])
+        rebuild_sku_prices([new_style.id])
         db.session.commit()
         
         return jsonify({
@@ -3450,34 +3563,25 @@ def toggle_favorite(style_id):
 @login_required
 def master_costs():
     """Display editable master cost lists"""
-    fabrics = Fabric.query.order_by(Fabric.name).all()
-    notions = Notion.query.order_by(Notion.name).all()
-    labor_ops = LaborOperation.query.order_by(LaborOperation.name).all()
-    cleaning_costs = CleaningCost.query.order_by(CleaningCost.garment_type).all()
-    fabric_vendors = FabricVendor.query.order_by(FabricVendor.name).all()
-    notion_vendors = NotionVendor.query.order_by(NotionVendor.name).all()
+    master = get_master_data()
     colors = Color.query.order_by(Color.name).all()
     variables = Variable.query.order_by(Variable.name).all()
-    size_ranges = SizeRange.query.order_by(SizeRange.name).all()
     clients = Client.query.order_by(Client.bp_code).all()  # ADD THIS
     
-    global_settings = GlobalSetting.query.all()
-    
     # Get cleaning cost per minute for the modal
-    cleaning_rate_setting = GlobalSetting.query.filter_by(setting_key='cleaning_cost_per_minute').first()
-    cleaning_cost_per_minute = cleaning_rate_setting.setting_value if cleaning_rate_setting else 0.32
+    cleaning_cost_per_minute = master.setting('cleaning_cost_per_minute', 0.32)
 
     return render_template('master_costs.html',
-                         fabrics=fabrics,
-                         notions=notions,
-                         labor_costs=labor_ops, 
-                         cleaning_costs=cleaning_costs,
-                         fabric_vendors=fabric_vendors,
-                         notion_vendors=notion_vendors,
+                         fabrics=master.fabrics,
+                         notions=master.notions,
+                         labor_costs=master.labor_operations, 
+                         cleaning_costs=master.cleaning_costs,
+                         fabric_vendors=master.fabric_vendors,
+                         notion_vendors=master.notion_vendors,
                          colors=colors,
                          variables=variables,
-                         size_ranges=size_ranges,
-                         global_settings=global_settings,
+                         size_ranges=master.size_ranges,
+                         global_settings=master.global_settings,
                          cleaning_cost_per_minute=cleaning_cost_per_minute,
                          clients=clients)
 
@@ -3526,31 +3630,12 @@ def api_fabric_vendor_detail(vendor_id):
                     return jsonify({'error': 'Shipping cost cannot be negative'}), 400
                 vendor.f_ship_cost = f_ship_cost
             
-            db.session.commit()
-
             # Auto-update all styles using this vendor's fabrics
             if 'f_ship_cost' in data:
-                # Find all fabrics from this vendor
-                fabrics = Fabric.query.filter_by(fabric_vendor_id=vendor.id).all()
-                fabric_ids = [f.id for f in fabrics]
-                
-                if fabric_ids:
-                    # Find all styles using these fabrics
-                    affected_style_ids = db.session.query(StyleFabric.style_id).filter(
-                        StyleFabric.fabric_id.in_(fabric_ids)
-                    ).distinct().all()
-                    
-                    for (style_id,) in affected_style_ids:
-                        style = Style.query.get(style_id)
-                        if style and style.base_margin_percent:
-                            # Recalculate suggested_price based on new cost and stored margin
-                            new_cost = style.get_total_cost()
-                            margin = style.base_margin_percent / 100.0
-                            if margin < 1:  # Prevent division by zero
-                                style.suggested_price = round(new_cost / (1 - margin), 2)
-                    
-                    db.session.commit()
-                    app.logger.info(f"Auto-updated {len(affected_style_ids)} styles after f_ship_cost change for vendor {vendor.name}")
+                repriced = reprice('fabric_vendor', vendor.id)
+                app.logger.info(f"Auto-updated {repriced} styles after f_ship_cost change for vendor {vendor.name}")
+            
+            db.session.commit()
  
             # Log the update
             log_audit(
@@ -3575,7 +3660,12 @@ def api_fabric_vendor_detail(vendor_id):
             vendor_id_val = vendor.id
             old_values = {'name': vendor.name, 'code': vendor.vendor_code}
             
+            # Styles lose this vendor's shipping cost on their fabrics
+            affected_style_ids = styles_using('fabric_vendor', vendor.id)
+            
             db.session.delete(vendor)
+            db.session.flush()
+            reprice('fabric_vendor', vendor_id_val, style_ids=affected_style_ids)
             db.session.commit()
             
             # Log the delete
@@ -3794,6 +3884,7 @@ def api_fabric_detail(fabric_id):
                 'cost_per_yard': float(fabric.cost_per_yard) if fabric.cost_per_yard else None,
                 'vendor': fabric.fabric_vendor.name if fabric.fabric_vendor else None
             }
+            needs_reprice = False
             
             if 'name' in data:
                 name, error = validate_required_string(data.get('name'), 'Fabric name', max_length=100)
@@ -3810,19 +3901,12 @@ def api_fabric_detail(fabric_id):
                 
                 # Auto-update styles if cost changed
                 if old_cost != cost:
-                    affected_style_ids = db.session.query(StyleFabric.style_id).filter(
-                        StyleFabric.fabric_id == fabric.id
-                    ).distinct().all()
-                    
-                    for (style_id,) in affected_style_ids:
-                        style = Style.query.get(style_id)
-                        if style and style.base_margin_percent:
-                            new_cost = style.get_total_cost()
-                            margin = style.base_margin_percent / 100.0
-                            if margin < 1:
-                                style.suggested_price = round(new_cost / (1 - margin), 2)
+                    needs_reprice = True
             
             if 'fabric_vendor_id' in data:
+                # Vendor decides the shipping cost added to each yard line
+                if fabric.fabric_vendor_id != data.get('fabric_vendor_id'):
+                    needs_reprice = True
                 fabric.fabric_vendor_id = data.get('fabric_vendor_id')
 
             
@@ -3841,6 +3925,9 @@ def api_fabric_detail(fabric_id):
             if 'color' in data:
                 fabric.color = data.get('color', '').strip() if data.get('color') else None
             
+            if needs_reprice:
+                reprice('fabric', fabric.id)
+            
             db.session.commit()
             
             # Count affected styles
@@ -4031,17 +4118,7 @@ def api_notion_detail(notion_id):
                 
                 # Auto-update styles if cost changed
                 if old_cost != cost:
-                    affected_style_ids = db.session.query(StyleNotion.style_id).filter(
-                        StyleNotion.notion_id == notion.id
-                    ).distinct().all()
-                    
-                    for (style_id,) in affected_style_ids:
-                        style = Style.query.get(style_id)
-                        if style and style.base_margin_percent:
-                            new_cost = style.get_total_cost()
-                            margin = style.base_margin_percent / 100.0
-                            if margin < 1:
-                                style.suggested_price = round(new_cost / (1 - margin), 2)
+                    reprice('notion', notion.id)
             
             if 'notion_vendor_id' in data:
                 notion.notion_vendor_id = data.get('notion_vendor_id')
@@ -4209,6 +4286,7 @@ def api_labor_detail(labor_id):
                 'cost_per_hour': float(labor.cost_per_hour) if labor.cost_per_hour else None,
                 'cost_per_piece': float(labor.cost_per_piece) if labor.cost_per_piece else None
             }
+            old_rates = (labor.cost_type, labor.fixed_cost, labor.cost_per_hour, labor.cost_per_piece)
             
             if 'name' in data:
                 name, error = validate_required_string(data.get('name'), 'Labor operation name', max_length=100)
@@ -4230,22 +4308,7 @@ def api_labor_detail(labor_id):
                 cost, error = validate_positive_number(data.get('fixed_cost'), 'Fixed cost', required=False)
                 if error:
                     return jsonify({'success': False, 'error': error}), 400
-                old_cost = labor.fixed_cost
                 labor.fixed_cost = cost
-                
-                # Auto-update styles if cost changed
-                if old_cost != cost:
-                    affected_style_ids = db.session.query(StyleLabor.style_id).filter(
-                        StyleLabor.labor_operation_id == labor.id
-                    ).distinct().all()
-                    
-                    for (style_id,) in affected_style_ids:
-                        style = Style.query.get(style_id)
-                        if style and style.base_margin_percent:
-                            new_cost = style.get_total_cost()
-                            margin = style.base_margin_percent / 100.0
-                            if margin < 1:
-                                style.suggested_price = round(new_cost / (1 - margin), 2)
             
             if 'cost_per_hour' in data:
                 cost, error = validate_positive_number(data.get('cost_per_hour'), 'Cost per hour', required=False)
@@ -4259,6 +4322,10 @@ def api_labor_detail(labor_id):
                     return jsonify({'success': False, 'error': error}), 400
                 labor.cost_per_piece = cost
             
+            # Auto-update styles once every rate is applied (any of them moves the cost)
+            if (labor.cost_type, labor.fixed_cost, labor.cost_per_hour, labor.cost_per_piece) != old_rates:
+                reprice('labor_operation', labor.id)
+            
             db.session.commit()
             
             # Count affected styles
@@ -4430,6 +4497,7 @@ def api_cleaning_detail(cleaning_id):
                 'fixed_cost': float(cleaning.fixed_cost) if cleaning.fixed_cost else None,
                 'avg_minutes': cleaning.avg_minutes
             }
+            old_cleaning_cost = cleaning.fixed_cost
             
             if 'garment_type' in data:
                 garment_type, error = validate_required_string(data.get('garment_type'), 'Garment type', max_length=50)
@@ -4441,20 +4509,7 @@ def api_cleaning_detail(cleaning_id):
                 cost, error = validate_positive_number(data.get('fixed_cost'), 'Fixed cost')
                 if error:
                     return jsonify({'success': False, 'error': error}), 400
-                old_cost = cleaning.fixed_cost
                 cleaning.fixed_cost = cost
-                
-                # Auto-update styles if cost changed
-                if old_cost != cost:
-                    # Find styles with this garment type
-                    affected_styles = Style.query.filter_by(garment_type=cleaning.garment_type).all()
-                    
-                    for style in affected_styles:
-                        if style.base_margin_percent:
-                            new_cost = style.get_total_cost()
-                            margin = style.base_margin_percent / 100.0
-                            if margin < 1:
-                                style.suggested_price = round(new_cost / (1 - margin), 2)
             
             if 'avg_minutes' in data:
                 minutes, error = validate_positive_integer(data.get('avg_minutes'), 'Average minutes')
@@ -4462,6 +4517,10 @@ def api_cleaning_detail(cleaning_id):
                     return jsonify({'success': False, 'error': error}), 400
                 cleaning.avg_minutes = minutes
             
+            # Auto-update styles if cost changed (a rename moves styles between garment types)
+            if (cleaning.fixed_cost, cleaning.garment_type) != (old_cleaning_cost, old_values['garment_type']):
+                reprice('garment_type', {old_values['garment_type'], cleaning.garment_type})
+            
             db.session.commit()
 
             # Count affected styles
@@ -4499,6 +4558,8 @@ def api_cleaning_detail(cleaning_id):
             }
             
             db.session.delete(cleaning)
+            db.session.flush()
+            reprice('garment_type', cleaning_name)
             db.session.commit()
             
             # ✅ Log the delete
@@ -4560,6 +4621,10 @@ def api_add_cleaning():
             avg_minutes=avg_minutes
         )
         db.session.add(cleaning)
+        db.session.flush()
+        
+        # Styles of this garment type pick up the new cleaning cost
+        reprice('garment_type', garment_type)
         db.session.commit()
         
         # Log the create
@@ -4582,46 +4647,35 @@ def api_add_cleaning():
         return jsonify({'success': False, 'error': 'Failed to add cleaning cost'}), 500
     
 # ===== PLACEHOLDER ROUTES FOR FUTURE FEATURES =====
+def style_wizard_master_context():
+    """Dropdown data and defaults for the style wizard, from the shared master-data snapshot"""
+    master = get_master_data()
+
+    # Labor operations in the order the wizard displays them
+    labor_ops = []
+    for fragment in ('fus', 'marker', 'sewing', 'button'):
+        operation = master.find_labor_operation(fragment)
+        if operation:
+            labor_ops.append(operation)
+
+    return {
+        'fabric_vendors': master.fabric_vendors,
+        'notion_vendors': master.notion_vendors,
+        'fabrics': master.fabrics,
+        'notions': master.notions,
+        'labor_ops': labor_ops,
+        'garment_types': list(master.garment_types),
+        'size_ranges': master.size_ranges,
+        'default_label_cost': master.setting('avg_label_cost', 0.20),
+        'default_shipping_cost': master.setting('shipping_cost', 0.00),
+        'default_sublimation_cost': master.setting('sublimation_cost', 6.00),
+    }
+
 @app.route("/style/new")
 @login_required
 @admin_required  
 def style_wizard():
-    # Get all master data for dropdowns
-    fabric_vendors = FabricVendor.query.order_by(FabricVendor.name).all()
-    notion_vendors = NotionVendor.query.order_by(NotionVendor.name).all()
-    fabrics = Fabric.query.order_by(Fabric.name).all()
-    notions = Notion.query.order_by(Notion.name).all()
-    # Get labor operations in the order you want them displayed
-    # Get labor operations in the order you want them displayed
-    labor_ops=[]
-    fusion = LaborOperation.query.filter(LaborOperation.name.ilike('%fus%')).first()
-    if fusion: labor_ops.append(fusion)
-    marker = LaborOperation.query.filter(LaborOperation.name.ilike('%marker%')).first()
-    if marker: labor_ops.append(marker)
-    sewing = LaborOperation.query.filter(LaborOperation.name.ilike('%sewing%')).first()
-    if sewing: labor_ops.append(sewing)
-    button = LaborOperation.query.filter(LaborOperation.name.ilike('%button%')).first()
-    if button: labor_ops.append(button)
-    garment_types = [cc.garment_type for cc in CleaningCost.query.order_by(CleaningCost.garment_type).all()]
-    size_ranges = SizeRange.query.order_by(SizeRange.name).all()
-    label_cost_setting = GlobalSetting.query.filter_by(setting_key='avg_label_cost').first()
-    shipping_cost_setting = GlobalSetting.query.filter_by(setting_key='shipping_cost').first()
-    sublimation_cost_setting = GlobalSetting.query.filter_by(setting_key='sublimation_cost').first()
-    default_label_cost = label_cost_setting.setting_value if label_cost_setting else 0.20
-    default_shipping_cost = shipping_cost_setting.setting_value if shipping_cost_setting else 0.00
-    default_sublimation_cost = sublimation_cost_setting.setting_value if sublimation_cost_setting else 6.00
-
-    return render_template("style_wizard.html",
-                          fabric_vendors=fabric_vendors,
-                          notion_vendors=notion_vendors,
-                          fabrics=fabrics,
-                          notions=notions,
-                          labor_ops=labor_ops,
-                          garment_types=garment_types,
-                          size_ranges=size_ranges,
-                          default_label_cost=default_label_cost,
-                          default_shipping_cost=default_shipping_cost,
-                          default_sublimation_cost=default_sublimation_cost)
+    return render_template("style_wizard.html", **style_wizard_master_context())
 
 @app.route("/style/view")
 @role_required('admin', 'user')  # Both can view
@@ -4641,45 +4695,11 @@ def style_view():
         flash('Style not found.', 'danger')
         return redirect(url_for('view_all_styles'))
     
-    # Get all master data for display
-    fabric_vendors = FabricVendor.query.order_by(FabricVendor.name).all()
-    notion_vendors = NotionVendor.query.order_by(NotionVendor.name).all()
-    fabrics = Fabric.query.order_by(Fabric.name).all()
-    notions = Notion.query.order_by(Notion.name).all()
-
-    labor_ops = []
-    fusion = LaborOperation.query.filter(LaborOperation.name.ilike('%fus%')).first()
-    if fusion: labor_ops.append(fusion)
-    marker = LaborOperation.query.filter(LaborOperation.name.ilike('%marker%')).first()
-    if marker: labor_ops.append(marker)
-    sewing = LaborOperation.query.filter(LaborOperation.name.ilike('%sewing%')).first()
-    if sewing: labor_ops.append(sewing)
-    button = LaborOperation.query.filter(LaborOperation.name.ilike('%button%')).first()
-    if button: labor_ops.append(button)
-    garment_types = [cc.garment_type for cc in CleaningCost.query.order_by(CleaningCost.garment_type).all()]
-    size_ranges = SizeRange.query.order_by(SizeRange.name).all()
-    
-    label_cost_setting = GlobalSetting.query.filter_by(setting_key='avg_label_cost').first()
-    shipping_cost_setting = GlobalSetting.query.filter_by(setting_key='shipping_cost').first()
-    sublimation_cost_setting = GlobalSetting.query.filter_by(setting_key='sublimation_cost').first()
-    default_label_cost = label_cost_setting.setting_value if label_cost_setting else 0.20
-    default_shipping_cost = shipping_cost_setting.setting_value if shipping_cost_setting else 0.00
-    default_sublimation_cost = sublimation_cost_setting.setting_value if sublimation_cost_setting else 6.00
-
     # Get permissions
     permissions = get_user_permissions()
 
     return render_template("style_wizard.html",
-                          fabric_vendors=fabric_vendors,
-                          notion_vendors=notion_vendors,
-                          fabrics=fabrics,
-                          notions=notions,
-                          labor_ops=labor_ops,
-                          garment_types=garment_types,
-                          size_ranges=size_ranges,
-                          default_label_cost=default_label_cost,
-                          default_shipping_cost=default_shipping_cost,
-                          default_sublimation_cost=default_sublimation_cost,
+                          **style_wizard_master_context(),
                           permissions=permissions,
                           view_mode=not permissions['can_edit'])
 
@@ -4799,6 +4819,7 @@ def api_style_by_name():
 # VARIABLE ENDPOINTS
 @app.route('/api/variables', methods=['GET'])
 @login_required
+@conditional_get('variables')
 def api_variables_get():
     """Get all variables - any authenticated user"""
     variables = Variable.query.order_by(Variable.name).all()
@@ -4874,6 +4895,10 @@ def api_variable_modify(variable_id):
                     return jsonify({'success': False, 'error': error}), 400
                 variable.name = name
             
+            # A rename changes U_VARIABLE on every SKU of the styles using it
+            if variable.name != old_values['name']:
+                rebuild_sku_prices(styles_using('variable', variable.id))
+            
             db.session.commit()
             
             # Log the update
@@ -4897,21 +4922,21 @@ def api_variable_modify(variable_id):
             # Check if variable is used in any styles
             style_variables = StyleVariable.query.filter_by(variable_id=variable_id).all()
             if style_variables:
-                styles_using = []
+                styles_in_use = []
                 for sv in style_variables:
                     style = Style.query.get(sv.style_id)
                     if style:
-                        styles_using.append({
+                        styles_in_use.append({
                             'id': style.id,
                             'vendor_style': style.vendor_style,
                             'style_name': style.style_name
                         })
                 
-                style_list = ', '.join([s['vendor_style'] or s['style_name'] for s in styles_using])
+                style_list = ', '.join([s['vendor_style'] or s['style_name'] for s in styles_in_use])
                 return jsonify({
                     'success': False,
-                    'error': f'Cannot delete: This variable is used in {len(styles_using)} style(s): {style_list}',
-                    'styles_using': styles_using
+                    'error': f'Cannot delete: This variable is used in {len(styles_in_use)} style(s): {style_list}',
+                    'styles_using': styles_in_use
                 }), 400
             
             # Capture info BEFORE delete
@@ -4944,6 +4969,7 @@ def api_variable_modify(variable_id):
 
 @app.route('/api/clients', methods=['GET'])
 @login_required
+@conditional_get('clients')
 def api_clients_get():
     """Get all clients - searchable by code or name"""
     search = request.args.get('search', '').strip()
@@ -5139,6 +5165,7 @@ def search_styles():
 
 @app.get("/api/style/by-vendor-style")
 @login_required
+@conditional_get('styles', 'style_details', 'master_data', 'colors', 'variables', 'clients')
 def api_style_by_vendor_style():
     """Load style by vendor_style code"""
     vendor_style = (request.args.get("vendor_style") or "").strip()
@@ -5303,6 +5330,60 @@ def api_style_by_vendor_style():
     }), 200
 
 
+# ===== BATCH SKU PRICE LOOKUP (integrations) =====
+SKU_PRICE_BATCH_LIMIT = 5000
+
+@app.get("/api/csrf-token")
+@login_required
+def api_csrf_token():
+    """CSRF token for the logged-in session - for scripted clients of POST endpoints"""
+    return jsonify({"csrf_token": generate_csrf()})
+
+
+@app.post("/api/sku-prices")
+@limiter.limit("600 per minute")
+@login_required
+def api_sku_prices():
+    """
+    Price many SKUs in one call from the in-memory SKU index.
+
+    Body: {"skus": [{"vendor_style": "44217-A", "color": "NAVY", "size": "3XL", "variable": "TALL"}, ...]}
+    Results come back in request order; unknown SKUs have "found": false.
+    Like every POST it needs the session's CSRF token in X-CSRFToken -
+    pages have it in the csrf-token meta tag, scripts get it from
+    GET /api/csrf-token.
+    """
+    data = request.get_json(silent=True) or {}
+    skus = data.get("skus")
+    if not isinstance(skus, list) or not skus:
+        return jsonify({"error": "skus must be a non-empty list"}), 400
+    if len(skus) > SKU_PRICE_BATCH_LIMIT:
+        return jsonify({"error": f"At most {SKU_PRICE_BATCH_LIMIT} SKUs per request"}), 400
+
+    keys = []
+    for sku in skus:
+        if not isinstance(sku, dict):
+            return jsonify({"error": "Each SKU must be an object with vendor_style, color and size"}), 400
+        keys.append((str(sku.get("vendor_style") or ""), str(sku.get("color") or ""),
+                     str(sku.get("size") or ""), str(sku.get("variable") or "")))
+
+    prices = []
+    for (vendor_style, color, size, variable), result in zip(keys, lookup_sku_prices(keys)):
+        if result is None:
+            prices.append({"vendor_style": vendor_style, "color": color, "size": size,
+                           "variable": variable, "price": None, "found": False})
+        else:
+            prices.append({"vendor_style": result.vendor_style, "color": result.color, "size": result.size,
+                           "variable": result.variable, "price": result.price, "found": True})
+
+    return jsonify({
+        "success": True,
+        "count": len(prices),
+        "found": sum(1 for p in prices if p["found"]),
+        "prices": prices,
+    }), 200
+
+
 # ===== ENHANCED /api/style/save WITH FULL VALIDATION =====
 
 @app.post("/api/style/save")
@@ -5673,6 +5754,8 @@ def api_style_save():
 
         # ===== STEP 13: COMMIT ALL CHANGES =====
         style.updated_at = datetime.now()
+        refresh_style_costs([style.id])
+        rebuild_sku_prices([style.id])
         db.session.commit()
 
         # ===== STEP 14: LOG AUDIT =====
@@ -6423,6 +6506,8 @@ def import_excel():
                                 break  # Only process one finishing entry
                 
                 # Commit after each style
+                refresh_style_costs([current_style.id])
+                rebuild_sku_prices([current_style.id])
                 db.session.commit()
                 
             except Exception as e:
@@ -6452,8 +6537,9 @@ def import_excel():
 
 
 # Initialize cleanup scheduler (works for both dev and production)
-if not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
-    init_cleanup_scheduler()
+# Not in export worker processes (parallel_export.py) - they re-import the main module
+if (not app.debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true') and multiprocessing.parent_process() is None:
+    init_invalidation_bus(app, init_cleanup_scheduler())
 
 # ===== APPLICATION STARTUP =====
 if __name__ == '__main__':
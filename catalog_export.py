@@ -0,0 +1,96 @@
+# catalog_export.py - Style catalog spreadsheet export for J.A. Uniforms Pricing Tool
+#
+# Every style with its cost rollup as an XLSX, written with openpyxl's
+# write-only mode: rows are read in keyset batches of plain columns (no ORM
+# objects) and streamed into the sheet, so memory stays constant whether the
+# catalog has 500 styles or 100k.
+
+from database import db
+from models import Style, StyleCost, ensure_style_costs
+
+CATALOG_BATCH_SIZE = 1000
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# (header, column width)
+CATALOG_COLUMNS = [
+    ('Vendor Style', 16),
+    ('Style Name', 40),
+    ('Gender', 10),
+    ('Garment Type', 16),
+    ('Size Range', 14),
+    ('Fabric Cost', 12),
+    ('Notion Cost', 12),
+    ('Labor Cost', 12),
+    ('Total Cost', 12),
+    ('Margin %', 10),
+    ('Suggested Price', 15),
+    ('Modified', 18),
+]
+
+
+def catalog_style_ids():
+    """Every style id in export order"""
+    return [style_id for (style_id,) in db.session.query(Style.id).order_by(Style.id).all()]
+
+
+def iter_catalog_batches(batch_size=CATALOG_BATCH_SIZE):
+    """Catalog rows in CATALOG_COLUMNS order, one list per batch (keyset on styles.id)"""
+    ensure_style_costs()
+    last_id = 0
+    while True:
+        rows = db.session.query(
+            Style.id, Style.vendor_style, Style.style_name, Style.gender, Style.garment_type, Style.size_range,
+            StyleCost.fabric_cost, StyleCost.notion_cost, StyleCost.labor_cost, StyleCost.total_cost,
+            Style.base_margin_percent, Style.suggested_price, Style.updated_at
+        ).outerjoin(
+            StyleCost, StyleCost.style_id == Style.id
+        ).filter(
+            Style.id > last_id
+        ).order_by(Style.id).limit(batch_size).all()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [[
+            vendor_style, style_name, gender, garment_type, size_range,
+            _money(fabric), _money(notion), _money(labor), _money(total),
+            margin, _money(suggested), updated_at
+        ] for (_, vendor_style, style_name, gender, garment_type, size_range,
+               fabric, notion, labor, total, margin, suggested, updated_at) in rows]
+
+
+def _money(value):
+    return round(value, 2) if value is not None else None
+
+
+def write_catalog_xlsx(path):
+    """Write the catalog workbook to `path`. Returns the number of styles written."""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, PatternFill
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Styles')
+    ws.freeze_panes = 'A2'
+    for col, (_, width) in enumerate(CATALOG_COLUMNS, 1):
+        ws.column_dimensions[get_column_letter(col)].width = width
+
+    header_fill = PatternFill(start_color="4472C4", end_color="4472C4", fill_type="solid")
+    header_font = Font(bold=True, color="FFFFFF")
+    header = []
+    for title, _ in CATALOG_COLUMNS:
+        cell = WriteOnlyCell(ws, value=title)
+        cell.fill = header_fill
+        cell.font = header_font
+        header.append(cell)
+    ws.append(header)
+
+    written = 0
+    for rows in iter_catalog_batches():
+        for row in rows:
+            ws.append(row)
+        written += len(rows)
+
+    wb.save(path)
+    return written
@@ -0,0 +1,325 @@
+# costing.py - Costing kernel for J.A. Uniforms Pricing Tool
+#
+# Pure cost math with no ORM or session access. Everything works on plain
+# tuples/floats so the Style model methods, bulk list views, exports and
+# repricing loops all share ONE implementation of the pricing rules.
+#
+# Rounding rule: money is rounded to cents with Python's round(x, 2) on the
+# float. _round_cents is the vectorized twin and round_cents_sql() the SQL
+# twin used by set-based repricing (flat label/shipping changes, SKU prices).
+# Both decide a value near a half cent by its exact binary value, like
+# round() does. Never a decimal ROUND(CAST(x AS NUMERIC), 2) - that rounds
+# the shortest decimal form half-up, so 2.675 (really 2.67499...) would
+# become 2.68 instead of 2.67.
+
+from collections import namedtuple
+
+import numpy as np
+from sqlalchemy import BigInteger, Float, case, cast, func, literal
+
+# Veltkamp splitter (2**27 + 1): splits a double into two 26-bit halves
+_SPLITTER = 134217729.0
+
+# ===== DEFAULTS (used when a global setting is missing) =====
+DEFAULT_SUBLIMATION_COST = 6.00
+DEFAULT_LABEL_COST = 0.20
+DEFAULT_SHIPPING_COST = 0.00
+DEFAULT_MARGIN_PERCENT = 60.0
+MAX_RETAIL_MARGIN = 0.99
+
+# Global settings that feed style costs (a change reprices styles)
+COST_SETTING_KEYS = ('sublimation_cost', 'avg_label_cost', 'shipping_cost', 'cleaning_cost_per_minute')
+
+# ===== BOM LINE SHAPES =====
+# Field order matters - callers may pass plain tuples in this order.
+FabricLine = namedtuple('FabricLine', ['yards', 'cost_per_yard', 'is_sublimation', 'ship_cost'])
+NotionLine = namedtuple('NotionLine', ['quantity', 'cost_per_unit'])
+LaborLine = namedtuple('LaborLine', [
+    'cost_type', 'fixed_cost', 'cost_per_hour', 'cost_per_piece', 'time_hours', 'quantity'
+])
+
+# Result of costing one style. `labor` includes `cleaning`, exactly like
+# Style.get_total_labor_cost(); `cleaning` is broken out for reporting.
+CostBreakdown = namedtuple('CostBreakdown', [
+    'fabric', 'notion', 'labor', 'cleaning', 'label', 'shipping', 'total'
+])
+
+
+def settings_costs(settings):
+    """Return (sublimation_cost, label_cost, shipping_cost) from a settings dict"""
+    return (
+        settings.get('sublimation_cost', DEFAULT_SUBLIMATION_COST),
+        settings.get('avg_label_cost', DEFAULT_LABEL_COST),
+        settings.get('shipping_cost', DEFAULT_SHIPPING_COST),
+    )
+
+
+def fabric_line_cost(yards, cost_per_yard, is_sublimation, ship_cost, sublimation_cost=DEFAULT_SUBLIMATION_COST):
+    """Cost of one fabric line: yardage + sublimation upcharge + vendor shipping"""
+    cost = yards * cost_per_yard
+    if is_sublimation:
+        cost += sublimation_cost * yards
+    if ship_cost:
+        cost += ship_cost
+    return cost
+
+
+def fabric_cost(lines, sublimation_cost=DEFAULT_SUBLIMATION_COST):
+    """Total fabric cost for an iterable of FabricLine tuples"""
+    total = 0
+    for yards, cost_per_yard, is_sublimation, ship_cost in lines:
+        total += fabric_line_cost(yards, cost_per_yard, is_sublimation, ship_cost, sublimation_cost)
+    return round(total, 2)
+
+
+def notion_cost(lines):
+    """Total notion cost for an iterable of NotionLine tuples"""
+    total = 0
+    for quantity, cost_per_unit in lines:
+        total += float(quantity) * cost_per_unit
+    return round(total, 2)
+
+
+def labor_line_cost(cost_type, fixed_cost, cost_per_hour, cost_per_piece, time_hours, quantity):
+    """Cost of one labor line based on the operation's cost_type"""
+    if cost_type == 'flat_rate':
+        return (fixed_cost or 0) * (quantity or 0)
+    elif cost_type == 'hourly':
+        return (cost_per_hour or 0) * (time_hours or 0)
+    elif cost_type == 'per_piece':
+        return (cost_per_piece or 0) * (quantity or 0)
+    return 0
+
+
+def labor_cost(lines, cleaning_cost=0):
+    """Total labor cost (operations + cleaning) for an iterable of LaborLine tuples"""
+    total = 0
+    for line in lines:
+        total += labor_line_cost(*line)
+    if cleaning_cost:
+        total += cleaning_cost
+    return round(total, 2)
+
+
+def total_cost(fabric, notion, labor, label_cost=DEFAULT_LABEL_COST, shipping_cost=DEFAULT_SHIPPING_COST):
+    """Total cost from already-rounded component totals"""
+    return fabric + notion + labor + label_cost + shipping_cost
+
+
+def cost_style(fabric_lines, notion_lines, labor_lines, cleaning_cost, settings):
+    """
+    Cost one style from plain BOM lines.
+
+    `cleaning_cost` is the garment type's fixed cleaning cost (or None) and
+    `settings` is a {setting_key: value} dict of global settings.
+    """
+    sublimation, label, shipping = settings_costs(settings)
+    cleaning = cleaning_cost or 0
+    fabric = fabric_cost(fabric_lines, sublimation)
+    notion = notion_cost(notion_lines)
+    labor = labor_cost(labor_lines, cleaning)
+    return CostBreakdown(
+        fabric=fabric,
+        notion=notion,
+        labor=labor,
+        cleaning=cleaning,
+        label=label,
+        shipping=shipping,
+        total=total_cost(fabric, notion, labor, label, shipping)
+    )
+
+
+def retail_price(cost, margin_percent, size_multiplier=1.0):
+    """Retail price at a margin - caps margin at 99% (same as Style.get_retail_price)"""
+    base_cost = cost * size_multiplier
+    margin = (margin_percent if margin_percent is not None else DEFAULT_MARGIN_PERCENT) / 100.0
+    if margin >= MAX_RETAIL_MARGIN:
+        margin = MAX_RETAIL_MARGIN
+    return round(base_cost / (1 - margin), 2)
+
+
+def suggested_price(cost, margin_percent):
+    """
+    Suggested price used when master costs change.
+    Returns None when the style has no margin (price is left untouched).
+    """
+    if not margin_percent:
+        return None
+    margin = margin_percent / 100.0
+    if margin >= 1:
+        return None
+    return round(cost / (1 - margin), 2)
+
+
+# =============================================================================
+# VECTORIZED WHOLE-CATALOG COSTING (NumPy group-by sums)
+# =============================================================================
+
+def _column(rows, index, dtype=float):
+    """Pull one column out of a list of row tuples - None becomes 0"""
+    return np.array([row[index] or 0 for row in rows], dtype=dtype)
+
+
+def _round_cents(values):
+    """
+    Round to cents exactly like Python's round(x, 2).
+
+    np.round scales by 100 first, which can send a value sitting on a half
+    cent the other way - those few are re-rounded in Python.
+    """
+    rounded = np.round(values, 2)
+    ties = np.flatnonzero(np.abs((values * 100) % 1 - 0.5) < 1e-6)
+    for pos in ties:
+        rounded[pos] = round(float(values[pos]), 2)
+    return rounded
+
+
+def round_cents_sql(value, dialect_name):
+    """
+    SQL expression rounding non-negative `value` to cents exactly like
+    Python's round(value, 2), in plain double arithmetic on PostgreSQL and
+    SQLite (whose own ROUND() functions disagree with it and each other).
+
+    value * 100 is itself rounded, so it cannot tell which side of a half
+    cent the value is on. The sign of 200 * value - (2 * cents + 1) is
+    computed exactly instead: value is split into two 26-bit halves whose
+    products by 200 need no rounding.
+    """
+    # SQLite's CAST truncates; PostgreSQL's rounds, so it needs floor()
+    cents = value * 100
+    whole = cast(cents, BigInteger) if dialect_name == 'sqlite' else func.floor(cents)
+
+    scaled = value * literal(_SPLITTER, Float)
+    high = scaled - (scaled - value)
+    low = value - high
+    excess = (high * 200 - (whole * 2 + 1)) + low * 200
+    step = case(
+        (excess > 0, 1),
+        (excess < 0, 0),
+        else_=cast(whole, BigInteger) % 2  # exact half cent: to even, like round()
+    )
+    return (whole + step) / literal(100.0, Float)
+
+
+def _group_sum(positions, values, size):
+    """Sum `values` into `size` buckets keyed by `positions` (a group-by sum)"""
+    if not len(positions):
+        return np.zeros(size)
+    return np.bincount(positions, weights=values, minlength=size)
+
+
+class CatalogCosts:
+    """
+    Cost components for many styles held as parallel NumPy arrays.
+
+    Arrays are aligned with `style_ids` (sorted ascending). Same rules and
+    rounding as cost_style(), just computed for every style in one pass.
+    """
+
+    def __init__(self, style_ids, fabric, notion, labor, cleaning, label, shipping):
+        self.style_ids = style_ids
+        self.fabric = fabric
+        self.notion = notion
+        self.labor = labor
+        self.cleaning = cleaning
+        self.label = label
+        self.shipping = shipping
+        self.total = fabric + notion + labor + label + shipping
+
+    def __len__(self):
+        return len(self.style_ids)
+
+    def _position(self, style_id):
+        pos = int(np.searchsorted(self.style_ids, style_id))
+        if pos < len(self.style_ids) and self.style_ids[pos] == style_id:
+            return pos
+        return None
+
+    def get(self, style_id):
+        """CostBreakdown for one style, or None if it was not costed"""
+        pos = self._position(style_id)
+        if pos is None:
+            return None
+        return CostBreakdown(
+            fabric=float(self.fabric[pos]),
+            notion=float(self.notion[pos]),
+            labor=float(self.labor[pos]),
+            cleaning=float(self.cleaning[pos]),
+            label=self.label,
+            shipping=self.shipping,
+            total=float(self.total[pos])
+        )
+
+    def totals_by_id(self):
+        """{style_id: total_cost} for templates"""
+        return dict(zip(self.style_ids.tolist(), self.total.tolist()))
+
+
+def catalog_costs(style_rows, fabric_rows, notion_rows, labor_rows, cleaning_map, settings):
+    """
+    Cost a whole catalog from flat rows with NumPy group-by sums.
+
+    style_rows:  (style_id, garment_type)
+    fabric_rows: (style_id, yards, cost_per_yard, is_sublimation, ship_cost)
+    notion_rows: (style_id, quantity, cost_per_unit)
+    labor_rows:  (style_id, cost_type, fixed_cost, cost_per_hour, cost_per_piece, time_hours, quantity)
+    """
+    sublimation, label, shipping = settings_costs(settings)
+
+    order = sorted(style_rows, key=lambda row: row[0])
+    style_ids = np.array([row[0] for row in order], dtype=np.int64)
+    size = len(style_ids)
+
+    def positions(rows):
+        # BOM rows for styles outside style_rows are dropped
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        pos = np.searchsorted(style_ids, ids)
+        pos = np.minimum(pos, max(size - 1, 0))
+        keep = style_ids[pos] == ids if size else np.zeros(len(ids), dtype=bool)
+        return pos[keep], keep
+
+    # Fabric: yards * price + sublimation upcharge + vendor shipping
+    fabric = np.zeros(size)
+    if fabric_rows and size:
+        pos, keep = positions(fabric_rows)
+        yards = _column(fabric_rows, 1)[keep]
+        line = (yards * _column(fabric_rows, 2)[keep]
+                + _column(fabric_rows, 3, dtype=bool)[keep] * sublimation * yards
+                + _column(fabric_rows, 4)[keep])
+        fabric = _group_sum(pos, line, size)
+
+    # Notions: quantity * unit price
+    notion = np.zeros(size)
+    if notion_rows and size:
+        pos, keep = positions(notion_rows)
+        line = _column(notion_rows, 1)[keep] * _column(notion_rows, 2)[keep]
+        notion = _group_sum(pos, line, size)
+
+    # Labor: rate picked by cost_type
+    labor_ops = np.zeros(size)
+    if labor_rows and size:
+        pos, keep = positions(labor_rows)
+        cost_type = np.array([row[1] for row in labor_rows], dtype=object)[keep]
+        line = np.select(
+            [cost_type == 'flat_rate', cost_type == 'hourly', cost_type == 'per_piece'],
+            [_column(labor_rows, 2)[keep] * _column(labor_rows, 6)[keep],
+             _column(labor_rows, 3)[keep] * _column(labor_rows, 5)[keep],
+             _column(labor_rows, 4)[keep] * _column(labor_rows, 6)[keep]],
+            default=0.0
+        )
+        labor_ops = _group_sum(pos, line, size)
+
+    cleaning = np.array(
+        [(cleaning_map.get(row[1]) or 0) if row[1] else 0 for row in order],
+        dtype=float
+    )
+
+    return CatalogCosts(
+        style_ids=style_ids,
+        fabric=_round_cents(fabric),
+        notion=_round_cents(notion),
+        labor=_round_cents(labor_ops + cleaning),
+        cleaning=cleaning,
+        label=label,
+        shipping=shipping
+    )
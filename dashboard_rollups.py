@@ -0,0 +1,376 @@
+# dashboard_rollups.py - Precomputed dashboard snapshot for J.A. Uniforms Pricing Tool
+#
+# The dashboard page, /api/dashboard-stats and /api/dashboard-charts used to
+# recount the catalog, cost every style and rebuild the trend queries on every
+# load. All of it is now built here into one JSON row of dashboard_rollups:
+# rebuilt on a schedule, and soon after any committed write that can change a
+# number (nudged through the session hooks and the invalidation bus). The
+# endpoints just read the row.
+#
+# Every process gets the nudge, but only one rebuilds: the rebuild locks the
+# rollup row (SELECT ... FOR UPDATE) and skips when the stored snapshot was
+# already built after the nudge arrived. refreshed_at is the moment the build
+# started reading, so a write that lands mid-build still triggers another.
+
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, event, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+import invalidation
+from database import db
+from models import (
+    DashboardRollup, Style, StyleCost, StyleFabric, StyleNotion, StyleLabor,
+    Fabric, Notion, FabricVendor, NotionVendor, LaborOperation, CleaningCost, GlobalSetting,
+    ensure_style_costs, load_catalog_costs
+)
+from sampling import sample_ids
+
+DASHBOARD_ROLLUP = 'dashboard'
+
+# Full rebuild interval (also keeps "this week" numbers moving without writes)
+DASHBOARD_REFRESH_MINUTES = int(os.environ.get('DASHBOARD_REFRESH_MINUTES', 15))
+
+# How often a pending nudge is turned into a rebuild - writes in a burst
+# coalesce into one rebuild
+DASHBOARD_NUDGE_SECONDS = int(os.environ.get('DASHBOARD_NUDGE_SECONDS', 10))
+
+# Writes to these tables can change a dashboard number (counts, or the
+# style costs behind the cost charts)
+DASHBOARD_MODELS = (
+    Style, StyleCost, StyleFabric, StyleNotion, StyleLabor,
+    Fabric, Notion, FabricVendor, NotionVendor, LaborOperation, CleaningCost, GlobalSetting
+)
+
+# Used only when the style_costs rollup is still incomplete after the
+# backfill (styles added while it ran)
+DASHBOARD_SAMPLE_SIZE = 100
+DASHBOARD_SAMPLE_SEED = 42
+
+COST_BUCKET_LABELS = ['$0-20', '$20-40', '$40-60', '$60-80', '$80-100', '$100+']
+COST_BUCKET_EDGES = [20, 40, 60, 80, 100]
+
+_state = {'nudged_at': None}  # latest write nudge not yet covered by a rebuild
+_lock = threading.Lock()
+
+
+# =============================================================================
+# BUILD
+# =============================================================================
+
+def _label_cost():
+    label_setting = GlobalSetting.query.filter_by(setting_key='avg_label_cost').first()
+    return label_setting.setting_value if label_setting else 0.20
+
+
+def _month_bucket(column):
+    """First day of the month of `column`, on PostgreSQL and SQLite"""
+    if db.session.get_bind().dialect.name == 'sqlite':
+        return func.strftime('%Y-%m-01', column)
+    return func.date_trunc('month', column)
+
+
+def _as_date(value):
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def _cost_stats(total_styles, label_cost):
+    """
+    (average, min, max) style cost excluding shipping (fabric + notions +
+    labor + label). Exact from the style_costs rollup: styles without a
+    rollup row yet (fresh import) are backfilled first. Only if some are
+    still missing after that is it estimated from a fixed-seed sample, so
+    the numbers don't jump between rebuilds.
+    """
+    if total_styles == 0:
+        return 0, 0, 0
+
+    covered = db.session.query(func.count(StyleCost.style_id)).scalar()
+    if covered < total_styles:
+        ensure_style_costs()
+        covered = db.session.query(func.count(StyleCost.style_id)).scalar()
+    if covered >= total_styles:
+        cost = StyleCost.total_cost - StyleCost.shipping_cost
+        avg_cost, min_cost, max_cost = db.session.query(
+            func.avg(cost), func.min(cost), func.max(cost)
+        ).one()
+        return avg_cost or 0, min_cost or 0, max_cost or 0
+
+    catalog = load_catalog_costs(sample_ids(Style.id, DASHBOARD_SAMPLE_SIZE, seed=DASHBOARD_SAMPLE_SEED))
+    if not len(catalog):
+        return 0, 0, 0
+    costs = catalog.fabric + catalog.notion + catalog.labor + label_cost
+    return float(costs.mean()), float(costs.min()), float(costs.max())
+
+
+def _chart_data(label_cost):
+    # Cost distribution - one GROUP BY over the style_costs rollup, same cost
+    # as _cost_stats (fabric + notions + labor + label)
+    cost = StyleCost.total_cost - StyleCost.shipping_cost
+    bucket = case(
+        *[(cost < edge, index) for index, edge in enumerate(COST_BUCKET_EDGES)],
+        else_=len(COST_BUCKET_EDGES)
+    )
+    bucket_counts = dict(db.session.query(bucket, func.count()).group_by(bucket).all())
+    cost_buckets = {label: bucket_counts.get(index, 0) for index, label in enumerate(COST_BUCKET_LABELS)}
+
+    # Top fabrics (most used)
+    top_fabrics_query = db.session.query(
+        Fabric.name,
+        func.count(StyleFabric.fabric_id).label('count')
+    ).join(
+        StyleFabric, Fabric.id == StyleFabric.fabric_id
+    ).group_by(
+        Fabric.name
+    ).order_by(
+        func.count(StyleFabric.fabric_id).desc()
+    ).limit(6).all()
+
+    # Cost breakdown (avg per category)
+    style_count, avg_fabric, avg_labor, avg_notion = db.session.query(
+        func.count(StyleCost.style_id), func.avg(StyleCost.fabric_cost),
+        func.avg(StyleCost.labor_cost), func.avg(StyleCost.notion_cost)
+    ).one()
+    if style_count > 0:
+        avg_label = label_cost
+    else:
+        avg_fabric = avg_labor = avg_notion = avg_label = 0
+
+    # Activity trend - styles created per month over the last 6 months
+    six_months_ago = datetime.now() - timedelta(days=180)
+    month = _month_bucket(Style.created_at)
+    monthly_counts = db.session.query(
+        month.label('month'),
+        func.count(Style.id).label('count')
+    ).filter(
+        Style.created_at >= six_months_ago
+    ).group_by(month).order_by(month).all()
+
+    activity_trend = {
+        'labels': [_as_date(m[0]).strftime('%b %Y') if m[0] else 'Unknown' for m in monthly_counts],
+        'values': [m[1] for m in monthly_counts]
+    }
+    if not activity_trend['labels']:
+        activity_trend = {'labels': ['No Data'], 'values': [0]}
+
+    # Quick insights
+    one_week_ago = datetime.now() - timedelta(days=7)
+    new_this_week = Style.query.filter(Style.created_at >= one_week_ago).count()
+
+    # Average margin (styles with no margin set are skipped)
+    avg_margin = db.session.query(func.avg(Style.base_margin_percent)).filter(
+        Style.base_margin_percent.isnot(None),
+        Style.base_margin_percent != 0
+    ).scalar() or 60  # Default
+
+    most_active_query = db.session.query(
+        func.date(Style.created_at).label('date'),
+        func.count(Style.id).label('count')
+    ).group_by(
+        func.date(Style.created_at)
+    ).order_by(
+        func.count(Style.id).desc()
+    ).first()
+    most_active = (_as_date(most_active_query[0]).strftime('%b %d')
+                   if most_active_query and most_active_query[0] else 'N/A')
+
+    # Price sweet spot (most common price range)
+    max_bucket = max(cost_buckets, key=cost_buckets.get)
+
+    return {
+        'cost_distribution': {
+            'labels': list(cost_buckets.keys()),
+            'values': list(cost_buckets.values())
+        },
+        'top_fabrics': {
+            'labels': [f[0][:15] + '...' if len(f[0]) > 15 else f[0] for f in top_fabrics_query],
+            'values': [f[1] for f in top_fabrics_query]
+        },
+        'cost_breakdown': {
+            'labels': ['Fabric', 'Labor', 'Notions', 'Labels'],
+            'values': [round(avg_fabric, 2), round(avg_labor, 2), round(avg_notion, 2), round(avg_label, 2)]
+        },
+        'activity_trend': activity_trend,
+        'insights': [
+            f"📈 Trending: +{new_this_week} styles this week",
+            f"💹 Avg profit margin: {avg_margin:.0f}%",
+            f"🔥 Most active: {most_active}",
+            f"💰 Price sweet spot: {max_bucket}",
+            f"📦 Total styles: {style_count}"
+        ]
+    }
+
+
+def build_dashboard_rollup():
+    """Every number the dashboard endpoints show, as a JSON-ready dict"""
+    label_cost = _label_cost()
+    total_styles = Style.query.count()
+
+    one_week_ago = datetime.now() - timedelta(days=7)
+    recent_styles = db.session.query(
+        Style.id, Style.vendor_style, Style.style_name, Style.updated_at
+    ).order_by(Style.updated_at.desc()).limit(4).all()
+
+    avg_cost, min_cost, max_cost = _cost_stats(total_styles, label_cost)
+
+    top_fabric_query = db.session.query(
+        Fabric.name,
+        func.count(StyleFabric.fabric_id).label('count')
+    ).join(
+        StyleFabric, Fabric.id == StyleFabric.fabric_id
+    ).group_by(
+        Fabric.name
+    ).order_by(
+        func.count(StyleFabric.fabric_id).desc()
+    ).first()
+
+    return {
+        'total_styles': total_styles,
+        'total_fabrics': Fabric.query.count(),
+        'total_notions': Notion.query.count(),
+        'total_fabric_vendors': FabricVendor.query.count(),
+        'total_notion_vendors': NotionVendor.query.count(),
+        'new_this_week': Style.query.filter(Style.created_at >= one_week_ago).count(),
+        'recent_styles': [{
+            'id': style_id,
+            'vendor_style': vendor_style,
+            'style_name': style_name,
+            'updated_at': updated_at.isoformat() if updated_at else None
+        } for style_id, vendor_style, style_name, updated_at in recent_styles],
+        'avg_cost': round(avg_cost, 2),
+        'price_range': f"${min_cost:.0f}-${max_cost:.0f}",
+        'top_fabric': top_fabric_query[0] if top_fabric_query else "N/A",
+        'charts': _chart_data(label_cost),
+    }
+
+
+# =============================================================================
+# STORE / READ
+# =============================================================================
+
+def _clear_nudge(covered_until):
+    """Forget the pending nudge if a build starting at `covered_until` saw it"""
+    with _lock:
+        if _state['nudged_at'] is not None and _state['nudged_at'] <= covered_until:
+            _state['nudged_at'] = None
+
+
+def refresh_dashboard_rollup(newer_than=None):
+    """
+    Rebuild and commit the snapshot. Returns the new data, or None when
+    `newer_than` is given and the stored snapshot was built after it
+    (another process got there first).
+    """
+    # Concurrent rebuilds queue on the row lock, then see the fresh snapshot
+    row = db.session.query(DashboardRollup).filter(
+        DashboardRollup.name == DASHBOARD_ROLLUP
+    ).with_for_update().one_or_none()
+    if newer_than is not None and row is not None and row.refreshed_at >= newer_than:
+        db.session.rollback()
+        _clear_nudge(row.refreshed_at)
+        return None
+
+    started_at = datetime.now()
+    started = time.monotonic()
+    data = build_dashboard_rollup()
+    build_ms = int((time.monotonic() - started) * 1000)
+
+    if row is None:
+        row = DashboardRollup(name=DASHBOARD_ROLLUP)
+        db.session.add(row)
+    row.data = json.dumps(data)
+    row.refreshed_at = started_at
+    row.build_ms = build_ms
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another process stored the first snapshot at the same moment
+        db.session.rollback()
+    _clear_nudge(started_at)
+    return data
+
+
+def get_dashboard_rollup():
+    """
+    The current snapshot. Built on the spot only when there is none yet
+    (fresh database) - after that the scheduler keeps it current.
+    """
+    data = db.session.query(DashboardRollup.data).filter(
+        DashboardRollup.name == DASHBOARD_ROLLUP
+    ).scalar()
+    if data is None:
+        return refresh_dashboard_rollup()
+    return json.loads(data)
+
+
+def mark_dashboard_stale():
+    with _lock:
+        _state['nudged_at'] = datetime.now()
+
+
+def refresh_dashboard_rollup_if_stale(max_age=None):
+    """
+    Scheduler job - rebuild once if a write nudged since the last build, or
+    (with `max_age`) if the snapshot is older than that. Returns True when
+    this process rebuilt it.
+    """
+    with _lock:
+        due = _state['nudged_at']
+    if max_age is not None:
+        expires = datetime.now() - max_age
+        due = max(due, expires) if due else expires
+    if due is None:
+        return False
+    return refresh_dashboard_rollup(newer_than=due) is not None
+
+
+# =============================================================================
+# WRITE NUDGES
+# =============================================================================
+
+@event.listens_for(Session, 'after_flush')
+def _note_dashboard_changes(session, flush_context):
+    if session.info.get('dashboard_changed'):
+        return
+    changed = any(isinstance(obj, DASHBOARD_MODELS) for obj in list(session.new) + list(session.deleted))
+    changed = changed or any(isinstance(obj, DASHBOARD_MODELS) and session.is_modified(obj)
+                             for obj in session.dirty)
+    if changed:
+        session.info['dashboard_changed'] = True
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _note_bulk_dashboard_changes(orm_execute_state):
+    # Query.update() / delete() and bulk inserts never reach after_flush
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    if mapper is not None and issubclass(mapper.class_, DASHBOARD_MODELS):
+        orm_execute_state.session.info['dashboard_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _nudge_on_commit(session):
+    if session.info.pop('dashboard_changed', False):
+        mark_dashboard_stale()
+        invalidation.publish('dashboard', [])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_dashboard_changes(session):
+    session.info.pop('dashboard_changed', None)
+
+
+def _on_remote_change(changes):
+    """Another process committed a dashboard-relevant write"""
+    mark_dashboard_stale()
+
+
+invalidation.subscribe('dashboard', _on_remote_change)
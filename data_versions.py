@@ -0,0 +1,158 @@
+# data_versions.py - Data version stamps and ETags for J.A. Uniforms Pricing Tool
+#
+# The wizard and master-costs pages re-fetch colors, variables, clients, size
+# ranges, settings and style lists on every load, almost always getting the
+# same bytes back. Each of those datasets has a version stamp here, bumped by
+# any committed write to its tables (session hooks, bulk ORM deletes/updates
+# included) and shared between processes through the invalidation bus. GET
+# endpoints wrapped in @conditional_get build a weak ETag from the stamps they
+# depend on plus the query string and answer 304 - before running any query
+# of their own - when the browser already holds that version.
+#
+# With the bus running the stamps are the bus's shared counters plus its
+# epoch, so every app process hands out the same ETag for the same data and a
+# counter reset (Redis flushed, database restored) never reuses an old ETag;
+# a write in another process is picked up as soon as its message (or the next
+# poll) arrives. Without a bus (scripts, single process), while the bus is
+# unreachable, or while one of our own changes is still unpublished, a
+# per-process counter plus a random epoch is used instead, so that ETag never
+# outlives the process that issued it.
+
+import hashlib
+import threading
+import uuid
+from functools import wraps
+
+from flask import make_response, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+import invalidation
+from master_data import master_data_version
+from models import (
+    Color, Variable, Client, Style, StyleFabric, StyleNotion, StyleLabor,
+    StyleColor, StyleVariable, StyleClient, StyleImage
+)
+
+# Dataset -> models whose writes change it. 'master_data' is stamped by
+# master_data.py (vendors, fabrics, notions, labor, cleaning, size ranges,
+# global settings).
+DATASET_MODELS = {
+    'colors': (Color,),
+    'variables': (Variable,),
+    'clients': (Client,),
+    'styles': (Style,),
+    'style_details': (StyleFabric, StyleNotion, StyleLabor, StyleColor, StyleVariable, StyleClient, StyleImage),
+}
+
+# Bump when a wrapped endpoint's response shape changes, so a deploy does not
+# revalidate old bodies
+ETAG_FORMAT = '1'
+
+_EPOCH = uuid.uuid4().hex[:8]
+_local = {name: 0 for name in DATASET_MODELS}
+_lock = threading.Lock()
+
+
+# =============================================================================
+# VERSION STAMPS
+# =============================================================================
+
+def _bump(dataset):
+    with _lock:
+        _local[dataset] += 1
+
+
+def data_version(dataset):
+    """Current stamp of `dataset` as a string - no database access"""
+    shared = invalidation.shared_stamp(dataset)
+    if shared is not None:
+        return shared
+    local = master_data_version() if dataset == 'master_data' else _local[dataset]
+    return f'{_EPOCH}.{local}'
+
+
+def _datasets_for(classes):
+    return {dataset for dataset, models in DATASET_MODELS.items()
+            if any(issubclass(cls, models) for cls in classes)}
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_changed_datasets(session, flush_context):
+    classes = {type(obj) for obj in list(session.new) + list(session.deleted)}
+    classes |= {type(obj) for obj in session.dirty if session.is_modified(obj)}
+    changed = _datasets_for(classes)
+    if changed:
+        session.info.setdefault('changed_datasets', set()).update(changed)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_changes(orm_execute_state):
+    # Query.delete() / update() never show up in session.new / dirty / deleted
+    if not (orm_execute_state.is_delete or orm_execute_state.is_update):
+        return
+    mapper = orm_execute_state.bind_mapper
+    changed = _datasets_for([mapper.class_]) if mapper is not None else set()
+    if changed:
+        orm_execute_state.session.info.setdefault('changed_datasets', set()).update(changed)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_on_commit(session):
+    for dataset in sorted(session.info.pop('changed_datasets', ())):
+        _bump(dataset)
+        invalidation.publish(dataset, [])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('changed_datasets', None)
+
+
+def _remote_handler(dataset):
+    def handler(changes):
+        _bump(dataset)
+    return handler
+
+
+for _dataset in DATASET_MODELS:
+    # Subscribing also makes the bus track the dataset's shared version
+    invalidation.subscribe(_dataset, _remote_handler(_dataset))
+
+
+# =============================================================================
+# CONDITIONAL GET
+# =============================================================================
+
+def data_etag(datasets, *parts):
+    """Weak-ETag value for data at the current stamps of `datasets`, plus `parts`"""
+    stamps = [f'{dataset}={data_version(dataset)}' for dataset in datasets]
+    raw = '|'.join([ETAG_FORMAT] + stamps + [str(part) for part in parts])
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:20]
+
+
+def conditional_get(*datasets):
+    """
+    Decorator for GET views whose body depends only on `datasets` and the
+    query string. Answers 304 when If-None-Match matches, otherwise runs the
+    view and tags a 200 response. Other methods pass straight through.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if request.method != 'GET':
+                return f(*args, **kwargs)
+
+            etag = data_etag(datasets, request.endpoint, sorted(request.args.items(multi=True)))
+            if request.if_none_match.contains_weak(etag):
+                response = make_response('', 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            # Always revalidate - the ETag makes that nearly free
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
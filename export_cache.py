@@ -0,0 +1,175 @@
+# export_cache.py - Content-addressed SAP export cache for J.A. Uniforms Pricing Tool
+#
+# An export file is stored under a hash of everything its bytes depend on:
+# the selected style ids (in export order), each style's updated_at, its
+# style_costs version and updated_at (bumped by every reprice and SKU
+# rebuild), the global settings stamp and the export options. Unchanged
+# inputs -> same key -> the file is served from disk; any edit yields a new
+# key, so entries never need invalidating. The directory is kept under
+# EXPORT_CACHE_MAX_MB by evicting the least recently used files.
+
+import hashlib
+import json
+import logging
+import os
+import uuid
+
+from sqlalchemy import func
+
+from database import db
+from models import Style, StyleCost, GlobalSetting
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CACHE_DIR = os.environ.get('EXPORT_CACHE_DIR', os.path.join('exports', 'cache'))
+EXPORT_CACHE_MAX_MB = int(os.environ.get('EXPORT_CACHE_MAX_MB', 512))
+
+
+# =============================================================================
+# KEYS
+# =============================================================================
+
+def export_cache_key(kind, style_ids, options=None):
+    """
+    Cache key for one export - one stamp query per 1000 styles plus one for
+    the settings.
+
+    kind: export format name ('sap', 'sap-single', ...)
+    options: anything else that changes the output (include_empty_vars,
+             selected colors), JSON-serializable
+    """
+    style_ids = [int(style_id) for style_id in style_ids]
+    stamps = {}
+    for i in range(0, len(style_ids), 1000):
+        chunk = style_ids[i:i + 1000]
+        for style_id, updated_at, cost_version, cost_updated_at in db.session.query(
+                Style.id, Style.updated_at, StyleCost.version, StyleCost.updated_at
+        ).outerjoin(StyleCost, StyleCost.style_id == Style.id).filter(Style.id.in_(chunk)).all():
+            stamps[style_id] = [_stamp(updated_at), cost_version, _stamp(cost_updated_at)]
+
+    settings_updated, settings_count = db.session.query(
+        func.max(GlobalSetting.updated_at), func.count(GlobalSetting.id)
+    ).one()
+
+    payload = json.dumps({
+        'kind': kind,
+        'styles': [[style_id] + stamps.get(style_id, []) for style_id in style_ids],
+        'settings': [_stamp(settings_updated), settings_count],
+        'options': options,
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _stamp(value):
+    return value.isoformat() if value is not None else None
+
+
+# =============================================================================
+# STORE
+# =============================================================================
+
+def _path(key, suffix='.csv'):
+    return os.path.join(EXPORT_CACHE_DIR, f'{key}{suffix}')
+
+
+def cached_export_path(key, suffix='.csv'):
+    """Path of the cached file for `key` (marked as just used), or None"""
+    path = _path(key, suffix)
+    try:
+        os.utime(path)  # mtime = last use, for LRU eviction
+    except OSError:
+        return None
+    return path
+
+
+def cache_export_stream(key, chunks):
+    """
+    Pass `chunks` (str) through unchanged while writing them to the cache.
+    The file is only published once the stream completed - a dropped
+    connection or an error leaves nothing behind.
+    """
+    os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+    part_path = f'{_path(key)}.{uuid.uuid4().hex}.part'
+    try:
+        f = open(part_path, 'w', newline='', encoding='utf-8')
+    except OSError as e:
+        logger.warning(f"Export cache: cannot write {part_path}: {e}")
+        yield from chunks
+        return
+
+    completed = False
+    try:
+        with f:
+            for chunk in chunks:
+                f.write(chunk)
+                yield chunk
+        completed = True
+    finally:
+        if completed:
+            os.replace(part_path, _path(key))
+            evict_export_cache()
+        else:
+            _remove(part_path)
+
+
+def store_export(key, text):
+    """Cache an export that was built in memory"""
+    for _ in cache_export_stream(key, [text]):
+        pass
+
+
+def cache_export_file(key, suffix, write):
+    """
+    Build a binary export (e.g. Parquet) straight into the cache:
+    write(path) fills a temp file, which is published under `key` only if it
+    returns without error. Returns (cached path, write's return value).
+    """
+    os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+    part_path = f'{_path(key, suffix)}.{uuid.uuid4().hex}.part'
+    try:
+        result = write(part_path)
+        os.replace(part_path, _path(key, suffix))
+    except BaseException:
+        _remove(part_path)
+        raise
+    evict_export_cache(keep=_path(key, suffix))
+    return _path(key, suffix), result
+
+
+def evict_export_cache(max_bytes=None, keep=None):
+    """
+    Delete least recently used files until the cache fits (never `keep`, the
+    file about to be served). Returns files deleted.
+    """
+    if max_bytes is None:
+        max_bytes = EXPORT_CACHE_MAX_MB * 1024 * 1024
+
+    entries = []
+    try:
+        with os.scandir(EXPORT_CACHE_DIR) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith('.part'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        return 0
+
+    total = sum(size for _, size, _ in entries)
+    deleted = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        if path == keep:
+            continue
+        if _remove(path):
+            total -= size
+            deleted += 1
+    return deleted
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
@@ -0,0 +1,80 @@
+# export_compression.py - Streaming compression for CSV exports for J.A. Uniforms Pricing Tool
+#
+# SAP CSVs repeat the style name, vendor code and ship cost on every row and
+# shrink 10-20x. Chunks are compressed as they are produced, so memory stays
+# flat however large the export. gzip uses the standard library; zstd needs
+# the optional `zstandard` package.
+
+import zlib
+
+COMPRESSIONS = {
+    # name: (file suffix, mimetype)
+    'gzip': ('.gz', 'application/gzip'),
+    'zstd': ('.zst', 'application/zstd'),
+}
+
+FILE_CHUNK_SIZE = 256 * 1024
+
+
+class CompressionUnavailable(Exception):
+    """The requested compression needs a package that is not installed"""
+
+
+def zstd_available():
+    try:
+        import zstandard  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _compressor(method):
+    if method == 'gzip':
+        return zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    if method == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise CompressionUnavailable("zstd compression needs the 'zstandard' package")
+        return zstandard.ZstdCompressor(level=3).compressobj()
+    raise ValueError(f"Unknown compression: {method}")
+
+
+def compress_stream(chunks, method):
+    """Compress an iterable of str/bytes chunks, yielding compressed bytes"""
+    compressor = _compressor(method)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_file(path, chunk_size=FILE_CHUNK_SIZE):
+    """Read a file in chunks (cached exports fed through compress_stream)"""
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(chunk_size)
+            if not data:
+                return
+            yield data
+
+
+def choose_compression(requested, accepts_gzip=False):
+    """
+    (method, as_content_encoding) for one export request.
+
+    An explicit `requested` format ('gzip'/'zstd') gives a .csv.gz/.csv.zst
+    download. Otherwise gzip is applied as Content-Encoding when the client
+    accepts it, which browsers undo transparently. (None, False) = plain CSV.
+    Raises ValueError for an unknown format, CompressionUnavailable for zstd
+    without the package.
+    """
+    requested = (requested or '').strip().lower()
+    if requested in ('', 'none'):
+        return ('gzip', True) if accepts_gzip else (None, False)
+    if requested not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression '{requested}' - use gzip or zstd")
+    if requested == 'zstd' and not zstd_available():
+        raise CompressionUnavailable("zstd compression needs the 'zstandard' package")
+    return requested, False
@@ -0,0 +1,223 @@
+# export_jobs.py - Background SAP export jobs for J.A. Uniforms Pricing Tool
+#
+# Large exports no longer hold a request thread for the whole stream. The
+# client POSTs its selection and gets a job id; a small worker pool writes the
+# CSV to EXPORT_JOB_DIR while recording progress on the export_jobs row; the
+# finished file is then downloaded (with HTTP Range support, see app.py) as
+# often as needed until it expires after EXPORT_JOB_TTL_HOURS.
+#
+# Submitting a selection again reuses the job already working on it, or a
+# finished one whose file is still there and whose data (export_cache_key)
+# has not changed since. Each process heartbeats the jobs its pool holds,
+# so a job is only treated as orphaned once its owner stopped doing that.
+
+import hashlib
+import json
+import logging
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from database import db
+from export_cache import export_cache_key
+from models import ExportJob
+from sap_export import EXPORT_BATCH_SIZE, SAP_HEADER_CHUNK, csv_chunk
+from sku_prices import ensure_sku_prices, iter_sku_export_batches
+
+logger = logging.getLogger(__name__)
+
+EXPORT_JOB_DIR = os.environ.get('EXPORT_JOB_DIR', 'exports')
+EXPORT_JOB_TTL_HOURS = int(os.environ.get('EXPORT_JOB_TTL_HOURS', 24))
+EXPORT_JOB_WORKERS = int(os.environ.get('EXPORT_JOB_WORKERS', 2))
+
+# Owners refresh heartbeat_at on their queued/running jobs this often; a job
+# whose heartbeat is older than EXPORT_JOB_STALE_MINUTES lost its process
+# (restart, crash) and the cleanup marks it failed
+EXPORT_JOB_HEARTBEAT_SECONDS = 60
+EXPORT_JOB_STALE_MINUTES = 5
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+# Identifies this process's worker pool on the jobs it holds
+EXPORT_JOB_OWNER = uuid.uuid4().hex
+
+_executor = ThreadPoolExecutor(max_workers=EXPORT_JOB_WORKERS, thread_name_prefix='export-job')
+
+
+def _request_hash(style_ids, include_empty_vars):
+    payload = json.dumps({'style_ids': style_ids, 'include_empty_vars': include_empty_vars})
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _data_key(style_ids, include_empty_vars):
+    return export_cache_key('sap-job', style_ids, {'include_empty_vars': include_empty_vars})
+
+
+# =============================================================================
+# SUBMIT
+# =============================================================================
+
+def submit_export_job(style_ids, include_empty_vars=False, user_id=None):
+    """
+    Queue an SAP export of `style_ids` and return its ExportJob.
+
+    Submitting the same selection returns an earlier job for it instead of
+    starting another one: one still queued or running, or a finished one
+    whose file has not expired and whose data has not changed since.
+    """
+    request_hash = _request_hash(style_ids, include_empty_vars)
+    job = ExportJob.query.filter(
+        ExportJob.request_hash == request_hash,
+        ExportJob.created_by == user_id,
+        ExportJob.status.in_(ACTIVE_STATUSES)
+    ).order_by(ExportJob.created_at.desc()).first()
+    if job is not None:
+        return job
+
+    done = ExportJob.query.filter(
+        ExportJob.request_hash == request_hash,
+        ExportJob.created_by == user_id,
+        ExportJob.status == 'done',
+        ExportJob.expires_at > datetime.now()
+    ).order_by(ExportJob.finished_at.desc()).first()
+    if (done is not None and done.data_key and done.file_path and os.path.exists(done.file_path)
+            and done.data_key == _data_key(style_ids, include_empty_vars)):
+        return done
+
+    job = ExportJob(
+        id=uuid.uuid4().hex,
+        request_hash=request_hash,
+        status='queued',
+        style_ids=json.dumps(style_ids),
+        include_empty_vars=include_empty_vars,
+        total_styles=len(style_ids),
+        filename=f"SAP_Export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+        created_by=user_id,
+        owner=EXPORT_JOB_OWNER,
+        heartbeat_at=datetime.now()
+    )
+    db.session.add(job)
+    db.session.commit()
+
+    _executor.submit(run_export_job, current_app._get_current_object(), job.id)
+    return job
+
+
+# =============================================================================
+# WORKER
+# =============================================================================
+
+def run_export_job(app, job_id):
+    """Write one job's CSV to disk, updating progress after every batch"""
+    with app.app_context():
+        job = db.session.get(ExportJob, job_id)
+        if job is None or job.status != 'queued':
+            return
+
+        os.makedirs(EXPORT_JOB_DIR, exist_ok=True)
+        final_path = os.path.join(EXPORT_JOB_DIR, f'{job.id}.csv')
+        part_path = final_path + '.part'
+
+        try:
+            job.status = 'running'
+            db.session.commit()
+
+            style_ids = json.loads(job.style_ids)
+            ensure_sku_prices(style_ids)
+            db.session.commit()
+            # Key of the data the file is written from, for reuse by later submits
+            job.data_key = _data_key(style_ids, job.include_empty_vars)
+            db.session.commit()
+
+            processed = rows_written = 0
+            with open(part_path, 'w', newline='', encoding='utf-8') as f:
+                f.write(SAP_HEADER_CHUNK)
+                for rows in iter_sku_export_batches(style_ids, job.include_empty_vars):
+                    f.write(csv_chunk(rows))
+                    processed = min(processed + EXPORT_BATCH_SIZE, len(style_ids))
+                    rows_written += len(rows)
+                    job.processed_styles = processed
+                    job.row_count = rows_written
+                    job.heartbeat_at = datetime.now()
+                    db.session.commit()
+
+            os.replace(part_path, final_path)
+            finished = datetime.now()
+            job.status = 'done'
+            job.processed_styles = len(style_ids)
+            job.file_path = final_path
+            job.file_size = os.path.getsize(final_path)
+            job.finished_at = finished
+            job.expires_at = finished + timedelta(hours=EXPORT_JOB_TTL_HOURS)
+            db.session.commit()
+            logger.info(f"Export job {job.id}: {rows_written} rows for {len(style_ids)} styles")
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Export job {job_id} failed: {e}")
+            _remove_file(part_path)
+            job = db.session.get(ExportJob, job_id)
+            if job is not None:
+                job.status = 'failed'
+                job.error = str(e)[:1000]
+                job.finished_at = datetime.now()
+                job.expires_at = job.finished_at + timedelta(hours=EXPORT_JOB_TTL_HOURS)
+                db.session.commit()
+
+
+def _remove_file(path):
+    try:
+        if path and os.path.exists(path):
+            os.remove(path)
+    except OSError as e:
+        logger.warning(f"Could not remove export file {path}: {e}")
+
+
+# =============================================================================
+# HEARTBEAT / CLEANUP
+# =============================================================================
+
+def heartbeat_export_jobs():
+    """
+    Mark this process's queued and running jobs as alive - including jobs
+    still waiting behind a busy pool. Returns the number of jobs touched.
+    """
+    result = db.session.execute(
+        db.update(ExportJob)
+        .where(ExportJob.owner == EXPORT_JOB_OWNER, ExportJob.status.in_(ACTIVE_STATUSES))
+        .values(heartbeat_at=datetime.now())
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+def cleanup_export_jobs():
+    """
+    Delete expired jobs with their files and fail jobs whose owner process
+    stopped heartbeating (restart, crash). Returns (expired, orphaned).
+    """
+    now = datetime.now()
+
+    stale_before = now - timedelta(minutes=EXPORT_JOB_STALE_MINUTES)
+    orphaned = ExportJob.query.filter(
+        ExportJob.status.in_(ACTIVE_STATUSES),
+        db.func.coalesce(ExportJob.heartbeat_at, ExportJob.updated_at) < stale_before
+    ).all()
+    for job in orphaned:
+        job.status = 'failed'
+        job.error = 'Export was interrupted (server restart) - please start it again'
+        job.finished_at = now
+        job.expires_at = now + timedelta(hours=EXPORT_JOB_TTL_HOURS)
+        _remove_file(os.path.join(EXPORT_JOB_DIR, f'{job.id}.csv.part'))
+
+    expired = ExportJob.query.filter(ExportJob.expires_at < now).all()
+    for job in expired:
+        _remove_file(job.file_path)
+        db.session.delete(job)
+
+    db.session.commit()
+    return len(expired), len(orphaned)
@@ -0,0 +1,71 @@
+# export_parquet.py - Columnar SKU matrix export for J.A. Uniforms Pricing Tool
+#
+# The same expanded color x size x variable price rows as the SAP CSV, plus
+# the style's cost components, written as Parquet for the BI team. Batches
+# come from style_sku_prices (see sku_prices.py) and are appended as row
+# groups, so memory stays flat. Repeated strings (style, color, size...) are
+# dictionary-encoded. Needs the optional `pyarrow` package.
+
+from sku_prices import SKU_COST_COLUMNS, iter_sku_cost_batches
+
+PARQUET_MIMETYPE = 'application/vnd.apache.parquet'
+
+# Low-cardinality string columns, stored as Arrow dictionaries
+DICTIONARY_COLUMNS = ('vendor_style', 'style_name', 'gender', 'garment_type', 'size_range',
+                      'color', 'size', 'variable')
+
+
+class ParquetUnavailable(Exception):
+    """pyarrow is not installed"""
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ParquetUnavailable("Parquet export needs the 'pyarrow' package")
+    return pyarrow, pyarrow.parquet
+
+
+def parquet_available():
+    try:
+        _pyarrow()
+        return True
+    except ParquetUnavailable:
+        return False
+
+
+def _schema(pa):
+    fields = []
+    for name in SKU_COST_COLUMNS:
+        if name in DICTIONARY_COLUMNS:
+            fields.append(pa.field(name, pa.dictionary(pa.int32(), pa.string())))
+        elif name == 'is_extended':
+            fields.append(pa.field(name, pa.bool_()))
+        else:
+            fields.append(pa.field(name, pa.float64()))
+    return pa.schema(fields)
+
+
+def write_sku_parquet(path, style_ids, include_empty_vars=False):
+    """Write the SKU matrix of `style_ids` to `path`, one row group per batch. Returns rows written."""
+    pa, pq = _pyarrow()
+    schema = _schema(pa)
+    rows_written = 0
+
+    with pq.ParquetWriter(path, schema, compression='zstd', use_dictionary=True) as writer:
+        for rows in iter_sku_cost_batches(style_ids, include_empty_vars):
+            if not rows:
+                continue
+            columns = list(zip(*rows))
+            arrays = []
+            for field, values in zip(schema, columns):
+                if pa.types.is_dictionary(field.type):
+                    arrays.append(pa.array(values, type=pa.string()).dictionary_encode())
+                else:
+                    arrays.append(pa.array(values, type=field.type))
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            rows_written += len(rows)
+
+    return rows_written
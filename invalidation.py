@@ -0,0 +1,463 @@
+# invalidation.py - Cross-process cache invalidation bus for J.A. Uniforms Pricing Tool
+#
+# Every app process keeps its own in-memory caches (see master_data.py). When
+# one process commits a change the others have to drop their copies. Changes
+# are published as events ("fabrics 42 changed") over Redis pub/sub when Redis
+# is reachable, otherwise recorded in the cache_versions table. Either way each
+# process also polls a shared version counter per cache, so a message that got
+# lost is still picked up within POLL_SECONDS.
+#
+# The counters live next to a shared epoch (a random id created with SET NX,
+# or a row of cache_versions). If the counters are reset - Redis flushed or
+# restarted without its data, a database restored from backup - the epoch is
+# replaced, so an "epoch.version" stamp is never handed out for two different
+# states.
+#
+# publish() does no I/O on the committing thread: changes go to an outbox that
+# a job on the app's scheduler flushes straight away, every cache changed
+# since the last flush in one Redis pipeline or one database transaction. A
+# flush that fails is retried on the next poll; until a change is out the
+# cache has no shared stamp in this process.
+
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from database import db
+from models import CacheVersion
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'ja-uniforms:cache-invalidation'
+VERSION_KEY = 'ja-uniforms:cache-version:{}'
+EPOCH_KEY = 'ja-uniforms:cache-epoch'
+EPOCH_ROW = '__epoch__'  # cache_versions row holding the epoch (DatabaseBus)
+POLL_SECONDS = int(os.environ.get('CACHE_INVALIDATION_POLL_SECONDS', 5))
+
+# Identifies this process so it can skip its own messages
+PROCESS_ID = uuid.uuid4().hex
+
+_handlers = {}  # cache_name -> [handler(changes)]
+_bus = None
+_schedule_flush = None  # runs _bus.flush() on the app's scheduler
+
+
+def describe_changes(changes):
+    """'fabrics 42, fabric_vendors 3' - for logs and the cache_versions table"""
+    if not changes:
+        return 'unknown'
+    text = ', '.join(f'{table} {row_id}' for table, row_id in changes)
+    return text if len(text) <= 500 else text[:497] + '...'
+
+
+# =============================================================================
+# SUBSCRIBE / PUBLISH
+# =============================================================================
+
+def subscribe(cache_name, handler):
+    """
+    Call handler(changes) whenever another process changes `cache_name`.
+
+    `changes` is a list of (table, id) pairs, or None when the change was
+    only noticed by polling and the details are unknown.
+    """
+    _handlers.setdefault(cache_name, []).append(handler)
+
+
+def _dispatch(cache_name, changes):
+    for handler in _handlers.get(cache_name, ()):
+        try:
+            handler(changes)
+        except Exception as e:
+            logger.error(f"Cache invalidation handler for {cache_name} failed: {e}")
+
+
+def publish(cache_name, changes):
+    """
+    Tell the other processes that `cache_name` changed. Call after commit.
+
+    Only queues the change - the scheduler's publish job sends everything
+    queued so far in one round trip. A no-op until init_invalidation_bus()
+    runs (scripts, single process). Failures are logged, never raised - the
+    write already committed. The next poll retries, so the other processes
+    converge once the backend is back.
+    """
+    if _bus is None:
+        return
+    _bus.enqueue(cache_name, [list(change) for change in changes])
+    if _schedule_flush is not None:
+        _schedule_flush()
+
+
+def shared_stamp(cache_name):
+    """
+    'epoch.version' of `cache_name` as last seen by this process (no I/O) -
+    the same string in every process for the same data. None until
+    init_invalidation_bus() runs, while the bus is unreachable, or while a
+    change of ours is not published yet. Only tracked for subscribed caches.
+    """
+    if _bus is None:
+        return None
+    return _bus.stamp(cache_name)
+
+
+# =============================================================================
+# BACKENDS
+# =============================================================================
+
+class _Bus:
+    """Version bookkeeping shared by both backends"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seen = {}
+        self._epoch = None
+        self._outbox = {}        # cache_name -> changes not published yet
+        self._in_flight = set()  # caches being published right now
+
+    def _advance(self, cache_name, version, changes, own=False):
+        """Record a version; invalidate unless it is our own next version"""
+        with self._lock:
+            seen = self._seen.get(cache_name, 0)
+            if version <= seen:
+                return
+            self._seen[cache_name] = version
+        if own and version == seen + 1:
+            return
+        # A foreign change, or our own write jumped past one we never saw
+        logger.info(f"Cache invalidation: {cache_name} changed in another process ({describe_changes(changes)})")
+        _dispatch(cache_name, None if own else changes)
+
+    def _after_publish(self, versions, epoch, outbox):
+        """Record our own publish - a counter that did not move forward was reset"""
+        with self._lock:
+            reset = epoch != self._epoch or any(
+                version <= self._seen.get(name, 0) for name, version in versions.items()
+            )
+        if reset:
+            self.resync()
+            return
+        for cache_name, version in versions.items():
+            self._advance(cache_name, version, outbox[cache_name], own=True)
+
+    def stamp(self, cache_name):
+        with self._lock:
+            if (self._epoch is None or cache_name in self._outbox
+                    or cache_name in self._in_flight):
+                return None
+            return f'{self._epoch}.{self._seen.get(cache_name, 0)}'
+
+    def enqueue(self, cache_name, changes):
+        with self._lock:
+            self._outbox.setdefault(cache_name, []).extend(changes)
+
+    def flush(self):
+        """Publish everything in the outbox at once; keep it for the next try on failure"""
+        with self._lock:
+            outbox, self._outbox = self._outbox, {}
+            self._in_flight.update(outbox)
+        if not outbox:
+            return
+        try:
+            self.publish_many(outbox)
+        except Exception as e:
+            logger.error(f"Cache invalidation publish for {', '.join(sorted(outbox))} failed: {e}")
+            with self._lock:
+                for cache_name, changes in outbox.items():
+                    self._outbox[cache_name] = changes + self._outbox.get(cache_name, [])
+        finally:
+            with self._lock:
+                self._in_flight.difference_update(outbox)
+
+    def start(self):
+        """Remember the current versions so startup does not invalidate anything"""
+        try:
+            epoch = self.read_epoch()
+            versions = self.current_versions(list(_handlers))
+        except Exception as e:
+            logger.warning(f"Cache invalidation: could not read versions at startup: {e}")
+            return
+        with self._lock:
+            self._epoch = epoch
+            self._seen.update(versions)
+
+    def resync(self):
+        """
+        Catch up on any change whose message never arrived. If the counters
+        were reset (new epoch, or a counter went backwards) start over from
+        the current values and invalidate everything.
+        """
+        epoch = self.read_epoch()
+        versions = self.current_versions(list(_handlers))
+        with self._lock:
+            went_back = any(version < self._seen.get(name, 0) for name, version in versions.items())
+            current = epoch == self._epoch
+        if current and not went_back:
+            for cache_name, version in versions.items():
+                self._advance(cache_name, version, None)
+            return
+        if current:
+            # Counters rolled back under the same epoch (restored backup)
+            epoch = self.replace_epoch(epoch)
+        logger.warning(f"Cache invalidation: shared versions were reset (epoch {epoch}), invalidating all caches")
+        with self._lock:
+            self._epoch = epoch
+            self._seen = dict(versions)
+        for cache_name in list(_handlers):
+            _dispatch(cache_name, None)
+
+    def poll(self):
+        """Retry anything still in the outbox, then resync()"""
+        self.flush()
+        self.resync()
+
+
+class RedisBus(_Bus):
+    """Pub/sub for immediate delivery plus an INCR counter per cache for polling"""
+
+    kind = 'redis'
+
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+        self._thread = None
+
+    def publish_many(self, outbox):
+        names = sorted(outbox)
+        pipe = self.client.pipeline()
+        for cache_name in names:
+            pipe.incr(VERSION_KEY.format(cache_name))
+        pipe.get(EPOCH_KEY)
+        *counters, epoch = pipe.execute()
+        epoch = epoch.decode() if epoch is not None else None
+        versions = dict(zip(names, counters))
+        self._after_publish(versions, epoch, outbox)
+
+        pipe = self.client.pipeline(transaction=False)
+        for cache_name in names:
+            pipe.publish(CHANNEL, json.dumps({
+                'origin': PROCESS_ID,
+                'epoch': epoch,
+                'cache': cache_name,
+                'version': versions[cache_name],
+                'changes': outbox[cache_name],
+            }))
+        pipe.execute()
+
+    def read_epoch(self):
+        # The first process (or the first one after a flush) creates it
+        self.client.set(EPOCH_KEY, uuid.uuid4().hex, nx=True)
+        return self.client.get(EPOCH_KEY).decode()
+
+    def replace_epoch(self, old):
+        import redis
+
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(EPOCH_KEY)
+                if pipe.get(EPOCH_KEY) == old.encode():
+                    pipe.multi()
+                    pipe.set(EPOCH_KEY, uuid.uuid4().hex)
+                    pipe.execute()
+            except redis.WatchError:
+                pass  # another process replaced it first
+        return self.read_epoch()
+
+    def current_versions(self, cache_names):
+        if not cache_names:
+            return {}
+        values = self.client.mget([VERSION_KEY.format(name) for name in cache_names])
+        return {name: int(value or 0) for name, value in zip(cache_names, values)}
+
+    def start(self):
+        super().start()
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{CHANNEL: self._on_message})
+        self._thread = pubsub.run_in_thread(
+            sleep_time=1, daemon=True, exception_handler=self._on_error
+        )
+
+    def _on_message(self, message):
+        try:
+            data = json.loads(message['data'])
+        except (TypeError, ValueError):
+            return
+        if data.get('origin') == PROCESS_ID:
+            return
+        with self._lock:
+            current = data.get('epoch') == self._epoch
+        if not current:
+            # Published after a reset this process has not noticed yet
+            try:
+                self.resync()
+            except Exception as e:
+                logger.warning(f"Cache invalidation: resync failed: {e}")
+            return
+        changes = [tuple(change) for change in data.get('changes') or []]
+        self._advance(data['cache'], int(data['version']), changes or None)
+
+    def _on_error(self, error, pubsub, thread):
+        # Keep listening - redis-py resubscribes on reconnect, polling covers the gap
+        logger.warning(f"Cache invalidation: Redis listener error: {error}")
+
+
+class DatabaseBus(_Bus):
+    """cache_versions table - one row per cache, bumped on every publish"""
+
+    kind = 'database'
+
+    def publish_many(self, outbox):
+        # One transaction for the whole outbox; rows in name order so two
+        # processes never lock them in opposite orders
+        names = sorted(outbox)
+        with db.engine.begin() as conn:
+            for cache_name in names:
+                self._bump(conn, cache_name, describe_changes(outbox[cache_name]))
+            versions = dict(conn.execute(
+                db.select(CacheVersion.cache_name, CacheVersion.version)
+                .where(CacheVersion.cache_name.in_(names))
+            ).all())
+            epoch = conn.execute(
+                db.select(CacheVersion.last_change).where(CacheVersion.cache_name == EPOCH_ROW)
+            ).scalar()
+        self._after_publish(versions, epoch, outbox)
+
+    def _bump(self, conn, cache_name, description):
+        values = dict(version=CacheVersion.version + 1, last_change=description,
+                      updated_at=datetime.now())
+        result = conn.execute(
+            db.update(CacheVersion).where(CacheVersion.cache_name == cache_name).values(**values)
+        )
+        if result.rowcount:
+            return
+        try:
+            with conn.begin_nested():
+                conn.execute(db.insert(CacheVersion).values(
+                    cache_name=cache_name, version=1, last_change=description,
+                    updated_at=datetime.now()
+                ))
+        except IntegrityError:
+            # Another process created the row first
+            conn.execute(
+                db.update(CacheVersion).where(CacheVersion.cache_name == cache_name).values(**values)
+            )
+
+    def read_epoch(self):
+        with db.engine.begin() as conn:
+            epoch = conn.execute(
+                db.select(CacheVersion.last_change).where(CacheVersion.cache_name == EPOCH_ROW)
+            ).scalar()
+            if epoch is not None:
+                return epoch
+            try:
+                with conn.begin_nested():
+                    conn.execute(db.insert(CacheVersion).values(
+                        cache_name=EPOCH_ROW, version=0, last_change=uuid.uuid4().hex,
+                        updated_at=datetime.now()
+                    ))
+            except IntegrityError:
+                pass  # another process created it first
+            return conn.execute(
+                db.select(CacheVersion.last_change).where(CacheVersion.cache_name == EPOCH_ROW)
+            ).scalar_one()
+
+    def replace_epoch(self, old):
+        with db.engine.begin() as conn:
+            # Only if still `old` - the first process to notice picks the new one
+            conn.execute(
+                db.update(CacheVersion)
+                .where(CacheVersion.cache_name == EPOCH_ROW, CacheVersion.last_change == old)
+                .values(version=CacheVersion.version + 1, last_change=uuid.uuid4().hex,
+                        updated_at=datetime.now())
+            )
+        return self.read_epoch()
+
+    def current_versions(self, cache_names):
+        if not cache_names:
+            return {}
+        with db.engine.connect() as conn:
+            rows = conn.execute(
+                db.select(CacheVersion.cache_name, CacheVersion.version)
+                .where(CacheVersion.cache_name.in_(cache_names))
+            ).all()
+        return {name: version for name, version in rows}
+
+
+# =============================================================================
+# STARTUP
+# =============================================================================
+
+def _connect_redis():
+    """Same detection as get_limiter_storage(): Redis client if it answers a ping"""
+    redis_url = os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379')
+    try:
+        import redis
+        client = redis.from_url(redis_url, socket_connect_timeout=1)
+        client.ping()
+        return client
+    except Exception:
+        return None
+
+
+def init_invalidation_bus(app, scheduler):
+    """
+    Pick a backend, start listening and schedule the version poll and the
+    publish job on `scheduler` (the app's running BackgroundScheduler)
+    """
+    global _bus, _schedule_flush
+
+    client = _connect_redis()
+    if client is not None:
+        _bus = RedisBus(client)
+        print("✅ Cache invalidation: Using Redis pub/sub")
+    else:
+        _bus = DatabaseBus()
+        print(f"⚠️ Cache invalidation: Redis not available, polling database every {POLL_SECONDS}s")
+
+    with app.app_context():
+        _bus.start()
+
+    def poll():
+        with app.app_context():
+            try:
+                _bus.poll()
+            except Exception as e:
+                app.logger.error(f"❌ Cache invalidation poll failed: {str(e)}")
+
+    def flush():
+        with app.app_context():
+            _bus.flush()
+
+    def schedule_flush():
+        # One pending job at a time; a commit during a running flush queues the next
+        try:
+            scheduler.add_job(
+                func=flush,
+                id='cache_invalidation_publish',
+                name='Publish cache changes',
+                replace_existing=True,
+                max_instances=2,
+                misfire_grace_time=None
+            )
+        except Exception as e:
+            # Scheduler shut down - the next poll publishes, if it still runs
+            app.logger.warning(f"⚠️ Cache invalidation: could not schedule publish: {str(e)}")
+
+    _schedule_flush = schedule_flush
+
+    scheduler.add_job(
+        func=poll,
+        trigger='interval',
+        seconds=POLL_SECONDS,
+        id='cache_invalidation_poll',
+        name='Poll shared cache versions',
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True
+    )
+    return _bus
@@ -0,0 +1,262 @@
+# master_data.py - Process-wide master-data cache for J.A. Uniforms Pricing Tool
+#
+# Vendors, fabrics, notions, labor operations, cleaning costs, size ranges and
+# global settings change rarely but are read on almost every page. They are
+# loaded into one immutable snapshot shared by every request thread. Any
+# committed write to those tables bumps a version stamp; readers compare
+# stamps and rebuild the snapshot only when it moved. Writes are published on
+# the invalidation bus so other app processes drop their snapshot too.
+#
+# The shared snapshot is always loaded through a session of its own, so it
+# only ever holds committed rows - a request that wrote master data and then
+# rolled back can't leave its uncommitted values in it.
+
+import threading
+from collections import namedtuple
+from types import MappingProxyType
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+
+import invalidation
+from database import db
+from models import (
+    FabricVendor, NotionVendor, Fabric, Notion, LaborOperation,
+    CleaningCost, SizeRange, GlobalSetting
+)
+
+# ===== SNAPSHOT ROW SHAPES =====
+# Same attribute names as the models so templates work with either.
+FabricVendorRow = namedtuple('FabricVendorRow', ['id', 'name', 'vendor_code', 'f_ship_cost'])
+NotionVendorRow = namedtuple('NotionVendorRow', ['id', 'name', 'vendor_code'])
+FabricRow = namedtuple('FabricRow', [
+    'id', 'name', 'fabric_code', 'cost_per_yard', 'color', 'fabric_vendor_id', 'fabric_vendor'
+])
+NotionRow = namedtuple('NotionRow', [
+    'id', 'name', 'cost_per_unit', 'unit_type', 'notion_vendor_id', 'notion_vendor'
+])
+LaborOperationRow = namedtuple('LaborOperationRow', [
+    'id', 'name', 'cost_type', 'fixed_cost', 'cost_per_hour', 'cost_per_piece', 'is_active'
+])
+CleaningCostRow = namedtuple('CleaningCostRow', ['id', 'garment_type', 'fixed_cost', 'avg_minutes'])
+SizeRangeRow = namedtuple('SizeRangeRow', [
+    'id', 'name', 'regular_sizes', 'extended_sizes', 'extended_markup_percent', 'description'
+])
+GlobalSettingRow = namedtuple('GlobalSettingRow', ['id', 'setting_key', 'setting_value', 'description'])
+
+# Models whose writes invalidate the snapshot
+MASTER_MODELS = (
+    FabricVendor, NotionVendor, Fabric, Notion, LaborOperation,
+    CleaningCost, SizeRange, GlobalSetting
+)
+
+
+class MasterData:
+    """
+    Immutable snapshot of all master data at one version.
+
+    Lists are tuples in the order the pages show them; lookups are read-only
+    mappings. Never mutate anything reachable from a snapshot.
+    """
+
+    def __init__(self, version, fabric_vendors, notion_vendors, fabrics, notions,
+                 labor_operations, cleaning_costs, size_ranges, global_settings, private=False):
+        self.version = version
+        self.private = private  # sees one session's uncommitted writes - never cache derived data
+        self.fabric_vendors = fabric_vendors
+        self.notion_vendors = notion_vendors
+        self.fabrics = fabrics
+        self.notions = notions
+        self.labor_operations = labor_operations
+        self.cleaning_costs = cleaning_costs
+        self.size_ranges = size_ranges
+        self.global_settings = global_settings
+
+        self.garment_types = tuple(cc.garment_type for cc in cleaning_costs)
+        self.cleaning_cost_map = MappingProxyType({cc.garment_type: cc.fixed_cost for cc in cleaning_costs})
+        self.size_ranges_by_name = MappingProxyType({sr.name: sr for sr in size_ranges})
+        self.settings = MappingProxyType({s.setting_key: s.setting_value for s in global_settings})
+
+    def setting(self, key, default=None):
+        return self.settings.get(key, default)
+
+    def find_labor_operation(self, fragment):
+        """First labor operation (by id) whose name contains `fragment`, case-insensitive"""
+        fragment = fragment.lower()
+        for op in sorted(self.labor_operations, key=lambda op: op.id):
+            if fragment in op.name.lower():
+                return op
+        return None
+
+
+# ===== VERSION STAMP + SNAPSHOT =====
+_lock = threading.Lock()
+_state = {'version': 1, 'snapshot': None}
+
+
+def master_data_version():
+    """Current version stamp - changes whenever master data is written"""
+    return _state['version']
+
+
+def bump_version():
+    """Mark every snapshot older than now as stale. Returns the new version."""
+    with _lock:
+        _state['version'] += 1
+        return _state['version']
+
+
+def _load_snapshot(session, version, private=False):
+    fabric_vendors = tuple(
+        FabricVendorRow(v.id, v.name, v.vendor_code, v.f_ship_cost)
+        for v in session.query(FabricVendor).order_by(FabricVendor.name).all()
+    )
+    notion_vendors = tuple(
+        NotionVendorRow(v.id, v.name, v.vendor_code)
+        for v in session.query(NotionVendor).order_by(NotionVendor.name).all()
+    )
+    fabric_vendors_by_id = {v.id: v for v in fabric_vendors}
+    notion_vendors_by_id = {v.id: v for v in notion_vendors}
+
+    fabrics = tuple(
+        FabricRow(f.id, f.name, f.fabric_code, f.cost_per_yard, f.color,
+                  f.fabric_vendor_id, fabric_vendors_by_id.get(f.fabric_vendor_id))
+        for f in session.query(Fabric).order_by(Fabric.name).all()
+    )
+    notions = tuple(
+        NotionRow(n.id, n.name, n.cost_per_unit, n.unit_type,
+                  n.notion_vendor_id, notion_vendors_by_id.get(n.notion_vendor_id))
+        for n in session.query(Notion).order_by(Notion.name).all()
+    )
+    labor_operations = tuple(
+        LaborOperationRow(op.id, op.name, op.cost_type, op.fixed_cost,
+                          op.cost_per_hour, op.cost_per_piece, op.is_active)
+        for op in session.query(LaborOperation).order_by(LaborOperation.name).all()
+    )
+    cleaning_costs = tuple(
+        CleaningCostRow(cc.id, cc.garment_type, cc.fixed_cost, cc.avg_minutes)
+        for cc in session.query(CleaningCost).order_by(CleaningCost.garment_type).all()
+    )
+    size_ranges = tuple(
+        SizeRangeRow(sr.id, sr.name, sr.regular_sizes, sr.extended_sizes,
+                     sr.extended_markup_percent, sr.description)
+        for sr in session.query(SizeRange).order_by(SizeRange.name).all()
+    )
+    global_settings = tuple(
+        GlobalSettingRow(s.id, s.setting_key, s.setting_value, s.description)
+        for s in session.query(GlobalSetting).order_by(GlobalSetting.id).all()
+    )
+
+    return MasterData(version, fabric_vendors, notion_vendors, fabrics, notions,
+                      labor_operations, cleaning_costs, size_ranges, global_settings, private)
+
+
+def get_master_data():
+    """
+    Shared snapshot at the current version - rebuilt only after a write.
+
+    The version is read before loading, so a write that lands mid-load leaves
+    the new snapshot already stale and the next reader rebuilds it. A session
+    holding uncommitted master writes gets its own private snapshot instead.
+    """
+    session = db.session()
+    if session.info.get('master_data_changes') or _has_unflushed_master_writes(session):
+        # Kept until the session flushes or adds master rows again
+        snapshot = session.info.get('master_data_private')
+        if snapshot is None:
+            snapshot = _load_snapshot(session, _state['version'], private=True)
+            session.info['master_data_private'] = snapshot
+        return snapshot
+
+    version = _state['version']
+    snapshot = _state['snapshot']
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+
+    # Committed rows only - never through the request's session
+    with Session(db.engine) as own_session:
+        snapshot = _load_snapshot(own_session, version)
+    with _lock:
+        current = _state['snapshot']
+        if current is None or current.version < snapshot.version:
+            _state['snapshot'] = snapshot
+    return snapshot
+
+
+def _has_unflushed_master_writes(session):
+    """
+    Master rows added, edited or deleted but not flushed yet. session.new
+    and session.deleted are checked at most once per flush; adds and edits
+    after that flag the session through events. The identity map is never
+    scanned.
+    """
+    unflushed = session.info.get('master_data_unflushed')
+    if unflushed is None:
+        unflushed = any(isinstance(obj, MASTER_MODELS) for obj in list(session.new) + list(session.deleted))
+        session.info['master_data_unflushed'] = unflushed
+    return unflushed
+
+
+# =============================================================================
+# AUTOMATIC INVALIDATION - any committed ORM write to a master table bumps
+# =============================================================================
+
+def _note_unflushed(session):
+    session.info['master_data_unflushed'] = True
+    session.info.pop('master_data_private', None)
+
+
+@event.listens_for(Session, 'before_attach')
+def _note_master_add(session, instance):
+    if isinstance(instance, MASTER_MODELS):
+        _note_unflushed(session)
+
+
+def _note_master_edit(target, value, oldvalue, initiator):
+    session = object_session(target)
+    if session is not None:
+        _note_unflushed(session)
+
+
+for _model in MASTER_MODELS:
+    for _column in inspect(_model).column_attrs:
+        event.listen(getattr(_model, _column.key), 'set', _note_master_edit)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_master_changes(session, flush_context):
+    session.info.pop('master_data_unflushed', None)
+    changed = [obj for obj in list(session.new) + list(session.deleted)
+               if isinstance(obj, MASTER_MODELS)]
+    changed += [obj for obj in session.dirty
+                if isinstance(obj, MASTER_MODELS) and session.is_modified(obj)]
+    if changed:
+        pending = session.info.setdefault('master_data_changes', set())
+        for obj in changed:
+            pending.add((obj.__tablename__, obj.id))
+        session.info.pop('master_data_private', None)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_on_commit(session):
+    session.info.pop('master_data_unflushed', None)
+    session.info.pop('master_data_private', None)
+    changes = session.info.pop('master_data_changes', None)
+    if changes:
+        bump_version()
+        invalidation.publish('master_data', sorted(changes))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('master_data_unflushed', None)
+    session.info.pop('master_data_private', None)
+    session.info.pop('master_data_changes', None)
+
+
+def _on_remote_change(changes):
+    """Another process changed master data - drop our snapshot too"""
+    bump_version()
+
+
+invalidation.subscribe('master_data', _on_remote_change)
@@ -0,0 +1,51 @@
+"""Add style_sku_prices table (precomputed SAP export rows per SKU)
+
+Revision ID: 5e7a3c91b2d4
+Revises: d41f6b9a2c37
+Create Date: 2026-10-17 16:40:12.873305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e7a3c91b2d4'
+down_revision = 'd41f6b9a2c37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Rows are built by the app (sku_prices.ensure_sku_prices) on first export
+    op.create_table('style_sku_prices',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('style_id', sa.Integer(), nullable=False),
+    sa.Column('sort_order', sa.Integer(), nullable=False),
+    sa.Column('color', sa.String(length=100), nullable=False),
+    sa.Column('size', sa.String(length=20), nullable=False),
+    sa.Column('variable', sa.String(length=100), nullable=False),
+    sa.Column('is_extended', sa.Boolean(), nullable=False),
+    sa.Column('optional', sa.Boolean(), nullable=False),
+    sa.Column('price', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['style_id'], ['styles.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('style_sku_prices', schema=None) as batch_op:
+        batch_op.create_index('ix_style_sku_prices_style_order', ['style_id', 'sort_order'], unique=False)
+        batch_op.create_index('ix_style_sku_prices_sku', ['style_id', 'color', 'size', 'variable'], unique=False)
+
+    with op.batch_alter_table('style_costs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('skus_built', sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade():
+    with op.batch_alter_table('style_costs', schema=None) as batch_op:
+        batch_op.drop_column('skus_built')
+
+    with op.batch_alter_table('style_sku_prices', schema=None) as batch_op:
+        batch_op.drop_index('ix_style_sku_prices_sku')
+        batch_op.drop_index('ix_style_sku_prices_style_order')
+
+    op.drop_table('style_sku_prices')
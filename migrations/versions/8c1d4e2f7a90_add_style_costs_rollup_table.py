@@ -0,0 +1,44 @@
+"""Add style_costs rollup table (materialized per-style cost totals)
+
+Revision ID: 8c1d4e2f7a90
+Revises: 252fa85f19ac
+Create Date: 2026-10-17 09:12:31.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c1d4e2f7a90'
+down_revision = '252fa85f19ac'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Rows are backfilled by the app (models.ensure_style_costs) on first read
+    op.create_table('style_costs',
+    sa.Column('style_id', sa.Integer(), nullable=False),
+    sa.Column('fabric_cost', sa.Float(), nullable=False),
+    sa.Column('notion_cost', sa.Float(), nullable=False),
+    sa.Column('labor_cost', sa.Float(), nullable=False),
+    sa.Column('cleaning_cost', sa.Float(), nullable=False),
+    sa.Column('label_cost', sa.Float(), nullable=False),
+    sa.Column('shipping_cost', sa.Float(), nullable=False),
+    sa.Column('total_cost', sa.Float(), nullable=False),
+    sa.Column('retail_price', sa.Float(), nullable=True),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['style_id'], ['styles.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('style_id')
+    )
+    with op.batch_alter_table('style_costs', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_style_costs_total_cost'), ['total_cost'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('style_costs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_style_costs_total_cost'))
+
+    op.drop_table('style_costs')
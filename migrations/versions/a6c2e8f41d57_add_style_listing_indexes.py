@@ -0,0 +1,32 @@
+"""Add indexes for the server-side style listing
+
+Revision ID: a6c2e8f41d57
+Revises: e3a9d5c7f216
+Create Date: 2026-10-17 21:03:12.640158
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6c2e8f41d57'
+down_revision = 'e3a9d5c7f216'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('styles', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_styles_size_range'), ['size_range'], unique=False)
+        batch_op.create_index('ix_styles_updated_at_id', ['updated_at', 'id'], unique=False)
+        batch_op.create_index('ix_styles_gender_updated_at', ['gender', 'updated_at'], unique=False)
+        batch_op.create_index('ix_styles_garment_type_updated_at', ['garment_type', 'updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('styles', schema=None) as batch_op:
+        batch_op.drop_index('ix_styles_garment_type_updated_at')
+        batch_op.drop_index('ix_styles_gender_updated_at')
+        batch_op.drop_index('ix_styles_updated_at_id')
+        batch_op.drop_index(batch_op.f('ix_styles_size_range'))
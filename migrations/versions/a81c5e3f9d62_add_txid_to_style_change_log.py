@@ -0,0 +1,34 @@
+"""Record the writing transaction on style_change_log for delta exports
+
+Revision ID: a81c5e3f9d62
+Revises: d3f8a6b2c715
+Create Date: 2026-10-18 10:04:27.913640
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a81c5e3f9d62'
+down_revision = 'd3f8a6b2c715'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('style_change_log', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('txid', sa.BigInteger(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_style_change_log_txid'), ['txid'], unique=False)
+
+    with op.batch_alter_table('export_watermarks', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_txid', sa.BigInteger(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('export_watermarks', schema=None) as batch_op:
+        batch_op.drop_column('last_txid')
+
+    with op.batch_alter_table('style_change_log', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_style_change_log_txid'))
+        batch_op.drop_column('txid')
@@ -0,0 +1,51 @@
+"""Add export_jobs table (background SAP exports written to disk)
+
+Revision ID: b7e2f4a9c013
+Revises: 5e7a3c91b2d4
+Create Date: 2026-10-17 18:05:41.220917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e2f4a9c013'
+down_revision = '5e7a3c91b2d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('export_jobs',
+    sa.Column('id', sa.String(length=32), nullable=False),
+    sa.Column('request_hash', sa.String(length=64), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('style_ids', sa.Text(), nullable=False),
+    sa.Column('include_empty_vars', sa.Boolean(), nullable=False),
+    sa.Column('total_styles', sa.Integer(), nullable=False),
+    sa.Column('processed_styles', sa.Integer(), nullable=False),
+    sa.Column('row_count', sa.Integer(), nullable=False),
+    sa.Column('filename', sa.String(length=200), nullable=True),
+    sa.Column('file_path', sa.String(length=500), nullable=True),
+    sa.Column('file_size', sa.BigInteger(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_by', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.Column('expires_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['created_by'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('export_jobs', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_export_jobs_request_hash'), ['request_hash'], unique=False)
+        batch_op.create_index(batch_op.f('ix_export_jobs_expires_at'), ['expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('export_jobs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_export_jobs_expires_at'))
+        batch_op.drop_index(batch_op.f('ix_export_jobs_request_hash'))
+
+    op.drop_table('export_jobs')
@@ -0,0 +1,31 @@
+"""Add dashboard_rollups table (precomputed dashboard snapshot)
+
+Revision ID: c94e2a7b5d18
+Revises: f58b1d3e9a24
+Create Date: 2026-10-17 23:52:05.307716
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c94e2a7b5d18'
+down_revision = 'f58b1d3e9a24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The first dashboard request (or the scheduler) fills it
+    op.create_table('dashboard_rollups',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('data', sa.Text(), nullable=False),
+    sa.Column('refreshed_at', sa.DateTime(), nullable=False),
+    sa.Column('build_ms', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('dashboard_rollups')
@@ -0,0 +1,30 @@
+"""Add owner, heartbeat and data key to export_jobs
+
+Revision ID: d3f8a6b2c715
+Revises: c94e2a7b5d18
+Create Date: 2026-10-18 09:12:44.581306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3f8a6b2c715'
+down_revision = 'c94e2a7b5d18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('export_jobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('data_key', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('owner', sa.String(length=32), nullable=True))
+        batch_op.add_column(sa.Column('heartbeat_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('export_jobs', schema=None) as batch_op:
+        batch_op.drop_column('heartbeat_at')
+        batch_op.drop_column('owner')
+        batch_op.drop_column('data_key')
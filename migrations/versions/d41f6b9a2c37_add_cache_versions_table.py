@@ -0,0 +1,31 @@
+"""Add cache_versions table (database fallback for cache invalidation)
+
+Revision ID: d41f6b9a2c37
+Revises: 8c1d4e2f7a90
+Create Date: 2026-10-17 14:05:48.220913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41f6b9a2c37'
+down_revision = '8c1d4e2f7a90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Rows are created by the app (invalidation.py) on the first publish
+    op.create_table('cache_versions',
+    sa.Column('cache_name', sa.String(length=50), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('last_change', sa.String(length=500), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('cache_name')
+    )
+
+
+def downgrade():
+    op.drop_table('cache_versions')
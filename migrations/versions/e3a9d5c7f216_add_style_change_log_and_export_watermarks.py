@@ -0,0 +1,50 @@
+"""Add style_change_log and export_watermarks tables (delta SAP exports)
+
+Revision ID: e3a9d5c7f216
+Revises: b7e2f4a9c013
+Create Date: 2026-10-17 19:22:08.514330
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a9d5c7f216'
+down_revision = 'b7e2f4a9c013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('style_change_log',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('style_id', sa.Integer(), nullable=False),
+    sa.Column('reason', sa.String(length=30), nullable=False),
+    sa.Column('changed_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('style_change_log', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_style_change_log_style_id'), ['style_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_style_change_log_changed_at'), ['changed_at'], unique=False)
+
+    op.create_table('export_watermarks',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('last_change_id', sa.Integer(), nullable=False),
+    sa.Column('style_count', sa.Integer(), nullable=False),
+    sa.Column('row_count', sa.Integer(), nullable=False),
+    sa.Column('exported_by', sa.Integer(), nullable=True),
+    sa.Column('exported_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['exported_by'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('export_watermarks')
+
+    with op.batch_alter_table('style_change_log', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_style_change_log_changed_at'))
+        batch_op.drop_index(batch_op.f('ix_style_change_log_style_id'))
+
+    op.drop_table('style_change_log')
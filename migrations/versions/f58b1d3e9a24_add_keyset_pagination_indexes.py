@@ -0,0 +1,26 @@
+"""Add indexes for keyset pagination of audit logs and styles
+
+Revision ID: f58b1d3e9a24
+Revises: a6c2e8f41d57
+Create Date: 2026-10-17 22:41:37.118902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f58b1d3e9a24'
+down_revision = 'a6c2e8f41d57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('audit_logs', schema=None) as batch_op:
+        batch_op.create_index('ix_audit_logs_timestamp_id', ['timestamp', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('audit_logs', schema=None) as batch_op:
+        batch_op.drop_index('ix_audit_logs_timestamp_id')
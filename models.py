@@ -1,8 +1,10 @@
 from database import db
 from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
-from flask import g
+import costing
 
 class VerificationCode(db.Model):
     __tablename__ = 'verification_codes'
@@ -82,6 +84,10 @@ class User(UserMixin, db.Model):
     
 class AuditLog(db.Model):
     __tablename__ = 'audit_logs'
+    __table_args__ = (
+        # Newest-first keyset paging of the audit log (see pagination.py)
+        db.Index('ix_audit_logs_timestamp_id', 'timestamp', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=datetime.now, nullable=False)
@@ -190,18 +196,39 @@ class SizeRange(db.Model):
     def __repr__(self):
         return f'<SizeRange {self.name}>'
     
+# ===== SHARED MASTER DATA (see master_data.py) =====
+def get_cleaning_cost_map():
+    """Process-wide {garment_type: fixed_cost} from the master-data snapshot"""
+    from master_data import get_master_data
+    return get_master_data().cleaning_cost_map
+
+
 def get_cached_global_settings():
-    if not hasattr(g, 'global_settings_cache'):
-        all_settings = GlobalSetting.query.all()
-        g.global_settings_cache = {
-            setting.setting_key: setting.setting_value 
-            for setting in all_settings
-        }
-    return g.global_settings_cache
+    """Process-wide {setting_key: value} from the master-data snapshot (read-only)"""
+    from master_data import get_master_data
+    return get_master_data().settings
+
+
+def load_cleaning_cost_map(session=None):
+    """{garment_type: fixed_cost} straight from the session (sees uncommitted writes)"""
+    session = session or db.session
+    return dict(session.query(CleaningCost.garment_type, CleaningCost.fixed_cost).all())
+
+
+def load_global_settings(session=None):
+    """{setting_key: value} straight from the session (sees uncommitted writes)"""
+    session = session or db.session
+    return dict(session.query(GlobalSetting.setting_key, GlobalSetting.setting_value).all())
 
 # ===== MAIN STYLE TABLE =====
 class Style(db.Model):
     __tablename__ = 'styles'
+    __table_args__ = (
+        # Style listing: default sort and filtered sorts (see style_listing.py)
+        db.Index('ix_styles_updated_at_id', 'updated_at', 'id'),
+        db.Index('ix_styles_gender_updated_at', 'gender', 'updated_at'),
+        db.Index('ix_styles_garment_type_updated_at', 'garment_type', 'updated_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     vendor_style = db.Column(db.String(50), unique=True, nullable=False, index=True)
@@ -210,7 +237,7 @@ class Style(db.Model):
     style_name = db.Column(db.String(200), nullable=False, index=True)
     gender = db.Column(db.String(20), index=True)
     garment_type = db.Column(db.String(50), index=True)
-    size_range = db.Column(db.String(50))
+    size_range = db.Column(db.String(50), index=True)
     base_margin_percent = db.Column(db.Float, default=60.0, index=True)
     avg_label_cost = db.Column(db.Float, default=0.20)
     shipping_cost = db.Column(db.Float, default=0.00)
@@ -224,76 +251,72 @@ class Style(db.Model):
     colors = db.relationship('StyleColor', back_populates='style', cascade='all, delete-orphan')
     
     
+    def get_fabric_lines(self):
+        """BOM fabric lines as plain tuples for the costing kernel"""
+        lines = []
+        for sf in self.style_fabrics:
+            vendor = sf.fabric.fabric_vendor
+            lines.append(costing.FabricLine(
+                sf.yards_required,
+                sf.fabric.cost_per_yard,
+                sf.is_sublimation,
+                vendor.f_ship_cost if vendor else None
+            ))
+        return lines
+
+    def get_notion_lines(self):
+        """BOM notion lines as plain tuples for the costing kernel"""
+        return [costing.NotionLine(sn.quantity_required, sn.notion.cost_per_unit)
+                for sn in self.style_notions]
+
+    def get_labor_lines(self):
+        """BOM labor lines as plain tuples (skips deleted labor operations)"""
+        lines = []
+        for sl in self.style_labor:
+            op = sl.labor_operation
+            if not op:
+                continue
+            lines.append(costing.LaborLine(
+                op.cost_type, op.fixed_cost, op.cost_per_hour, op.cost_per_piece,
+                sl.time_hours, sl.quantity
+            ))
+        return lines
+
+    def get_cleaning_cost(self):
+        if not self.garment_type:
+            return 0
+        # Shared garment_type -> cost map (no query per style)
+        return get_cleaning_cost_map().get(self.garment_type, 0)
+
     def get_total_fabric_cost(self):
         """Calculate total fabric cost - OPTIMIZED (uses cached global settings)"""
         # Get cached sublimation cost (no DB query per style)
         settings = get_cached_global_settings()
-        sublimation_cost = settings.get('sublimation_cost', 6.00)
-        
-        total = 0
-        for sf in self.style_fabrics:
-            base_cost = sf.yards_required * sf.fabric.cost_per_yard
-            # Add sublimation upcharge if checked
-            if sf.is_sublimation:
-                base_cost += sublimation_cost * sf.yards_required
-            # Add fabric vendor shipping cost
-            if sf.fabric.fabric_vendor and sf.fabric.fabric_vendor.f_ship_cost:
-                base_cost += sf.fabric.fabric_vendor.f_ship_cost
-            total += base_cost
-        return round(total, 2)
+        sublimation_cost = settings.get('sublimation_cost', costing.DEFAULT_SUBLIMATION_COST)
+        return costing.fabric_cost(self.get_fabric_lines(), sublimation_cost)
         
     def get_total_notion_cost(self):
-        total = 0
-        for sn in self.style_notions:
-            total += float(sn.quantity_required) * sn.notion.cost_per_unit
-        return round(total, 2)
+        return costing.notion_cost(self.get_notion_lines())
    
     def get_total_labor_cost(self):
-        total = 0
-        
-        # Regular labor operations
-        for sl in self.style_labor:
-            labor_op = sl.labor_operation
-            # Skip if labor operation was deleted
-            if not labor_op:
-                continue
-            if labor_op.cost_type == 'flat_rate':
-                total += (labor_op.fixed_cost or 0) * (sl.quantity or 0)
-            elif labor_op.cost_type == 'hourly':
-                total += (labor_op.cost_per_hour or 0) * (sl.time_hours or 0)
-            elif labor_op.cost_type == 'per_piece':
-                total += (labor_op.cost_per_piece or 0) * (sl.quantity or 0)
-        
-        if self.garment_type:
-            cleaning_cost = CleaningCost.query.filter_by(garment_type=self.garment_type).first()
-            if cleaning_cost:
-                total += cleaning_cost.fixed_cost
-        
-        return round(total, 2)
+        return costing.labor_cost(self.get_labor_lines(), self.get_cleaning_cost())
     
     def get_total_cost(self):
         """Calculate total cost - OPTIMIZED (uses cached global settings)"""
         # Get cached settings (only 1 DB query per request, not per style)
         settings = get_cached_global_settings()
+        _, label_cost, shipping_cost = costing.settings_costs(settings)
         
-        # Get settings with defaults
-        label_cost = settings.get('avg_label_cost', 0.20)
-        shipping_cost = settings.get('shipping_cost', 0.00)
-        
-        return (
-            self.get_total_fabric_cost() + 
-            self.get_total_notion_cost() + 
-            self.get_total_labor_cost() + 
-            label_cost + 
+        return costing.total_cost(
+            self.get_total_fabric_cost(),
+            self.get_total_notion_cost(),
+            self.get_total_labor_cost(),
+            label_cost,
             shipping_cost
         )
     
     def get_retail_price(self, size_multiplier=1.0):
-        base_cost = self.get_total_cost() * size_multiplier
-        margin = self.base_margin_percent / 100.0
-        if margin >= 0.99:  # Prevent division by zero or near-zero
-            margin = 0.99
-        return round(base_cost / (1 - margin), 2)
+        return costing.retail_price(self.get_total_cost(), self.base_margin_percent, size_multiplier)
 
 
 # =============================================================================
@@ -443,4 +466,436 @@ class GlobalSetting(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
     
     def __repr__(self):
-        return f'<GlobalSetting {self.setting_key}={self.setting_value}>'
\ No newline at end of file
+        return f'<GlobalSetting {self.setting_key}={self.setting_value}>'
+
+
+# ===== MATERIALIZED COST ROLLUP (one row per style) =====
+class StyleCost(db.Model):
+    """
+    Cached cost totals per style - refreshed by refresh_style_costs()
+    whenever a style's BOM, a master cost or a global setting changes.
+    """
+    __tablename__ = 'style_costs'
+
+    style_id = db.Column(db.Integer, db.ForeignKey('styles.id', ondelete='CASCADE'), primary_key=True)
+    fabric_cost = db.Column(db.Float, nullable=False, default=0.0)
+    notion_cost = db.Column(db.Float, nullable=False, default=0.0)
+    labor_cost = db.Column(db.Float, nullable=False, default=0.0)  # includes cleaning
+    cleaning_cost = db.Column(db.Float, nullable=False, default=0.0)
+    label_cost = db.Column(db.Float, nullable=False, default=0.0)
+    shipping_cost = db.Column(db.Float, nullable=False, default=0.0)
+    total_cost = db.Column(db.Float, nullable=False, default=0.0, index=True)
+    retail_price = db.Column(db.Float)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    skus_built = db.Column(db.Boolean, nullable=False, default=False)  # style_sku_prices rows exist
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    style = db.relationship('Style', backref=db.backref('cost_rollup', uselist=False, passive_deletes=True))
+
+    def __repr__(self):
+        return f'<StyleCost style={self.style_id} total={self.total_cost} v{self.version}>'
+
+
+# ===== PRECOMPUTED SKU PRICES (style x color x size x variable, see sku_prices.py) =====
+class StyleSkuPrice(db.Model):
+    """
+    One SAP export row per SKU with its computed U_PRICE. Rebuilt when a
+    style's colors, variables or size range change; prices alone are
+    rewritten when the style's cost changes.
+    """
+    __tablename__ = 'style_sku_prices'
+
+    id = db.Column(db.Integer, primary_key=True)
+    style_id = db.Column(db.Integer, db.ForeignKey('styles.id', ondelete='CASCADE'), nullable=False)
+    sort_order = db.Column(db.Integer, nullable=False)  # export order within the style
+    color = db.Column(db.String(100), nullable=False)
+    size = db.Column(db.String(20), nullable=False)
+    variable = db.Column(db.String(100), nullable=False, default='')  # '' = no variable
+    is_extended = db.Column(db.Boolean, nullable=False, default=False)
+    optional = db.Column(db.Boolean, nullable=False, default=False)  # blank-variable row only exported on request
+    price = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    __table_args__ = (
+        db.Index('ix_style_sku_prices_style_order', 'style_id', 'sort_order'),
+        db.Index('ix_style_sku_prices_sku', 'style_id', 'color', 'size', 'variable'),
+    )
+
+    def __repr__(self):
+        return f'<StyleSkuPrice style={self.style_id} {self.color}/{self.size}/{self.variable} {self.price}>'
+
+
+# ===== CACHE VERSION STAMPS (cross-process invalidation, see invalidation.py) =====
+class CacheVersion(db.Model):
+    __tablename__ = 'cache_versions'
+
+    cache_name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    last_change = db.Column(db.String(500))  # e.g. "fabrics 42, fabric_vendors 3"
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    def __repr__(self):
+        return f'<CacheVersion {self.cache_name} v{self.version}>'
+
+
+# ===== STYLE CHANGE LOG + EXPORT WATERMARKS (delta exports, see sap_delta.py) =====
+class StyleChangeLog(db.Model):
+    """
+    One row each time a style's SKU prices were rebuilt or repriced - style
+    edits and upstream cost changes alike. The id is the log position.
+    """
+    __tablename__ = 'style_change_log'
+
+    id = db.Column(db.Integer, primary_key=True)
+    style_id = db.Column(db.Integer, nullable=False, index=True)  # no FK - kept after a style is deleted
+    reason = db.Column(db.String(30), nullable=False)  # 'skus_rebuilt', 'repriced'
+    changed_at = db.Column(db.DateTime, default=datetime.now, nullable=False, index=True)
+    txid = db.Column(db.BigInteger, index=True)  # writing transaction (PostgreSQL txid_current()), see sap_delta.py
+
+    def __repr__(self):
+        return f'<StyleChangeLog #{self.id} style={self.style_id} {self.reason}>'
+
+
+class ExportWatermark(db.Model):
+    """Last change log position sent by a delta export stream"""
+    __tablename__ = 'export_watermarks'
+
+    name = db.Column(db.String(50), primary_key=True)  # e.g. 'sap'
+    last_change_id = db.Column(db.Integer, nullable=False, default=0)
+    last_txid = db.Column(db.BigInteger)  # PostgreSQL: oldest transaction still running at the last export
+    style_count = db.Column(db.Integer, nullable=False, default=0)
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    exported_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    exported_at = db.Column(db.DateTime, default=datetime.now)
+
+    def __repr__(self):
+        return f'<ExportWatermark {self.name} @{self.last_change_id}>'
+
+
+# ===== BACKGROUND EXPORT JOBS (see export_jobs.py) =====
+class ExportJob(db.Model):
+    """
+    One SAP export written to disk by a worker thread. The finished file is
+    kept until expires_at so a failed download can be retried.
+    """
+    __tablename__ = 'export_jobs'
+
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    request_hash = db.Column(db.String(64), nullable=False, index=True)  # same selection -> same artifact
+    data_key = db.Column(db.String(64))  # export_cache_key() of the data the file was written from
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    style_ids = db.Column(db.Text, nullable=False)  # JSON list
+    include_empty_vars = db.Column(db.Boolean, nullable=False, default=False)
+    total_styles = db.Column(db.Integer, nullable=False, default=0)
+    processed_styles = db.Column(db.Integer, nullable=False, default=0)
+    row_count = db.Column(db.Integer, nullable=False, default=0)
+    filename = db.Column(db.String(200))
+    file_path = db.Column(db.String(500))
+    file_size = db.Column(db.BigInteger)
+    error = db.Column(db.Text)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    owner = db.Column(db.String(32))  # process whose worker pool holds the job
+    heartbeat_at = db.Column(db.DateTime)  # refreshed by the owner while queued/running
+    created_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    finished_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime, index=True)
+
+    def is_expired(self):
+        return self.expires_at is not None and datetime.now() > self.expires_at
+
+    def to_dict(self):
+        progress = 100 if self.status == 'done' else (
+            int(self.processed_styles * 100 / self.total_styles) if self.total_styles else 0
+        )
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'total_styles': self.total_styles,
+            'processed_styles': self.processed_styles,
+            'progress': progress,
+            'row_count': self.row_count,
+            'filename': self.filename,
+            'file_size': self.file_size,
+            'error': self.error,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None,
+        }
+
+    def __repr__(self):
+        return f'<ExportJob {self.id} {self.status}>'
+
+
+# ===== DASHBOARD SNAPSHOT (see dashboard_rollups.py) =====
+class DashboardRollup(db.Model):
+    """
+    Precomputed dashboard numbers and chart data, one row per snapshot name.
+    Rebuilt by the scheduler; the dashboard pages only read it.
+    """
+    __tablename__ = 'dashboard_rollups'
+
+    name = db.Column(db.String(50), primary_key=True)
+    data = db.Column(db.Text, nullable=False)  # JSON
+    refreshed_at = db.Column(db.DateTime, default=datetime.now, nullable=False)
+    build_ms = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<DashboardRollup {self.name} @{self.refreshed_at}>'
+
+# =============================================================================
+# BULK COSTING - flat queries feeding the costing kernel
+# =============================================================================
+
+COST_COMPONENTS = ('fabric', 'notion', 'labor')
+
+
+def _cost_input_rows(style_ids=None, components=COST_COMPONENTS, fresh=False, session=None):
+    """
+    Flat rows the costing kernel needs for a set of styles (None = all).
+
+    One query per BOM table plus one for styles and cleaning costs - no lazy
+    relationships are touched. BOM tables not named in `components` are
+    skipped (their rows come back empty). `fresh` reads cleaning costs and
+    settings from the session instead of the shared snapshot - write paths
+    need that because their changes are not committed yet. `session`
+    defaults to db.session. Returns (style_rows, fabric_rows, notion_rows,
+    labor_rows, cleaning_map, settings).
+    """
+    session = session or db.session
+
+    def _scoped(query, column):
+        return query.filter(column.in_(style_ids)) if style_ids is not None else query
+
+    style_rows = _scoped(session.query(Style.id, Style.garment_type), Style.id).all()
+
+    fabric_rows = notion_rows = labor_rows = []
+
+    if 'fabric' in components:
+        fabric_rows = _scoped(
+            session.query(
+                StyleFabric.style_id,
+                StyleFabric.yards_required,
+                Fabric.cost_per_yard,
+                StyleFabric.is_sublimation,
+                FabricVendor.f_ship_cost
+            ).join(Fabric, StyleFabric.fabric_id == Fabric.id)
+             .outerjoin(FabricVendor, Fabric.fabric_vendor_id == FabricVendor.id),
+            StyleFabric.style_id
+        ).all()
+
+    if 'notion' in components:
+        notion_rows = _scoped(
+            session.query(
+                StyleNotion.style_id,
+                StyleNotion.quantity_required,
+                Notion.cost_per_unit
+            ).join(Notion, StyleNotion.notion_id == Notion.id),
+            StyleNotion.style_id
+        ).all()
+
+    if 'labor' in components:
+        labor_rows = _scoped(
+            session.query(
+                StyleLabor.style_id,
+                LaborOperation.cost_type,
+                LaborOperation.fixed_cost,
+                LaborOperation.cost_per_hour,
+                LaborOperation.cost_per_piece,
+                StyleLabor.time_hours,
+                StyleLabor.quantity
+            ).join(LaborOperation, StyleLabor.labor_operation_id == LaborOperation.id),
+            StyleLabor.style_id
+        ).all()
+
+    if fresh:
+        cleaning_map, settings = load_cleaning_cost_map(session), load_global_settings(session)
+    else:
+        cleaning_map, settings = get_cleaning_cost_map(), get_cached_global_settings()
+
+    return style_rows, fabric_rows, notion_rows, labor_rows, cleaning_map, settings
+
+
+def load_style_costs(style_ids=None):
+    """
+    Cost many styles at once without touching lazy relationships.
+
+    Returns {style_id: costing.CostBreakdown}. Pass None to cost every style.
+    """
+    if style_ids is not None:
+        style_ids = list(style_ids)
+        if not style_ids:
+            return {}
+
+    style_rows, fabric_rows, notion_rows, labor_rows, cleaning_map, settings = _cost_input_rows(style_ids)
+
+    fabrics_by_style, notions_by_style, labor_by_style = {}, {}, {}
+    for row in fabric_rows:
+        fabrics_by_style.setdefault(row[0], []).append(costing.FabricLine(*row[1:]))
+    for row in notion_rows:
+        notions_by_style.setdefault(row[0], []).append(costing.NotionLine(*row[1:]))
+    for row in labor_rows:
+        labor_by_style.setdefault(row[0], []).append(costing.LaborLine(*row[1:]))
+
+    return {
+        style_id: costing.cost_style(
+            fabrics_by_style.get(style_id, ()),
+            notions_by_style.get(style_id, ()),
+            labor_by_style.get(style_id, ()),
+            cleaning_map.get(garment_type) if garment_type else None,
+            settings
+        )
+        for style_id, garment_type in style_rows
+    }
+
+
+def load_catalog_costs(style_ids=None, components=COST_COMPONENTS, fresh=False, session=None):
+    """
+    Vectorized version of load_style_costs() for list and dashboard views.
+
+    Same flat queries, but the per-line math runs as NumPy group-by sums.
+    Returns a costing.CatalogCosts. Pass None to cost every style; components
+    left out of `components` come back as zeros. See _cost_input_rows() for
+    `fresh` and `session`.
+    """
+    if style_ids is not None:
+        style_ids = list(style_ids)
+    return costing.catalog_costs(*_cost_input_rows(style_ids, components, fresh, session))
+
+
+# =============================================================================
+# STYLE COST ROLLUP - keep style_costs in step with its inputs
+# =============================================================================
+
+def _style_cost_values(catalog, pos, margin_percent):
+    """style_costs column values for the style at `pos` of a CatalogCosts"""
+    total = float(catalog.total[pos])
+    return {
+        'style_id': int(catalog.style_ids[pos]),
+        'fabric_cost': float(catalog.fabric[pos]),
+        'notion_cost': float(catalog.notion[pos]),
+        'labor_cost': float(catalog.labor[pos]),
+        'cleaning_cost': float(catalog.cleaning[pos]),
+        'label_cost': catalog.label,
+        'shipping_cost': catalog.shipping,
+        'total_cost': total,
+        'retail_price': costing.retail_price(total, margin_percent),
+    }
+
+
+def refresh_style_costs(style_ids=None, session=None):
+    """
+    Recompute style_costs rows for the given styles (None = every style).
+
+    Call inside the same transaction as the write that changed a cost input,
+    before commit - queries autoflush pending changes. Versions are bumped on
+    every refresh. `session` defaults to db.session. Returns the number of
+    rows written.
+    """
+    session = session or db.session
+    if style_ids is not None:
+        style_ids = list(set(style_ids))
+        if not style_ids:
+            return 0
+
+    catalog = load_catalog_costs(style_ids, fresh=True, session=session)
+    ids = catalog.style_ids.tolist()
+
+    margin_query = session.query(Style.id, Style.base_margin_percent)
+    version_query = session.query(StyleCost.style_id, StyleCost.version)
+    if style_ids is not None:
+        margin_query = margin_query.filter(Style.id.in_(style_ids))
+        version_query = version_query.filter(StyleCost.style_id.in_(style_ids))
+    margins = dict(margin_query.all())
+    versions = dict(version_query.all())
+
+    now = datetime.now()
+    updates, inserts = [], []
+    for pos, style_id in enumerate(ids):
+        row = _style_cost_values(catalog, pos, margins.get(style_id))
+        row['updated_at'] = now
+        if style_id in versions:
+            row['version'] = versions[style_id] + 1
+            updates.append(row)
+        else:
+            row['version'] = 1
+            inserts.append(row)
+
+    if updates:
+        session.execute(db.update(StyleCost), updates)
+    if inserts:
+        session.execute(db.insert(StyleCost), inserts)
+
+    # Drop rows for styles that no longer exist
+    if style_ids is not None:
+        stale_ids = list(set(style_ids) - set(ids))
+    else:
+        stale_ids = [row[0] for row in session.query(StyleCost.style_id)
+                     .outerjoin(Style, Style.id == StyleCost.style_id)
+                     .filter(Style.id.is_(None)).all()]
+    if stale_ids:
+        session.query(StyleCost).filter(StyleCost.style_id.in_(stale_ids)).delete(synchronize_session=False)
+
+    return len(ids)
+
+
+def missing_style_cost_ids():
+    """Ids of styles that have no style_costs row yet"""
+    return [row[0] for row in db.session.query(Style.id)
+            .outerjoin(StyleCost, StyleCost.style_id == Style.id)
+            .filter(StyleCost.style_id.is_(None)).all()]
+
+
+ENSURE_STYLE_COSTS_ATTEMPTS = 3
+
+
+def ensure_style_costs():
+    """
+    Backfill style_costs rows for styles that have none yet (new table,
+    imports). Safe on read paths: the backfill commits in a session of its
+    own, so the caller's transaction is neither committed nor rolled back.
+    Returns the number of rows this call inserted.
+    """
+    backfilled = 0
+    for _ in range(ENSURE_STYLE_COSTS_ATTEMPTS):
+        missing = missing_style_cost_ids()
+        if not missing:
+            break
+        try:
+            with Session(db.engine) as session, session.begin():
+                backfilled += refresh_style_costs(missing, session=session)
+            break
+        except IntegrityError:
+            # Another request backfilled some of them first - retry the rest
+            continue
+    return backfilled
+
+
+def _transient_style_costs(style_ids):
+    """{style_id: StyleCost} costed on the spot - not added to the session"""
+    catalog = load_catalog_costs(style_ids)
+    margins = dict(db.session.query(Style.id, Style.base_margin_percent)
+                   .filter(Style.id.in_(style_ids)).all())
+    return {int(style_id): StyleCost(version=0, **_style_cost_values(catalog, pos, margins.get(int(style_id))))
+            for pos, style_id in enumerate(catalog.style_ids)}
+
+
+def with_style_costs(query):
+    """
+    Run a Style query outer-joined to style_costs.
+
+    Returns [(style, StyleCost)]. Styles without a rollup row yet are
+    backfilled once and the query re-run; any still missing (created after
+    the backfill read) get an unsaved StyleCost costed on the spot, so
+    callers never see None.
+    """
+    joined = query.add_entity(StyleCost).outerjoin(StyleCost, StyleCost.style_id == Style.id)
+    rows = joined.all()
+    if any(cost is None for _, cost in rows):
+        ensure_style_costs()
+        rows = joined.all()
+    missing = [style.id for style, cost in rows if cost is None]
+    if missing:
+        live = _transient_style_costs(missing)
+        rows = [(style, cost if cost is not None else live[style.id]) for style, cost in rows]
+    return rows
@@ -0,0 +1,189 @@
+# pagination.py - Keyset (cursor) pagination for J.A. Uniforms Pricing Tool
+#
+# OFFSET paging makes the database walk and throw away every row before the
+# requested page, and paginate() adds a COUNT(*) on top, so deep pages get
+# slower as tables grow. Here a page is "the next N rows after this sort key"
+# - an index range scan that costs the same on page 1 and page 2,000.
+#
+# Cursors are opaque URL-safe tokens holding the sort key of the first / last
+# row on the page. NULL sort values order as the largest value (PostgreSQL's
+# default, made explicit so SQLite agrees). Totals are optional and come from
+# the planner's row estimate on PostgreSQL instead of a COUNT(*).
+
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, false, or_, tuple_
+
+from database import db
+
+
+class InvalidCursor(ValueError):
+    """Cursor token is malformed or belongs to a different listing / sort"""
+
+
+# =============================================================================
+# CURSOR TOKENS
+# =============================================================================
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'t': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value['t'])
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    raise ValueError('unsupported cursor value')
+
+
+def encode_cursor(key, scope, backwards=False):
+    """Opaque token for sort key `key` (tuple of column values) within `scope`"""
+    payload = {'s': scope, 'k': [_encode_value(v) for v in key]}
+    if backwards:
+        payload['b'] = 1
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, scope):
+    """(key, backwards) from a token made by encode_cursor. Raises InvalidCursor."""
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw)
+        key = tuple(_decode_value(v) for v in payload['k'])
+        backwards = bool(payload.get('b'))
+        cursor_scope = payload['s']
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise InvalidCursor('Invalid cursor')
+    if cursor_scope != scope:
+        raise InvalidCursor('Cursor belongs to a different listing or sort order')
+    return key, backwards
+
+
+# =============================================================================
+# KEYSET QUERIES
+# =============================================================================
+
+def _greater(column, value, nullable):
+    if value is None:
+        return false()
+    return or_(column > value, column.is_(None)) if nullable else column > value
+
+
+def _less(column, value, nullable):
+    if value is None:
+        return column.isnot(None) if nullable else false()
+    return column < value
+
+
+def _equal(column, value):
+    return column.is_(None) if value is None else column == value
+
+
+def _seek(order, key, backwards):
+    """WHERE clause for rows after `key` in `order` (before it when backwards)"""
+    descending = [desc for _, desc, _ in order]
+    nullable = any(null for _, _, null in order)
+
+    if not nullable and (all(descending) or not any(descending)):
+        # Row-value comparison - a single range scan on a matching composite index
+        columns = tuple_(*[column for column, _, _ in order])
+        if descending[0] != backwards:
+            return columns < tuple_(*key)
+        return columns > tuple_(*key)
+
+    terms = []
+    for i, (column, desc, null) in enumerate(order):
+        step = _less if desc != backwards else _greater
+        prefix = [_equal(c, v) for (c, _, _), v in zip(order[:i], key[:i])]
+        terms.append(and_(*prefix, step(column, key[i], null)))
+    clause = or_(*terms)
+
+    # Range bound on the leading column so the index scan starts at the key
+    column, desc, null = order[0]
+    value = key[0]
+    if value is not None:
+        if desc != backwards:
+            clause = and_(column <= value, clause)
+        elif not null:
+            clause = and_(column >= value, clause)
+    return clause
+
+
+def _order_by(order, backwards):
+    clauses = []
+    for column, desc, null in order:
+        desc = desc != backwards
+        clause = column.desc() if desc else column.asc()
+        if null:
+            clause = clause.nulls_first() if desc else clause.nulls_last()
+        clauses.append(clause)
+    return clauses
+
+
+def keyset_page(query, order, key, scope, cursor=None, limit=50):
+    """
+    One page of `query` in keyset order.
+
+    `order` is [(column, descending, nullable)] ending in a unique column
+    (normally the primary key); `key(row)` returns the row's values for
+    those columns. `scope` names the listing and sort so a cursor can't be
+    replayed against a different one.
+
+    Returns {'rows', 'next_cursor', 'prev_cursor'}; a cursor is None when
+    there is nothing further in that direction.
+    """
+    backwards = False
+    if cursor:
+        cursor_key, backwards = decode_cursor(cursor, scope)
+        if len(cursor_key) != len(order):
+            raise InvalidCursor('Invalid cursor')
+        query = query.filter(_seek(order, cursor_key, backwards))
+
+    rows = query.order_by(None).order_by(*_order_by(order, backwards)).limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if backwards:
+        rows.reverse()
+
+    next_cursor = prev_cursor = None
+    if rows:
+        # Forward: a next page exists if we over-fetched; a previous one if we came from a cursor
+        has_next = (more and not backwards) or (backwards and cursor is not None)
+        has_prev = (more and backwards) or (not backwards and cursor is not None)
+        if has_next:
+            next_cursor = encode_cursor(key(rows[-1]), scope)
+        if has_prev:
+            prev_cursor = encode_cursor(key(rows[0]), scope, backwards=True)
+
+    return {'rows': rows, 'next_cursor': next_cursor, 'prev_cursor': prev_cursor}
+
+
+# =============================================================================
+# TOTALS
+# =============================================================================
+
+def estimate_count(query):
+    """
+    Row count for `query` as (count, exact).
+
+    On PostgreSQL this is the planner's estimate from EXPLAIN - table
+    statistics, no scan. Other databases (SQLite in development) count.
+    """
+    query = query.order_by(None).limit(None).offset(None)
+    session_bind = db.session.get_bind()
+    if session_bind.dialect.name != 'postgresql':
+        return query.count(), True
+
+    compiled = query.statement.compile(dialect=session_bind.dialect)
+    plan = db.session.connection().exec_driver_sql(
+        'EXPLAIN (FORMAT JSON) ' + compiled.string, compiled.params
+    ).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows']), False
@@ -0,0 +1,120 @@
+# parallel_export.py - Multi-process SAP CSV export for J.A. Uniforms Pricing Tool
+#
+# For whole-catalog exports the request thread hands chunks of style ids to a
+# process pool. Each worker opens its own database engine, fetches its chunk
+# from style_sku_prices and formats the CSV text; the request thread yields
+# the fragments in selection order while later chunks are still being built.
+# Only a bounded window of chunks is in flight, so memory stays flat.
+#
+# PostgreSQL only. The request thread holds a REPEATABLE READ transaction
+# open for the whole export and hands its pg_export_snapshot() id to every
+# task; workers import it with SET TRANSACTION SNAPSHOT, so all chunks read
+# the same committed state even while prices are being rebuilt. Workers take
+# the database URL from DATABASE_URL (inherited from the web process) - no
+# credentials travel through the pool's arguments.
+
+import atexit
+import os
+import re
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from multiprocessing import get_context
+
+from sqlalchemy import create_engine, text
+
+from sap_export import EXPORT_BATCH_SIZE, csv_chunk, sap_row
+from sku_prices import sku_export_select
+
+EXPORT_PROCESSES = int(os.environ.get('EXPORT_PROCESSES', os.cpu_count() or 2))
+
+# Styles per task - a multiple of EXPORT_BATCH_SIZE so rows come out in
+# exactly the same order as the single-threaded export
+PARALLEL_CHUNK_STYLES = EXPORT_BATCH_SIZE * 5
+
+# Below this many styles the pool's overhead is not worth it
+PARALLEL_MIN_STYLES = PARALLEL_CHUNK_STYLES * 2
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Worker process state
+_engine = None
+
+
+# =============================================================================
+# WORKER PROCESS
+# =============================================================================
+
+def _init_worker():
+    global _engine
+    _engine = create_engine(os.environ['DATABASE_URL'], pool_pre_ping=True)
+
+
+def _render_chunk(style_ids, include_empty_vars, snapshot):
+    """CSV text for one chunk of styles, read from the exported `snapshot`"""
+    if not re.fullmatch(r'[0-9A-Fa-f-]+', snapshot):
+        raise ValueError(f"Invalid snapshot id: {snapshot!r}")
+    parts = []
+    with _engine.connect() as conn:
+        conn.execution_options(isolation_level='REPEATABLE READ')
+        with conn.begin():
+            # Must be the first statement of the transaction; takes no bind parameters
+            conn.execute(text(f"SET TRANSACTION SNAPSHOT '{snapshot}'"))
+            for i in range(0, len(style_ids), EXPORT_BATCH_SIZE):
+                rows = conn.execute(sku_export_select(style_ids[i:i + EXPORT_BATCH_SIZE], include_empty_vars)).all()
+                parts.append(csv_chunk([sap_row(*row) for row in rows]))
+    return ''.join(parts)
+
+
+# =============================================================================
+# REQUEST SIDE
+# =============================================================================
+
+def parallel_export_supported(engine):
+    """Snapshot export needs PostgreSQL (and DATABASE_URL for the workers)"""
+    return engine.dialect.name == 'postgresql' and bool(os.environ.get('DATABASE_URL'))
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the web process runs threads (waitress, schedulers)
+            _pool = ProcessPoolExecutor(
+                max_workers=EXPORT_PROCESSES,
+                mp_context=get_context('spawn'),
+                initializer=_init_worker
+            )
+            atexit.register(_pool.shutdown, wait=False, cancel_futures=True)
+        return _pool
+
+
+def iter_parallel_sap_csv(style_ids, include_empty_vars, engine):
+    """
+    SAP CSV rows (no header) for the selection as text fragments in
+    selection order, built by the process pool from one snapshot of `engine`
+    (see parallel_export_supported()).
+    """
+    pool = _get_pool()
+    chunks = (style_ids[i:i + PARALLEL_CHUNK_STYLES] for i in range(0, len(style_ids), PARALLEL_CHUNK_STYLES))
+
+    # The exported snapshot stays importable only while this transaction is open
+    with engine.connect() as conn:
+        conn.execution_options(isolation_level='REPEATABLE READ')
+        with conn.begin():
+            snapshot = conn.execute(text('SELECT pg_export_snapshot()')).scalar_one()
+
+            in_flight = deque(pool.submit(_render_chunk, chunk, include_empty_vars, snapshot)
+                              for chunk in islice(chunks, EXPORT_PROCESSES * 2))
+            try:
+                while in_flight:
+                    fragment = in_flight.popleft().result()
+                    for chunk in islice(chunks, 1):
+                        in_flight.append(pool.submit(_render_chunk, chunk, include_empty_vars, snapshot))
+                    yield fragment
+            finally:
+                # Client went away - drop the chunks nobody will read
+                for future in in_flight:
+                    future.cancel()
@@ -0,0 +1,277 @@
+# repricing.py - Where-used index and incremental repricer for J.A. Uniforms Pricing Tool
+#
+# When a master cost changes (fabric, notion, labor operation, cleaning cost,
+# fabric vendor shipping or a global setting) only the styles that use it are
+# repriced, and only the cost component that moved is recomputed. Everything
+# else comes from the style_costs rollup. All writes go out as bulk UPDATEs,
+# and the style_sku_prices rows of repriced styles follow their new totals.
+
+from datetime import datetime
+
+from sqlalchemy import Float, case, literal
+
+import costing
+from database import db
+from models import (
+    Style, StyleFabric, StyleNotion, StyleLabor, StyleColor, StyleVariable, Fabric,
+    CleaningCost, StyleCost, load_catalog_costs, load_global_settings, refresh_style_costs,
+    missing_style_cost_ids
+)
+from sku_prices import reprice_sku_prices
+
+# ===== WHAT A CHANGE TOUCHES =====
+# Rollup components recomputed for each kind of master-data change.
+# Cleaning is part of the labor component (same as Style.get_total_labor_cost).
+COMPONENTS_BY_KIND = {
+    'fabric': ('fabric',),
+    'fabric_vendor': ('fabric',),
+    'notion': ('notion',),
+    'labor_operation': ('labor',),
+    'garment_type': ('labor',),
+}
+
+# Label and shipping are flat per-style constants - no BOM recompute needed,
+# reprice_flat_setting() rewrites totals from the rollup in SQL
+FLAT_SETTING_COLUMNS = {
+    'avg_label_cost': StyleCost.label_cost,
+    'shipping_cost': StyleCost.shipping_cost,
+}
+
+COMPONENTS_BY_SETTING = {
+    'sublimation_cost': ('fabric',),
+    'cleaning_cost_per_minute': ('labor',),
+    'avg_label_cost': (),
+    'shipping_cost': (),
+}
+
+
+# =============================================================================
+# WHERE-USED INDEX (backed by the indexed junction-table foreign keys)
+# =============================================================================
+
+def styles_using(kind, key):
+    """
+    Style ids affected by a change to one piece of master data.
+
+    kind: 'fabric', 'notion', 'labor_operation' (key = id),
+          'fabric_vendor' (key = vendor id),
+          'garment_type' (key = garment type or a collection of them),
+          'setting' (key = global setting key),
+          'size_range' (key = size range name or a collection of them),
+          'color', 'variable' (key = id - SKU rows only, no cost impact)
+    """
+    if kind == 'fabric':
+        query = db.session.query(StyleFabric.style_id).filter(StyleFabric.fabric_id == key)
+    elif kind == 'notion':
+        query = db.session.query(StyleNotion.style_id).filter(StyleNotion.notion_id == key)
+    elif kind == 'labor_operation':
+        query = db.session.query(StyleLabor.style_id).filter(StyleLabor.labor_operation_id == key)
+    elif kind == 'fabric_vendor':
+        query = db.session.query(StyleFabric.style_id).join(
+            Fabric, StyleFabric.fabric_id == Fabric.id
+        ).filter(Fabric.fabric_vendor_id == key)
+    elif kind == 'garment_type':
+        garment_types = [key] if isinstance(key, str) else [gt for gt in key if gt]
+        query = db.session.query(Style.id).filter(Style.garment_type.in_(garment_types))
+    elif kind == 'size_range':
+        names = [key] if isinstance(key, str) else [name for name in key if name]
+        query = db.session.query(Style.id).filter(Style.size_range.in_(names))
+    elif kind == 'color':
+        query = db.session.query(StyleColor.style_id).filter(StyleColor.color_id == key)
+    elif kind == 'variable':
+        query = db.session.query(StyleVariable.style_id).filter(StyleVariable.variable_id == key)
+    elif kind == 'setting':
+        return _styles_using_setting(key)
+    else:
+        raise ValueError(f"Unknown where-used kind: {kind}")
+
+    return [style_id for (style_id,) in query.distinct().all()]
+
+
+def _styles_using_setting(setting_key):
+    if setting_key == 'sublimation_cost':
+        query = db.session.query(StyleFabric.style_id).filter(StyleFabric.is_sublimation == True)
+    elif setting_key == 'cleaning_cost_per_minute':
+        query = db.session.query(Style.id).join(
+            CleaningCost, CleaningCost.garment_type == Style.garment_type
+        )
+    elif setting_key in ('avg_label_cost', 'shipping_cost'):
+        query = db.session.query(Style.id)
+    else:
+        return []
+    return [style_id for (style_id,) in query.distinct().all()]
+
+
+# =============================================================================
+# INCREMENTAL REPRICER
+# =============================================================================
+
+def reprice(kind, key, style_ids=None):
+    """
+    Reprice every style affected by a change to (kind, key).
+
+    Pass `style_ids` when they had to be collected before the change (e.g.
+    before a delete). Call before commit. Returns the number of styles repriced.
+    """
+    if style_ids is None:
+        style_ids = styles_using(kind, key)
+    if kind == 'setting':
+        components = COMPONENTS_BY_SETTING.get(key, ())
+    else:
+        components = COMPONENTS_BY_KIND[kind]
+    return reprice_styles(style_ids, components)
+
+
+def reprice_styles(style_ids, components):
+    """
+    Recompute only `components` for the given styles, rebuild totals from the
+    style_costs rollup and write rollup rows and suggested prices in bulk.
+
+    Styles without a rollup row yet get a full refresh instead.
+    """
+    style_ids = list(set(style_ids))
+    if not style_ids:
+        return 0
+
+    rollups = {row.style_id: row for row in
+               StyleCost.query.filter(StyleCost.style_id.in_(style_ids)).all()}
+    missing = [style_id for style_id in style_ids if style_id not in rollups]
+    if missing:
+        refresh_style_costs(missing)
+
+    known = [style_id for style_id in style_ids if style_id in rollups]
+    if known:
+        catalog = load_catalog_costs(known, components, fresh=True)
+        margins = dict(db.session.query(Style.id, Style.base_margin_percent)
+                       .filter(Style.id.in_(known)).all())
+
+        cost_updates, price_updates = [], []
+        for pos, style_id in enumerate(catalog.style_ids.tolist()):
+            row = rollups[style_id]
+            fabric = float(catalog.fabric[pos]) if 'fabric' in components else row.fabric_cost
+            notion = float(catalog.notion[pos]) if 'notion' in components else row.notion_cost
+            labor = float(catalog.labor[pos]) if 'labor' in components else row.labor_cost
+            cleaning = float(catalog.cleaning[pos]) if 'labor' in components else row.cleaning_cost
+            total = costing.total_cost(fabric, notion, labor, catalog.label, catalog.shipping)
+
+            cost_updates.append({
+                'style_id': style_id,
+                'fabric_cost': fabric,
+                'notion_cost': notion,
+                'labor_cost': labor,
+                'cleaning_cost': cleaning,
+                'label_cost': catalog.label,
+                'shipping_cost': catalog.shipping,
+                'total_cost': total,
+                'retail_price': costing.retail_price(total, margins.get(style_id)),
+                'version': row.version + 1,
+            })
+
+            price = costing.suggested_price(total, margins.get(style_id))
+            if price is not None:
+                price_updates.append({'id': style_id, 'suggested_price': price})
+
+        # Rollup objects are stale after the bulk write
+        for row in rollups.values():
+            db.session.expire(row)
+
+        if cost_updates:
+            db.session.execute(db.update(StyleCost), cost_updates)
+        if price_updates:
+            db.session.execute(db.update(Style), price_updates)
+
+    # Full refresh does not touch suggested_price - reprice those styles too
+    if missing:
+        _reprice_suggested(missing)
+
+    reprice_sku_prices(style_ids)
+    return len(style_ids)
+
+
+def _reprice_suggested(style_ids):
+    """Bulk-write suggested_price for styles whose rollup row is current"""
+    rows = db.session.query(Style.id, Style.base_margin_percent, StyleCost.total_cost).join(
+        StyleCost, StyleCost.style_id == Style.id
+    ).filter(Style.id.in_(style_ids)).all()
+
+    price_updates = []
+    for style_id, margin, total in rows:
+        price = costing.suggested_price(total, margin)
+        if price is not None:
+            price_updates.append({'id': style_id, 'suggested_price': price})
+    if price_updates:
+        db.session.execute(db.update(Style), price_updates)
+
+
+# =============================================================================
+# FLAT PER-STYLE SETTINGS (label, shipping)
+# =============================================================================
+
+def reprice_flat_setting(setting_key, value):
+    """
+    Apply a new label or shipping cost to every style in SQL.
+
+    The setting adds the same constant to every style, so no BOM is
+    recomputed and no rows are loaded into Python: one UPDATE rebuilds the
+    rollup totals from their fabric / notion / labor components (the same
+    float additions as costing.total_cost), one UPDATE recomputes suggested
+    prices and one rewrites SKU prices. Prices round with
+    costing.round_cents_sql(). Call before commit. Returns the number of
+    styles repriced.
+    """
+    settings = load_global_settings()
+    settings[setting_key] = value
+    _, label, shipping = costing.settings_costs(settings)
+    dialect = db.session.get_bind().dialect.name
+
+    # Same rules as costing.retail_price(); SET expressions read the
+    # pre-update row, so the new total is spelled out, not read back
+    total = (StyleCost.fabric_cost + StyleCost.notion_cost + StyleCost.labor_cost
+             + literal(label, Float) + literal(shipping, Float))
+    margin = case(
+        (Style.base_margin_percent.is_(None), costing.DEFAULT_MARGIN_PERCENT / 100.0),
+        else_=Style.base_margin_percent / 100.0
+    )
+    capped_margin = case(
+        (margin >= costing.MAX_RETAIL_MARGIN, costing.MAX_RETAIL_MARGIN),
+        else_=margin
+    )
+    result = db.session.execute(
+        db.update(StyleCost)
+        .where(StyleCost.style_id == Style.id)
+        .values({
+            StyleCost.label_cost: label,
+            StyleCost.shipping_cost: shipping,
+            StyleCost.total_cost: total,
+            StyleCost.retail_price: costing.round_cents_sql(total / (1 - capped_margin), dialect),
+            StyleCost.version: StyleCost.version + 1,
+            StyleCost.updated_at: datetime.now(),
+        })
+        .execution_options(synchronize_session=False)
+    )
+    repriced = result.rowcount
+
+    # Styles without a rollup row get a full refresh (already at the new value)
+    missing = missing_style_cost_ids()
+    if missing:
+        refresh_style_costs(missing)
+
+    # Same rule as costing.suggested_price(): skip styles with no margin or >= 100%
+    db.session.execute(
+        db.update(Style)
+        .where(
+            StyleCost.style_id == Style.id,
+            Style.base_margin_percent.isnot(None),
+            Style.base_margin_percent != 0,
+            Style.base_margin_percent / 100.0 < 1
+        )
+        .values(suggested_price=costing.round_cents_sql(
+            StyleCost.total_cost / (1 - Style.base_margin_percent / 100.0), dialect
+        ))
+        .execution_options(synchronize_session=False)
+    )
+
+    reprice_sku_prices()
+
+    db.session.expire_all()
+    return repriced + len(missing)
@@ -1,7 +1,5 @@
 # run_production.py
 import socket
-from waitress import serve
-from app import app
 
 def get_local_ip():
     """Get the local IP address of this machine"""
@@ -15,6 +13,11 @@ def get_local_ip():
         return "Unable to detect"
 
 if __name__ == '__main__':
+    # Imported here, not at module level: spawned export workers
+    # (parallel_export.py) re-import this module and must not load the app
+    from waitress import serve
+    from app import app
+
     local_ip = get_local_ip()
     
     print("")
@@ -0,0 +1,126 @@
+# sampling.py - Random row samples for J.A. Uniforms Pricing Tool
+#
+# ORDER BY random() LIMIT n reads and sorts the whole table to keep n rows.
+# sample_ids() costs roughly O(n) instead:
+#   - PostgreSQL: TABLESAMPLE SYSTEM reads only a percentage of the table's
+#     pages, sized from the planner's row estimate. SYSTEM returns whole
+#     pages, so every id on them is fetched and the sample is drawn from
+#     those in Python - a LIMIT would keep only the first pages' rows.
+#   - SQLite (and anything else): random ids drawn from the [min, max] id range
+#     are probed through the primary key; gaps are redrawn. Very sparse id
+#     ranges fall back to a reservoir pass over the id index.
+# Pass `seed` to get the same sample back while the table is unchanged.
+
+import random
+
+from sqlalchemy import func, literal, select, tablesample, text
+
+from database import db
+
+# TABLESAMPLE percentage is oversampled by this much so n rows are usually met
+TABLESAMPLE_OVERSAMPLE = 2.0
+
+# Rounds of id-range probing before falling back to a reservoir pass
+ID_RANGE_ROUNDS = 4
+
+PROBE_CHUNK_SIZE = 500
+
+
+def sample_ids(id_column, size, seed=None):
+    """
+    Up to `size` distinct random values of `id_column` (an integer primary
+    key), as a sorted list. Fewer only when the table has fewer rows.
+    """
+    if size <= 0:
+        return []
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return _tablesample_ids(id_column, size, seed)
+    return _id_range_ids(id_column, size, random.Random(seed))
+
+
+# =============================================================================
+# POSTGRESQL
+# =============================================================================
+
+def _estimated_rows(table):
+    rows = db.session.execute(
+        text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:name AS regclass)"),
+        {'name': table.name}
+    ).scalar()
+    return rows if rows and rows > 0 else 0
+
+
+def _tablesample_ids(id_column, size, seed):
+    table = id_column.table
+    estimated = _estimated_rows(table)
+    if estimated <= size:
+        # Small (or never analyzed) table - every row is the sample
+        ids = [row_id for (row_id,) in db.session.execute(select(id_column)).all()]
+        return sorted(random.Random(seed).sample(ids, min(size, len(ids))))
+
+    rng = random.Random(seed)
+    percent = min(100.0, size * 100.0 * TABLESAMPLE_OVERSAMPLE / estimated)
+    while True:
+        sampled = tablesample(table, func.system(percent), seed=literal(seed) if seed is not None else None)
+        # Whole sampled pages, ordered so the seeded draw below is repeatable
+        ids = [row_id for (row_id,) in db.session.execute(
+            select(sampled.c[id_column.key]).order_by(sampled.c[id_column.key])
+        ).all()]
+        # SYSTEM samples whole pages, so a small percentage can come up short
+        if len(ids) >= size or percent >= 100.0:
+            return sorted(rng.sample(ids, min(size, len(ids))))
+        percent = min(100.0, percent * 2)
+
+
+# =============================================================================
+# SQLITE / OTHER
+# =============================================================================
+
+def _existing(id_column, candidates):
+    found = []
+    for i in range(0, len(candidates), PROBE_CHUNK_SIZE):
+        chunk = candidates[i:i + PROBE_CHUNK_SIZE]
+        found.extend(row_id for (row_id,) in db.session.execute(
+            select(id_column).where(id_column.in_(chunk))
+        ).all())
+    return found
+
+
+def _reservoir_ids(id_column, size, rng):
+    """Algorithm R over the id index - one pass, `size` ids kept in memory"""
+    reservoir = []
+    result = db.session.execute(select(id_column).order_by(id_column).execution_options(yield_per=1000))
+    for seen, (row_id,) in enumerate(result):
+        if seen < size:
+            reservoir.append(row_id)
+        else:
+            slot = rng.randint(0, seen)
+            if slot < size:
+                reservoir[slot] = row_id
+    return sorted(reservoir)
+
+
+def _id_range_ids(id_column, size, rng):
+    lo, hi = db.session.execute(select(func.min(id_column), func.max(id_column))).one()
+    if lo is None:
+        return []
+    span = hi - lo + 1
+    if span <= size * 2:
+        # Small or dense range - a single pass is as cheap as probing
+        return _reservoir_ids(id_column, size, rng)
+
+    found, tried = set(), set()
+    for _ in range(ID_RANGE_ROUNDS):
+        need = size - len(found)
+        # Draw extra in proportion to the hit rate so far (gaps from deletes)
+        hit_rate = len(found) / len(tried) if tried else 1.0
+        want = min(span - len(tried), int(need / max(hit_rate, 0.05)) + 1)
+        candidates = [c for c in (lo + offset for offset in rng.sample(range(span), want)) if c not in tried]
+        tried.update(candidates)
+        found.update(_existing(id_column, sorted(candidates)))
+        if len(found) >= size or len(tried) >= span:
+            break
+
+    if len(found) < size and len(tried) < span:
+        return _reservoir_ids(id_column, size, rng)
+    return sorted(rng.sample(sorted(found), min(size, len(found))))
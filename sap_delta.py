@@ -0,0 +1,131 @@
+# sap_delta.py - Delta SAP exports for J.A. Uniforms Pricing Tool
+#
+# Every SKU rebuild or reprice appends the style to style_change_log (see
+# sku_prices.py) - that covers style edits as well as fabric, notion, labor,
+# cleaning and global-setting price changes. A delta export sends only the
+# styles logged after the stream's watermark, then moves the watermark. The
+# first export of a stream is a full one.
+#
+# Log ids are drawn when a row is inserted, not when its transaction
+# commits, so a long transaction (a bulk reprice) can commit ids below ones
+# an export already covered. On PostgreSQL every log row records its
+# transaction (txid_current()) and the watermark also keeps the oldest
+# transaction still running at export time (txid_snapshot_xmin): the next
+# export re-reads every row written by that transaction or a later one, so
+# late commits are always picked up - at worst a style is sent twice.
+# SQLite runs one write transaction at a time, so there ids already follow
+# commit order and the id watermark alone is exact.
+
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, or_, select
+
+from database import db
+from models import Style, StyleChangeLog, ExportWatermark
+
+DEFAULT_WATERMARK = 'sap'
+
+# Log rows already covered by every watermark are pruned after this long
+CHANGE_LOG_RETENTION_DAYS = 30
+
+_WATERMARK_NAME = re.compile(r'^[a-z0-9_-]{1,50}$')
+
+# Position a delta export covers: last log id read, and (PostgreSQL) the
+# oldest transaction still in progress when it was read
+DeltaPosition = namedtuple('DeltaPosition', ['change_id', 'txid'])
+
+
+def valid_watermark_name(name):
+    return bool(name and _WATERMARK_NAME.match(name))
+
+
+def get_watermark(name=DEFAULT_WATERMARK):
+    """The stream's ExportWatermark, or None if it never exported"""
+    return db.session.get(ExportWatermark, name)
+
+
+def _tracks_transactions():
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+
+def current_txid():
+    """The current transaction's id on PostgreSQL, for new log rows - None elsewhere"""
+    if not _tracks_transactions():
+        return None
+    return db.session.execute(select(func.txid_current())).scalar()
+
+
+def _oldest_running_txid():
+    """Every transaction below this id has committed or aborted"""
+    return db.session.execute(select(func.txid_snapshot_xmin(func.txid_current_snapshot()))).scalar()
+
+
+def pending_delta(name=DEFAULT_WATERMARK):
+    """
+    (upto, style_ids, full) for the next delta export of stream `name`.
+
+    style_ids are the existing styles logged after the watermark, in id
+    order; upto is the DeltaPosition the export covers. A stream that
+    never exported gets every style (full=True) - styles predating the log
+    have no entries.
+    """
+    watermark = get_watermark(name)
+    since_id = watermark.last_change_id if watermark else 0
+    since_txid = watermark.last_txid if watermark else None
+
+    # Read the horizon first: anything below it is visible to the reads after it
+    horizon = _oldest_running_txid() if _tracks_transactions() else None
+    upto_id = db.session.query(func.max(StyleChangeLog.id)).filter(StyleChangeLog.id > since_id).scalar()
+    upto = DeltaPosition(upto_id if upto_id is not None else since_id,
+                         horizon if horizon is not None else since_txid)
+
+    if watermark is None:
+        return upto, [style_id for (style_id,) in db.session.query(Style.id).order_by(Style.id).all()], True
+
+    covered = StyleChangeLog.id.between(since_id + 1, upto.change_id)
+    if since_txid is not None:
+        # Transactions still running at the last export may have committed lower ids since
+        covered = or_(covered, StyleChangeLog.txid >= since_txid)
+    style_ids = [style_id for (style_id,) in db.session.query(StyleChangeLog.style_id).join(
+        Style, Style.id == StyleChangeLog.style_id
+    ).filter(covered).distinct().order_by(StyleChangeLog.style_id).all()]
+    return upto, style_ids, False
+
+
+def advance_watermark(name, upto, style_count=0, row_count=0, user_id=None):
+    """Move the stream's watermark forward to DeltaPosition `upto` (never backwards). Caller commits."""
+    watermark = get_watermark(name)
+    if watermark is None:
+        watermark = ExportWatermark(name=name, last_change_id=0)
+        db.session.add(watermark)
+    if upto.change_id < watermark.last_change_id:
+        return watermark
+    watermark.last_change_id = upto.change_id
+    if upto.txid is not None and (watermark.last_txid is None or upto.txid > watermark.last_txid):
+        watermark.last_txid = upto.txid
+    watermark.style_count = style_count
+    watermark.row_count = row_count
+    watermark.exported_by = user_id
+    watermark.exported_at = datetime.now()
+    return watermark
+
+
+def prune_change_log():
+    """
+    Delete log rows every watermark has moved past and that are older than
+    CHANGE_LOG_RETENTION_DAYS (any row that old when no stream exists yet).
+    Caller commits. Returns the number of rows deleted.
+    """
+    cutoff = datetime.now() - timedelta(days=CHANGE_LOG_RETENTION_DAYS)
+    query = StyleChangeLog.query.filter(StyleChangeLog.changed_at < cutoff)
+    covered, covered_txid = db.session.query(
+        func.min(ExportWatermark.last_change_id), func.min(ExportWatermark.last_txid)
+    ).one()
+    if covered is not None:
+        query = query.filter(StyleChangeLog.id <= covered)
+    if covered_txid is not None:
+        # Still re-read by the stream that is furthest behind
+        query = query.filter(or_(StyleChangeLog.txid.is_(None), StyleChangeLog.txid < covered_txid))
+    return query.delete(synchronize_session=False)
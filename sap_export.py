@@ -0,0 +1,109 @@
+# sap_export.py - SAP B1 bulk export pipeline for J.A. Uniforms Pricing Tool
+#
+# Two stages: a prefetch stage turns each batch of selected styles into plain
+# ExportStyle tuples with a fixed number of queries (styles + cost rollup,
+# then one selectinload round per relationship), and a row stage expands each
+# ExportStyle into SKU lines using the compiled size ladders. The row stage
+# never touches the session. The expansion is stored per SKU in
+# style_sku_prices (see sku_prices.py), which bulk exports stream from.
+
+import csv
+from collections import namedtuple
+from io import StringIO
+
+from sqlalchemy.orm import selectinload
+
+from models import Style, StyleColor, StyleVariable, with_style_costs
+from size_ranges import get_size_ladder
+
+SAP_HEADERS = ['Code', 'Name', 'U_COLOR', 'U_SIZE', 'U_VARIABLE',
+               'U_PRICE', 'U_SHIP_COST', 'U_STYLE', 'U_CardCode', 'U_PROD_NAME']
+
+EXPORT_BATCH_SIZE = 100
+VENDOR_CODE = 'V999'
+
+# Everything the row stage needs for one style
+ExportStyle = namedtuple('ExportStyle', [
+    'id', 'vendor_style', 'style_name', 'size_range', 'shipping_cost',
+    'total_cost', 'colors', 'variables'
+])
+
+# One color x size x variable of a style. `optional` marks the blank-variable
+# line that is only exported when include_empty_vars is set.
+SkuLine = namedtuple('SkuLine', ['color', 'size', 'variable', 'price', 'is_extended', 'optional'])
+
+
+# =============================================================================
+# PREFETCH STAGE
+# =============================================================================
+
+def load_export_batch(style_ids):
+    """
+    ExportStyle tuples for one batch - three queries whatever the batch holds:
+    styles joined to their cost rollup, then colors and variables (each with
+    its master row) via selectinload.
+    """
+    # populate_existing: styles already in the session (a save in progress)
+    # get their just-flushed colors/variables, not a stale loaded collection
+    query = Style.query.filter(Style.id.in_(style_ids)).options(
+        selectinload(Style.colors).joinedload(StyleColor.color),
+        selectinload(Style.style_variables).joinedload(StyleVariable.variable)
+    ).execution_options(populate_existing=True)
+    batch = []
+    for style, cost in with_style_costs(query):
+        batch.append(ExportStyle(
+            id=style.id,
+            vendor_style=style.vendor_style,
+            style_name=style.style_name,
+            size_range=style.size_range,
+            shipping_cost=style.shipping_cost if hasattr(style, 'shipping_cost') else 0.00,
+            total_cost=cost.total_cost,
+            colors=tuple(sc.color.name.upper() for sc in style.colors),
+            variables=tuple(sv.variable.name.upper() for sv in style.style_variables)
+        ))
+    return batch
+
+
+# =============================================================================
+# ROW STAGE
+# =============================================================================
+
+def expand_skus(export_style):
+    """
+    SkuLines for one style in export order: every color x size, once per
+    non-DEFAULT variable, then a blank-variable line. The blank line is
+    required when the style has DEFAULT or no other variables, optional
+    otherwise.
+    """
+    ladder = get_size_ladder(export_style.size_range)
+    if ladder is None:
+        return
+
+    variables = [v for v in export_style.variables if v != 'DEFAULT']
+    has_default = 'DEFAULT' in export_style.variables
+    blank_optional = not (has_default or not variables)
+
+    size_prices = [(size, price, size in ladder.extended_set)
+                   for size, price in ladder.price_ladder(export_style.total_cost)]
+    for color in export_style.colors:
+        for size, price, is_extended in size_prices:
+            for variable in variables:
+                yield SkuLine(color, size, variable, price, is_extended, False)
+            yield SkuLine(color, size, '', price, is_extended, blank_optional)
+
+
+def sap_row(vendor_style, style_name, shipping_cost, color, size, variable, price):
+    """One SAP B1 CSV row in SAP_HEADERS order"""
+    return ['', '', color, size, variable, price, shipping_cost,
+            vendor_style.replace('-', ''), VENDOR_CODE, style_name]
+
+
+def csv_chunk(rows):
+    """CSV text for a list of rows"""
+    buffer = StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+# SAP B1 import files start with the header row twice
+SAP_HEADER_CHUNK = csv_chunk([SAP_HEADERS, SAP_HEADERS])
@@ -0,0 +1,184 @@
+# size_ranges.py - Size range parsing and compiled size ladders for J.A. Uniforms Pricing Tool
+#
+# A size range is stored as strings ('XS-XL, 2XL-6XL'). Exports need the
+# expanded, ordered size list and an "is this size extended?" check for every
+# size of every color of every style, so each range is compiled once into a
+# SizeLadder and cached by size range id and master-data version.
+
+import threading
+
+from master_data import get_master_data
+
+DEFAULT_EXTENDED_MARKUP_PERCENT = 15.0
+
+
+# ===== Extended-size + Range helpers (robust) =====
+
+def _normalize_size_token(tok: str) -> str:
+    """Normalize a size label to compare safely, e.g. '3x' -> '3XL'."""
+    if tok is None:
+        return ''
+    s = tok.strip().upper().replace(' ', '')
+    # Treat '3X' as '3XL'
+    if s.endswith('X') and not s.endswith('XL'):
+        s = s + 'L'
+    return s
+
+_ALPHA_LADDER = ["XXS","XS","S","M","L","XL","2XL","3XL","4XL","5XL","6XL"]
+
+def _expand_alpha_range(a: str, b: str):
+    A = _normalize_size_token(a); B = _normalize_size_token(b)
+    try:
+        ia, ib = _ALPHA_LADDER.index(A), _ALPHA_LADDER.index(B)
+    except ValueError:
+        return [A, B] if A != B else [A]
+    return _ALPHA_LADDER[ia:ib+1] if ia <= ib else list(reversed(_ALPHA_LADDER[ib:ia+1]))
+
+def _expand_numeric_range(a: str, b: str):
+    """Expand numeric ranges with step=2."""
+    sa, sb = a.strip(), b.strip()
+    try:
+        ia, ib = int(sa), int(sb)
+    except ValueError:
+        return [_normalize_size_token(a), _normalize_size_token(b)]
+
+    if sa == "00":
+        start, end = (ia, ib) if ia <= ib else (ib, ia)
+        tail = [str(n) for n in range(0, end + 1, 2)]
+        return ["00"] + tail
+
+    width = max(len(sa), len(sb))
+    step = 2
+    if ia <= ib:
+        seq = range(ia, ib + 1, step)
+    else:
+        seq = range(ia, ib - 1, -step)
+
+    return [str(n).zfill(width) for n in seq]
+
+
+def _expand_mixed_token(token: str):
+    t = token.strip()
+    if not t:
+        return []
+    if '-' in t:
+        left, right = [x.strip() for x in t.split('-', 1)]
+        if any(c.isalpha() for c in left+right):
+            return _expand_alpha_range(left, right)
+        return _expand_numeric_range(left, right)
+    s = _normalize_size_token(t)
+    return [s] if s else []
+
+def expand_sizes_string(s: str):
+    """'XS-XL, 2XL-6XL' or '00-18, 20-30' -> flat list of sizes."""
+    if not s:
+        return []
+    out = []
+    for part in s.split(','):
+        out.extend(_expand_mixed_token(part))
+    # de-dup preserving order
+    seen, flat = set(), []
+    for x in out:
+        if x not in seen:
+            seen.add(x); flat.append(x)
+    return flat
+
+def is_extended_size_for_range(size_label: str, size_range_obj) -> bool:
+    """True if size_label is inside size_range_obj.extended_sizes (supports ranges)."""
+    if size_range_obj is None:
+        return False
+    ext_list = expand_sizes_string(getattr(size_range_obj, 'extended_sizes', '') or '')
+    if not ext_list:
+        return False
+    return _normalize_size_token(size_label) in ext_list
+
+
+# =============================================================================
+# COMPILED SIZE LADDERS
+# =============================================================================
+
+class SizeLadder:
+    """
+    One size range compiled for pricing: ordered sizes, a frozenset of the
+    extended ones and the extended-size price multiplier.
+    """
+
+    __slots__ = ('id', 'name', 'version', 'regular_sizes', 'extended_sizes',
+                 'sizes', 'size_set', 'extended_set', 'multiplier')
+
+    def __init__(self, size_range, version):
+        self.id = size_range.id
+        self.name = size_range.name
+        self.version = version
+        self.regular_sizes = tuple(expand_sizes_string(size_range.regular_sizes or ''))
+        self.extended_sizes = tuple(expand_sizes_string(size_range.extended_sizes or ''))
+        # Same order the exports always used: regular, then extended not already listed
+        regular = set(self.regular_sizes)
+        self.sizes = self.regular_sizes + tuple(s for s in self.extended_sizes if s not in regular)
+        self.size_set = frozenset(self.sizes)
+        self.extended_set = frozenset(self.extended_sizes)
+
+        markup = size_range.extended_markup_percent
+        if markup is None:
+            markup = DEFAULT_EXTENDED_MARKUP_PERCENT
+        self.multiplier = 1.0 + (float(markup) / 100.0)
+
+    def is_extended(self, size_label):
+        """O(1) version of is_extended_size_for_range()"""
+        return _normalize_size_token(size_label) in self.extended_set
+
+    def price_for(self, base_cost, size_label):
+        """(size, price) for one size label ('3x' -> '3XL'), or None if the range has no such size"""
+        size = _normalize_size_token(size_label)
+        if size not in self.size_set:
+            return None
+        if size in self.extended_set:
+            return size, round(base_cost * self.multiplier, 2)
+        return size, round(base_cost, 2)
+
+    def price_ladder(self, base_cost):
+        """[(size, price)] in export order - extended sizes get the markup"""
+        regular_price = round(base_cost, 2)
+        extended_price = round(base_cost * self.multiplier, 2)
+        return [(size, extended_price if size in self.extended_set else regular_price)
+                for size in self.sizes]
+
+
+_ladders_lock = threading.Lock()
+_ladders = {}  # size range id -> SizeLadder
+
+
+def get_size_ladder(name):
+    """
+    Compiled ladder for a size range name, or None if no such range exists.
+
+    Rows come from the shared master-data snapshot; a ladder is reused while
+    its version matches the snapshot's, so any committed size range change
+    (api_size_range_modify, or another process via the invalidation bus)
+    recompiles it on next use.
+    """
+    if not name:
+        return None
+    master = get_master_data()
+    size_range = master.size_ranges_by_name.get(name)
+    if size_range is None:
+        return None
+
+    # Uncommitted size range edits in this session: compile, don't share
+    if master.private:
+        return SizeLadder(size_range, master.version)
+
+    ladder = _ladders.get(size_range.id)
+    if ladder is None or ladder.version != master.version:
+        ladder = SizeLadder(size_range, master.version)
+        with _ladders_lock:
+            current = _ladders.get(size_range.id)
+            if current is None or current.version < ladder.version:
+                _ladders[size_range.id] = ladder
+    return ladder
+
+
+def discard_size_ladder(size_range_id):
+    """Drop a compiled ladder right away (it would be rebuilt on next use anyway)"""
+    with _ladders_lock:
+        _ladders.pop(size_range_id, None)
@@ -0,0 +1,412 @@
+# sku_prices.py - Precomputed SKU price matrix for J.A. Uniforms Pricing Tool
+#
+# style_sku_prices holds every SAP export row (style x color x size x
+# variable) with its U_PRICE. Rows are rebuilt per style when its colors,
+# variables or size range change; when only the style's cost moves, prices
+# are rewritten in place (a style has just two prices - regular and
+# extended). Bulk exports then stream the table instead of expanding and
+# pricing every SKU in Python. High-volume price lookups are answered from an
+# in-memory index (one entry per style) that is refreshed for exactly the
+# styles whose SKU rows were rewritten. Every rewrite is also appended to
+# style_change_log, which delta exports read (see sap_delta.py).
+
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import BigInteger, case, event, func, literal, select
+from sqlalchemy.orm import Session
+
+import invalidation
+from database import db
+from models import (
+    Style, StyleCost, StyleSkuPrice, StyleColor, StyleVariable, Color, Variable,
+    SizeRange, StyleChangeLog, ensure_style_costs
+)
+from costing import round_cents_sql
+from sap_export import EXPORT_BATCH_SIZE, load_export_batch, expand_skus, sap_row
+from sap_delta import current_txid
+from size_ranges import DEFAULT_EXTENDED_MARKUP_PERCENT, get_size_ladder
+
+
+# =============================================================================
+# MAINTENANCE
+# =============================================================================
+
+def rebuild_sku_prices(style_ids, log_changes=True):
+    """
+    Replace the SKU rows of the given styles. Call before commit, after the
+    style's colors/variables/size range (and its style_costs row) are
+    written. log_changes=False for backfills, which change no prices.
+    Returns the number of SKU rows written.
+    """
+    style_ids = list(set(style_ids))
+    _note_changed(style_ids)
+    written = 0
+    now = datetime.now()
+    for i in range(0, len(style_ids), EXPORT_BATCH_SIZE):
+        chunk = style_ids[i:i + EXPORT_BATCH_SIZE]
+        batch = load_export_batch(chunk)
+
+        db.session.execute(
+            db.delete(StyleSkuPrice).where(StyleSkuPrice.style_id.in_(chunk))
+            .execution_options(synchronize_session=False)
+        )
+
+        rows = []
+        for export_style in batch:
+            for sort_order, line in enumerate(expand_skus(export_style)):
+                rows.append({
+                    'style_id': export_style.id,
+                    'sort_order': sort_order,
+                    'color': line.color,
+                    'size': line.size,
+                    'variable': line.variable,
+                    'is_extended': line.is_extended,
+                    'optional': line.optional,
+                    'price': line.price,
+                    'updated_at': now,
+                })
+        if rows:
+            db.session.execute(db.insert(StyleSkuPrice), rows)
+            written += len(rows)
+
+        if batch:
+            built_ids = [export_style.id for export_style in batch]
+            db.session.execute(
+                db.update(StyleCost)
+                .where(StyleCost.style_id.in_(built_ids))
+                .values(skus_built=True)
+                .execution_options(synchronize_session=False)
+            )
+            if log_changes:
+                _log_changes(built_ids, 'skus_rebuilt', now)
+    return written
+
+
+def reprice_sku_prices(style_ids=None):
+    """
+    Rewrite SKU prices from the current style_costs totals (None = every
+    style) in one UPDATE. Call before commit, after the rollup rows were
+    updated. Returns the number of styles repriced.
+    """
+    if style_ids is not None:
+        style_ids = list(set(style_ids))
+        if not style_ids:
+            return 0
+    _note_changed(style_ids)
+
+    # Same prices as SizeLadder.price_ladder(), rounded with the SQL twin of
+    # its round(x, 2) (see costing.py)
+    multiplier = func.coalesce(
+        select(1.0 + func.coalesce(SizeRange.extended_markup_percent, DEFAULT_EXTENDED_MARKUP_PERCENT) / 100.0)
+        .where(SizeRange.name == Style.size_range)
+        .correlate(Style)
+        .scalar_subquery(),
+        1.0
+    )
+    base = case((StyleSkuPrice.is_extended, StyleCost.total_cost * multiplier), else_=StyleCost.total_cost)
+    now = datetime.now()
+    statement = (
+        db.update(StyleSkuPrice)
+        .where(
+            StyleSkuPrice.style_id == StyleCost.style_id,
+            Style.id == StyleCost.style_id,
+            StyleCost.skus_built == True
+        )
+        .values(price=round_cents_sql(base, db.session.get_bind().dialect.name), updated_at=now)
+        .execution_options(synchronize_session=False)
+    )
+    built = db.session.query(StyleCost.style_id).filter(StyleCost.skus_built == True)
+    if style_ids is not None:
+        statement = statement.where(StyleSkuPrice.style_id.in_(style_ids))
+        built = built.filter(StyleCost.style_id.in_(style_ids))
+        repriced_ids = [style_id for (style_id,) in built.all()]
+        if not repriced_ids:
+            return 0
+    db.session.execute(statement)
+
+    if style_ids is None:
+        _log_changes(None, 'repriced', now)
+        return built.count()
+    _log_changes(repriced_ids, 'repriced', now)
+    return len(repriced_ids)
+
+
+def ensure_sku_prices(style_ids=None):
+    """Build SKU rows for styles that have none yet (new table, backfills). Returns styles built."""
+    query = db.session.query(Style.id).outerjoin(StyleCost, StyleCost.style_id == Style.id).filter(
+        db.or_(StyleCost.style_id.is_(None), StyleCost.skus_built == False)
+    )
+    if style_ids is not None:
+        query = query.filter(Style.id.in_(style_ids))
+    missing = [style_id for (style_id,) in query.all()]
+    if missing:
+        rebuild_sku_prices(missing, log_changes=False)
+    return len(missing)
+
+
+def _log_changes(style_ids, reason, now):
+    """Append to style_change_log (None = every style with SKU rows, in one INSERT ... SELECT)"""
+    if style_ids is not None and not style_ids:
+        return
+    txid = current_txid()
+    if style_ids is None:
+        db.session.execute(db.insert(StyleChangeLog).from_select(
+            ['style_id', 'reason', 'changed_at', 'txid'],
+            select(StyleCost.style_id, literal(reason), literal(now), literal(txid, BigInteger))
+            .where(StyleCost.skus_built == True)
+        ))
+    else:
+        db.session.execute(db.insert(StyleChangeLog), [
+            {'style_id': style_id, 'reason': reason, 'changed_at': now, 'txid': txid} for style_id in style_ids
+        ])
+
+
+# =============================================================================
+# READS
+# =============================================================================
+
+def sku_export_select(style_ids, include_empty_vars=False):
+    """
+    SELECT of the sap_row() arguments for one batch of styles - an indexed
+    scan of style_sku_prices joined to the style's export columns. Plain
+    Core, so export worker processes can run it on their own connection.
+    """
+    stmt = select(
+        Style.vendor_style, Style.style_name, Style.shipping_cost,
+        StyleSkuPrice.color, StyleSkuPrice.size, StyleSkuPrice.variable, StyleSkuPrice.price
+    ).select_from(StyleSkuPrice).join(
+        Style, Style.id == StyleSkuPrice.style_id
+    ).where(
+        StyleSkuPrice.style_id.in_(style_ids)
+    )
+    if not include_empty_vars:
+        stmt = stmt.where(StyleSkuPrice.optional == False)
+    return stmt.order_by(StyleSkuPrice.style_id, StyleSkuPrice.sort_order)
+
+
+def iter_sku_export_batches(style_ids, include_empty_vars=False, batch_size=EXPORT_BATCH_SIZE):
+    """SAP CSV rows for the selection, one list per batch of styles"""
+    for i in range(0, len(style_ids), batch_size):
+        rows = db.session.execute(sku_export_select(style_ids[i:i + batch_size], include_empty_vars)).all()
+        yield [sap_row(*row) for row in rows]
+
+
+def iter_sku_cost_batches(style_ids, include_empty_vars=False, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Same SKUs as iter_sku_export_batches() with the style's cost components
+    attached - rows of SKU_COST_COLUMNS, one list per batch of styles.
+    """
+    for i in range(0, len(style_ids), batch_size):
+        query = db.session.query(
+            Style.vendor_style, Style.style_name, Style.gender, Style.garment_type, Style.size_range,
+            StyleSkuPrice.color, StyleSkuPrice.size, StyleSkuPrice.variable, StyleSkuPrice.is_extended,
+            StyleSkuPrice.price, Style.shipping_cost,
+            StyleCost.fabric_cost, StyleCost.notion_cost, StyleCost.labor_cost, StyleCost.cleaning_cost,
+            StyleCost.label_cost, StyleCost.shipping_cost, StyleCost.total_cost
+        ).join(
+            Style, Style.id == StyleSkuPrice.style_id
+        ).join(
+            StyleCost, StyleCost.style_id == StyleSkuPrice.style_id
+        ).filter(
+            StyleSkuPrice.style_id.in_(style_ids[i:i + batch_size])
+        )
+        if not include_empty_vars:
+            query = query.filter(StyleSkuPrice.optional == False)
+        query = query.order_by(StyleSkuPrice.style_id, StyleSkuPrice.sort_order)
+
+        yield query.all()
+
+
+SKU_COST_COLUMNS = [
+    'vendor_style', 'style_name', 'gender', 'garment_type', 'size_range',
+    'color', 'size', 'variable', 'is_extended', 'price', 'u_ship_cost',
+    'fabric_cost', 'notion_cost', 'labor_cost', 'cleaning_cost',
+    'label_cost', 'shipping_cost', 'total_cost'
+]
+
+
+# =============================================================================
+# IN-MEMORY PRICE INDEX (batch SKU lookups)
+# =============================================================================
+
+# Everything needed to price any SKU of one style. Sizes and the extended
+# markup come from the compiled ladder at lookup time, so size range edits
+# need no index refresh.
+SkuPriceEntry = namedtuple('SkuPriceEntry', [
+    'style_id', 'vendor_style', 'size_range', 'total_cost', 'colors', 'variables'
+])
+
+SkuPrice = namedtuple('SkuPrice', ['vendor_style', 'color', 'size', 'variable', 'price'])
+
+_index_lock = threading.Lock()
+_index = {
+    'entries': None,     # vendor_style -> SkuPriceEntry
+    'stale_ids': set(),  # styles to reload before the next lookup
+    'all_stale': True,
+}
+
+
+def _load_index_entries(style_ids=None):
+    """SkuPriceEntry per style - three queries for any number of styles"""
+    def scoped(query, column):
+        return query.filter(column.in_(style_ids)) if style_ids is not None else query
+
+    colors, variables = {}, {}
+    for style_id, name in scoped(
+            db.session.query(StyleColor.style_id, Color.name).join(Color, Color.id == StyleColor.color_id),
+            StyleColor.style_id).all():
+        colors.setdefault(style_id, set()).add(name.upper())
+    for style_id, name in scoped(
+            db.session.query(StyleVariable.style_id, Variable.name).join(Variable, Variable.id == StyleVariable.variable_id),
+            StyleVariable.style_id).all():
+        if name.upper() != 'DEFAULT':
+            variables.setdefault(style_id, set()).add(name.upper())
+
+    styles = scoped(
+        db.session.query(Style.id, Style.vendor_style, Style.size_range, StyleCost.total_cost)
+        .outerjoin(StyleCost, StyleCost.style_id == Style.id),
+        Style.id
+    ).all()
+
+    return [
+        SkuPriceEntry(style_id, vendor_style, size_range, total_cost,
+                      frozenset(colors.get(style_id, ())), frozenset(variables.get(style_id, ())))
+        for style_id, vendor_style, size_range, total_cost in styles
+        if vendor_style and total_cost is not None
+    ]
+
+
+def _current_index():
+    """The index, after reloading whatever was marked stale"""
+    with _index_lock:
+        entries = _index['entries']
+        full = _index['all_stale'] or entries is None
+        stale_ids = _index['stale_ids']
+        _index['all_stale'] = False
+        _index['stale_ids'] = set()
+
+    if not full and not stale_ids:
+        return entries
+
+    try:
+        if full:
+            ensure_style_costs()
+            new_entries = {entry.vendor_style: entry for entry in _load_index_entries()}
+        else:
+            # Copy-on-write so concurrent readers keep a consistent dict
+            new_entries = {vs: entry for vs, entry in entries.items() if entry.style_id not in stale_ids}
+            for entry in _load_index_entries(list(stale_ids)):
+                new_entries[entry.vendor_style] = entry
+    except Exception:
+        mark_sku_index_stale(None if full else stale_ids)
+        raise
+
+    with _index_lock:
+        _index['entries'] = new_entries
+    return new_entries
+
+
+def mark_sku_index_stale(style_ids=None):
+    """Reload these styles (None = everything) before the next lookup"""
+    with _index_lock:
+        if style_ids is None:
+            _index['all_stale'] = True
+        else:
+            _index['stale_ids'].update(style_ids)
+
+
+def lookup_sku_prices(keys):
+    """
+    Price many SKUs from the in-memory index - O(1) per key.
+
+    keys: iterable of (vendor_style, color, size, variable). Size labels are
+    normalized like the size ranges ('3x' -> '3XL'); a blank or DEFAULT
+    variable means no variable. Returns a list aligned with `keys` holding a
+    SkuPrice, or None when the style, color, size or variable does not exist.
+    """
+    entries = _current_index()
+    results = []
+    for vendor_style, color, size, variable in keys:
+        entry = entries.get((vendor_style or '').strip())
+        ladder = get_size_ladder(entry.size_range) if entry else None
+        if ladder is None:
+            results.append(None)
+            continue
+
+        color = (color or '').strip().upper()
+        variable = (variable or '').strip().upper()
+        if variable == 'DEFAULT':
+            variable = ''
+        priced = ladder.price_for(entry.total_cost, size or '')
+        if priced is None or color not in entry.colors or (variable and variable not in entry.variables):
+            results.append(None)
+            continue
+
+        results.append(SkuPrice(entry.vendor_style, color, priced[0], variable, priced[1]))
+    return results
+
+
+# ===== INDEX INVALIDATION =====
+# Every write that changes a SKU price goes through rebuild_sku_prices() or
+# reprice_sku_prices(), which note the style ids on the session; so do style
+# deletes and new style_costs rows. On commit those styles are reloaded here
+# and announced to the other processes.
+
+def _note_changed(style_ids):
+    session = db.session()
+    if style_ids is None:
+        session.info['sku_index_all'] = True
+    else:
+        session.info.setdefault('sku_index_changes', set()).update(style_ids)
+
+
+@event.listens_for(Session, 'after_flush')
+def _note_deleted_styles(session, flush_context):
+    deleted = [obj.id for obj in session.deleted if isinstance(obj, Style)]
+    if deleted:
+        session.info.setdefault('sku_index_changes', set()).update(deleted)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _note_new_style_costs(orm_execute_state):
+    # A style enters the index once it has a style_costs row. Backfills
+    # (ensure_style_costs) insert those rows without any SKU rewrite.
+    mapper = orm_execute_state.bind_mapper
+    if not orm_execute_state.is_insert or mapper is None or mapper.class_ is not StyleCost:
+        return
+    params = orm_execute_state.parameters
+    rows = params if isinstance(params, (list, tuple)) else [params or {}]
+    style_ids = {row['style_id'] for row in rows if 'style_id' in row}
+    if style_ids:
+        orm_execute_state.session.info.setdefault('sku_index_changes', set()).update(style_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _refresh_index_on_commit(session):
+    everything = session.info.pop('sku_index_all', False)
+    changed = session.info.pop('sku_index_changes', None)
+    if everything:
+        mark_sku_index_stale()
+        invalidation.publish('sku_prices', [])
+    elif changed:
+        mark_sku_index_stale(changed)
+        invalidation.publish('sku_prices', [('styles', style_id) for style_id in sorted(changed)])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_index_changes(session):
+    session.info.pop('sku_index_all', None)
+    session.info.pop('sku_index_changes', None)
+
+
+def _on_remote_change(changes):
+    """Another process rewrote SKU prices - reload those styles (or all)"""
+    if changes:
+        mark_sku_index_stale([row_id for table, row_id in changes if table == 'styles'])
+    else:
+        mark_sku_index_stale()
+
+
+invalidation.subscribe('sku_prices', _on_remote_change)
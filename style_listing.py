@@ -0,0 +1,198 @@
+# style_listing.py - Server-side style listing for J.A. Uniforms Pricing Tool
+#
+# The All Styles page asks for one page at a time: filters, sort and paging
+# run in the database against indexed columns of styles / style_costs, and
+# only plain columns are read (no ORM objects, no colour / variable joins).
+# Pages are keyset cursors (see pagination.py), so a page costs the same
+# whether the catalog has 500 styles or 100k and however deep it is.
+
+from datetime import datetime, timedelta
+
+from database import db
+from models import Style, StyleClient, StyleCost, ensure_style_costs
+from pagination import estimate_count, keyset_page
+
+LISTING_PER_PAGE_OPTIONS = (25, 50, 100, 200)
+LISTING_DEFAULT_PER_PAGE = 50
+
+# Sort key -> column. Every sort is tie-broken on styles.id so pages are stable.
+LISTING_SORT_COLUMNS = {
+    'vendor_style': Style.vendor_style,
+    'style_name': Style.style_name,
+    'gender': Style.gender,
+    'garment_type': Style.garment_type,
+    'size_range': Style.size_range,
+    'cost': StyleCost.total_cost,
+    'margin': Style.base_margin_percent,
+    'suggested_price': Style.suggested_price,
+    'updated_at': Style.updated_at,
+    'created_at': Style.created_at,
+}
+LISTING_DEFAULT_SORT = ('updated_at', 'desc')
+
+# Sort keys whose column is never NULL (the rest may be unset or, for cost,
+# missing from the outer join)
+LISTING_NOT_NULL_SORTS = ('vendor_style', 'style_name')
+
+# Rows shown when base_margin_percent is unset
+DEFAULT_MARGIN_PERCENT = 60.0
+
+
+def _float_arg(args, name):
+    value = args.get(name, '')
+    try:
+        return float(value) if value != '' else None
+    except (TypeError, ValueError):
+        return None
+
+
+def listing_filters(args):
+    """
+    Filters from request args. `search` is left to the caller, which owns
+    the LIKE sanitising (see sanitize_search_query in app.py).
+    """
+    filters = {}
+    for name in ('gender', 'garment_type', 'size_range'):
+        value = (args.get(name) or '').strip()
+        if value:
+            filters[name] = value
+
+    favorite = (args.get('favorite') or '').lower()
+    if favorite in ('1', 'true', 'yes'):
+        filters['favorite'] = True
+    elif favorite in ('0', 'false', 'no'):
+        filters['favorite'] = False
+
+    client_id = args.get('client_id', type=int)
+    if client_id:
+        filters['client_id'] = client_id
+
+    for name in ('min_cost', 'max_cost', 'min_margin', 'max_margin'):
+        value = _float_arg(args, name)
+        if value is not None:
+            filters[name] = value
+
+    updated_within = args.get('updated_within_days', type=int)
+    if updated_within is not None and updated_within >= 0:
+        filters['updated_within_days'] = updated_within
+
+    return filters
+
+
+def _apply_filters(query, filters):
+    if 'gender' in filters:
+        query = query.filter(Style.gender == filters['gender'])
+    if 'garment_type' in filters:
+        query = query.filter(Style.garment_type == filters['garment_type'])
+    if 'size_range' in filters:
+        query = query.filter(Style.size_range == filters['size_range'])
+    if 'favorite' in filters:
+        query = query.filter(Style.is_favorite == filters['favorite'])
+    if 'client_id' in filters:
+        query = query.filter(db.session.query(StyleClient.id).filter(
+            StyleClient.style_id == Style.id,
+            StyleClient.client_id == filters['client_id']
+        ).exists())
+    if 'min_cost' in filters:
+        query = query.filter(StyleCost.total_cost >= filters['min_cost'])
+    if 'max_cost' in filters:
+        query = query.filter(StyleCost.total_cost <= filters['max_cost'])
+    if 'min_margin' in filters:
+        query = query.filter(Style.base_margin_percent >= filters['min_margin'])
+    if 'max_margin' in filters:
+        # Upper bound is exclusive: high = 65+, low = under 50
+        query = query.filter(Style.base_margin_percent < filters['max_margin'])
+    if 'updated_within_days' in filters:
+        # 0 = today, 7 = this week (calendar days, like the old client filter)
+        since = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        query = query.filter(Style.updated_at >= since - timedelta(days=filters['updated_within_days']))
+    if filters.get('search'):
+        pattern = filters['search']
+        query = query.filter(db.or_(
+            Style.vendor_style.ilike(pattern, escape='\\'),
+            Style.style_name.ilike(pattern, escape='\\')
+        ))
+    return query
+
+
+def _base_query():
+    return db.session.query(
+        Style.id, Style.vendor_style, Style.style_name, Style.gender, Style.garment_type,
+        Style.size_range, Style.base_margin_percent, Style.suggested_price,
+        Style.is_active, Style.is_favorite, Style.created_at, Style.updated_at,
+        StyleCost.total_cost
+    ).outerjoin(StyleCost, StyleCost.style_id == Style.id)
+
+
+def _row_dict(row):
+    (style_id, vendor_style, style_name, gender, garment_type, size_range, margin,
+     suggested_price, is_active, is_favorite, created_at, updated_at, total_cost) = row
+    return {
+        'id': style_id,
+        'vendor_style': vendor_style,
+        'style_name': style_name,
+        'gender': gender,
+        'garment_type': garment_type,
+        'size_range': size_range,
+        'margin': margin if margin else DEFAULT_MARGIN_PERCENT,
+        'suggested_price': suggested_price,
+        'total_cost': round(total_cost or 0, 2),
+        'is_active': bool(is_active),
+        'is_favorite': bool(is_favorite),
+        'created_at': created_at,
+        'updated_at': updated_at,
+    }
+
+
+def list_styles(cursor=None, per_page=LISTING_DEFAULT_PER_PAGE, sort=None, direction=None, filters=None,
+                with_total=True):
+    """
+    One page of the style listing.
+
+    Returns {'styles': [dict], 'next_cursor', 'prev_cursor', 'per_page',
+    'sort', 'dir'} plus 'total' / 'total_exact' when `with_total` (an
+    estimate on PostgreSQL, see estimate_count). Unknown sort keys fall back
+    to most recently updated first. Raises InvalidCursor for a bad cursor.
+    """
+    filters = filters or {}
+    if per_page not in LISTING_PER_PAGE_OPTIONS:
+        per_page = LISTING_DEFAULT_PER_PAGE
+    if sort not in LISTING_SORT_COLUMNS:
+        sort, direction = LISTING_DEFAULT_SORT
+    direction = 'asc' if direction == 'asc' else 'desc'
+
+    column = LISTING_SORT_COLUMNS[sort]
+    descending = direction == 'desc'
+    order = [(column, descending, sort not in LISTING_NOT_NULL_SORTS), (Style.id, descending, False)]
+
+    def fetch():
+        return keyset_page(
+            _apply_filters(_base_query(), filters),
+            order,
+            key=lambda row: (getattr(row, column.key), row.id),
+            scope=f'styles:{sort}:{direction}',
+            cursor=cursor,
+            limit=per_page
+        )
+
+    page = fetch()
+    if any(row.total_cost is None for row in page['rows']):
+        # Styles without a cost rollup yet (imports) - backfill once and re-read
+        ensure_style_costs()
+        page = fetch()
+
+    result = {
+        'styles': [_row_dict(row) for row in page['rows']],
+        'next_cursor': page['next_cursor'],
+        'prev_cursor': page['prev_cursor'],
+        'per_page': per_page,
+        'sort': sort,
+        'dir': direction,
+    }
+    if with_total:
+        # The count only needs style_costs when a cost filter is active
+        count_query = db.session.query(Style.id)
+        if 'min_cost' in filters or 'max_cost' in filters:
+            count_query = count_query.join(StyleCost, StyleCost.style_id == Style.id)
+        result['total'], result['total_exact'] = estimate_count(_apply_filters(count_query, filters))
+    return result